@@ -49,6 +49,9 @@ setup(name='pyramid_twitcher',
       extras_require={
           "dev": dev_reqs,              # pip install ".[dev]"
           "postgres": ["psycopg2"],     # when using postgres database driver with sqlalchemy
+          "dns": ["dnspython>=2"],      # when using the 'dnspython' resolver of the DNS cache
+          "bcrypt": ["bcrypt"],         # when using bcrypt password hashes
+          "argon2": ["argon2-cffi"],    # when using argon2 password hashes
       },
       entry_points="""\
       [paste.app_factory]
@@ -56,5 +59,6 @@ setup(name='pyramid_twitcher',
       [console_scripts]
       twitcherctl=twitcher.scripts.twitcherctl:main
       initialize_twitcher_db=twitcher.scripts.initialize_db:main
+      purge_twitcher_tokens=twitcher.scripts.purge_tokens:main
       """,
       )
@@ -53,6 +53,10 @@ class TestAdapterWithHooks(FunctionalTest):
             'auth': 'token',
             'public': False,
             'verify': True,
+            'offload': False,
+            'chunk_size': None,
+            'endpoints': [],
+            'routes': [],
             'purl': 'http://myservice/wps'}
         resp = self.reg.register_service(**self.test_service)
         assert resp == self.test_service
@@ -23,3 +23,28 @@ class APITest(FunctionalTest):
         assert resp.status_code == 200
         assert resp.content_type == 'application/json'
         assert resp is True
+
+
+class APIBasicAuthTest(FunctionalTest):
+    @property
+    def settings(self):
+        from twitcher.passwords import hash_password
+
+        settings = super(APIBasicAuthTest, self).settings.copy()
+        settings.update({'twitcher.users': 'admin:{}'.format(hash_password('secret'))})
+        return settings
+
+    def setUp(self):
+        super(APIBasicAuthTest, self).setUp()
+        self.init_database()
+        self.config.include('twitcher.api')
+        self.config.scan('twitcher.api')
+        self.app = self.get_test_app()
+
+    def test_hashed_password(self):
+        self.app.authorization = ('Basic', ('admin', 'secret'))
+        assert self.app.get('/metrics').status_code == 200
+        self.app.authorization = ('Basic', ('testuser', 'testpassword'))
+        assert self.app.get('/metrics').status_code == 200
+        self.app.authorization = ('Basic', ('admin', 'testpassword'))
+        assert self.app.get('/metrics', expect_errors=True).status_code in (401, 403)
@@ -1,5 +1,18 @@
+import datetime
+import json
+import os
+import tempfile
+from unittest import mock
+
+import transaction
+
 from .base import FunctionalTest
 
+from twitcher import models
+from twitcher.oauth2 import OAUTH2_VALIDATOR, RandomTokenValidator
+from twitcher.passwords import PasswordVerifier, is_hashed, verify_password
+from twitcher.tokenstore import TOKEN_BUFFER
+
 
 def compute_view(request):
     if request.verify_request(scopes=["compute"]) is True:
@@ -34,3 +47,109 @@ class OAuth2AppTests(FunctionalTest):
         assert resp.status_code == 200
         assert resp.content_type == 'application/json'
         resp.mustcontain('success')
+
+    def authenticate(self, validator, client_id, client_secret):
+        request = mock.Mock(dbsession=self.session, client_id=client_id, client_secret=client_secret)
+        return validator.authenticate_client(request)
+
+    def test_register_client(self):
+        self.app.authorization = ('Basic', ('testuser', 'testpassword'))
+        resp = self.app.post('/oauth/client', params={'name': 'demo'})
+        client = json.loads(resp.text)
+        stored = self.session.query(models.Client).filter_by(client_id=client['client_id']).one()
+        assert is_hashed(stored.client_secret)
+        assert client['client_secret'] not in stored.client_secret
+        validator = RandomTokenValidator()
+        assert self.authenticate(validator, client['client_id'], client['client_secret']) is True
+        assert self.authenticate(validator, client['client_id'], 'wrong') is False
+        assert self.authenticate(validator, 'unknown', client['client_secret']) is False
+
+    def test_client_secret_verification_cached(self):
+        validator = RandomTokenValidator()
+        validator.secret_verifier = PasswordVerifier(cache_ttl=60)
+        with mock.patch('twitcher.passwords.verify_password', wraps=verify_password) as verify:
+            assert self.authenticate(validator, 'dev', 'dev') is True
+            assert self.authenticate(validator, 'dev', 'dev') is True
+            assert self.authenticate(validator, 'dev', 'wrong') is False
+        assert verify.call_count == 2
+
+
+class TokenReuseTests(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(TokenReuseTests, self).settings.copy()
+        settings.update({
+            'twitcher.token.type': 'random_token',
+            'twitcher.token.reuse': 'true',
+            'twitcher.token.reuse_min_lifetime': '600',
+        })
+        return settings
+
+    def setUp(self):
+        super(TokenReuseTests, self).setUp()
+        self.init_database()
+        self.config.include('twitcher.oauth2')
+        self.app = self.get_test_app()
+
+    def get_token(self, scope='compute'):
+        resp = self.app.get('/oauth/token', params={
+            'grant_type': 'client_credentials', 'client_id': 'dev', 'client_secret': 'dev', 'scope': scope})
+        return json.loads(resp.text)
+
+    def test_token_reused(self):
+        first = self.get_token()
+        assert first['expires_in'] == 3600
+        second = self.get_token()
+        assert second['access_token'] == first['access_token']
+        assert 3590 < second['expires_in'] <= 3600
+        assert self.session.query(models.Token).count() == 1
+
+    def test_token_not_reused_near_expiry(self):
+        first = self.get_token()
+        tok = self.session.query(models.Token).one()
+        tok.expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=300)
+        second = self.get_token()
+        assert second['access_token'] != first['access_token']
+        assert second['expires_in'] == 3600
+        assert self.get_token()['access_token'] == second['access_token']
+
+
+class TokenBufferTests(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(TokenBufferTests, self).settings.copy()
+        settings.update({
+            # shared with the thread writing the tokens
+            'sqlalchemy.url': 'sqlite:///{}'.format(os.path.join(self.tmpdir.name, 'twitcher.sqlite')),
+            'twitcher.token.type': 'random_token',
+            'twitcher.token_buffer': 'true',
+            'twitcher.token_buffer.flush_ms': '60000',
+        })
+        return settings
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        super(TokenBufferTests, self).setUp()
+        self.init_database()
+        transaction.commit()
+        self.config.include('twitcher.oauth2')
+        self.app = self.get_test_app()
+        self.buffer = self.config.registry[TOKEN_BUFFER]
+
+    def tearDown(self):
+        self.buffer.close()
+        super(TokenBufferTests, self).tearDown()
+        self.engine.dispose()
+        self.buffer.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_token_buffered(self):
+        access_token = self.create_token()
+        assert self.session.query(models.Token).count() == 0
+        validator = self.config.registry[OAUTH2_VALIDATOR]
+        request = mock.Mock(dbsession=self.session)
+        assert validator.validate_bearer_token(access_token, ['compute'], request) is True
+        assert request.client.client_id == 'dev'
+        assert self.buffer.flush() == 1
+        assert self.session.query(models.Token).filter_by(access_token=access_token).count() == 1
+        assert validator.validate_bearer_token(access_token, ['compute'], request) is True
@@ -0,0 +1,119 @@
+import time
+from unittest import mock
+
+import jwt
+import pytest
+
+from .base import FunctionalTest
+
+from twitcher.introspection import OAUTH2_INTROSPECTION
+
+
+def custom_token(**claims):
+    claims.setdefault('client_id', 'dev')
+    claims.setdefault('scope', 'compute')
+    claims.setdefault('exp', int(time.time()) + 3600)
+    return jwt.encode(claims, 'testsecret', algorithm='HS256')
+
+
+class IntrospectionTest(FunctionalTest):
+
+    def setUp(self):
+        super(IntrospectionTest, self).setUp()
+        self.init_database()
+        self.config.include('twitcher.oauth2')
+        self.app = self.get_test_app()
+        self.app.authorization = ('Basic', ('dev', 'dev'))
+        self.introspection = self.config.registry[OAUTH2_INTROSPECTION]
+
+    def introspect(self, token, **kwargs):
+        return self.app.post('/oauth/introspect', params={'token': token}, **kwargs)
+
+    def test_active_token(self):
+        exp = int(time.time()) + 120
+        resp = self.introspect(custom_token(exp=exp))
+        assert resp.json == {'active': True, 'client_id': 'dev', 'scope': 'compute', 'token_type': 'Bearer',
+                             'exp': exp}
+        max_age = resp.cache_control.max_age
+        assert resp.cache_control.private
+        assert 110 < max_age <= 120
+
+    def test_inactive_token(self):
+        assert self.introspect('invalid').json == {'active': False}
+        assert self.introspect(custom_token(exp=int(time.time()) - 10)).json == {'active': False}
+        assert self.introspect(jwt.encode({'client_id': 'dev'}, 'other', algorithm='HS256')).json == {'active': False}
+
+    def test_client_authentication(self):
+        token = custom_token()
+        self.app.authorization = None
+        assert self.introspect(token, expect_errors=True).status_code == 401
+        self.app.authorization = ('Basic', ('dev', 'wrong'))
+        resp = self.introspect(token, expect_errors=True)
+        assert resp.status_code == 401
+        assert resp.headers['WWW-Authenticate'].startswith('Basic')
+        self.app.authorization = None
+        resp = self.app.post('/oauth/introspect', params={'token': token, 'client_id': 'dev', 'client_secret': 'dev'})
+        assert resp.json['active'] is True
+
+    def test_missing_token(self):
+        assert self.app.post('/oauth/introspect', expect_errors=True).status_code == 400
+
+    def test_cached_per_token(self):
+        first, second = custom_token(), custom_token(ref='other')
+        with mock.patch.object(self.introspection, 'validate', wraps=self.introspection.validate) as validate:
+            self.introspect(first)
+            self.introspect(first)
+            self.introspect(second)
+        assert validate.call_count == 2
+
+    def test_validation_error_not_cached(self):
+        token = custom_token()
+        validator = self.introspection.validator
+        with mock.patch.object(validator, 'validate_bearer_token', side_effect=RuntimeError("database unavailable")):
+            resp = self.introspect(token, expect_errors=True)
+        assert resp.status_code == 503
+        assert resp.headers['Cache-Control'] == 'no-store'
+        assert self.introspect(token).json['active'] is True
+
+    def test_inactive_stored_token_not_cached(self):
+        # random tokens could be pending in the buffer of another worker
+        self.introspection.stored_tokens = True
+        with mock.patch.object(self.introspection, 'validate', wraps=self.introspection.validate) as validate:
+            resp = self.introspect('unknown')
+            assert resp.json == {'active': False}
+            assert resp.headers['Cache-Control'] == 'no-store'
+            self.introspect('unknown')
+        assert validate.call_count == 2
+
+    def test_no_cache(self):
+        self.introspection.cache.ttl = 0
+        resp = self.introspect(custom_token())
+        assert resp.json['active'] is True
+        assert resp.headers['Cache-Control'] == 'no-store'
+
+    @pytest.mark.slow
+    def test_introspection_benchmark(self):
+        """
+        Throughput of the endpoint with a warm cache, compared with the validation of each token.
+        """
+        tokens = [custom_token(ref=str(i)) for i in range(100)]
+        request = mock.Mock(dbsession=self.session)
+
+        def throughput():
+            start = time.perf_counter()
+            for i in range(10000):
+                self.introspection.introspect(request, tokens[i % 100])
+            return 10000 / (time.perf_counter() - start)
+
+        throughput()
+        warm = throughput()
+        self.introspection.cache.ttl = 0
+        self.introspection.cache.clear()
+        cold = throughput()
+        self.introspection.cache.ttl = 300
+        start = time.perf_counter()
+        for i in range(1000):
+            self.introspect(tokens[i % 100])
+        endpoint = 1000 / (time.perf_counter() - start)
+        print("introspection: {:.0f}/s cached, {:.0f}/s validated, endpoint {:.0f}/s".format(warm, cold, endpoint))
+        assert warm > cold
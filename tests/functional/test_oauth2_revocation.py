@@ -0,0 +1,223 @@
+import os
+import tempfile
+from unittest import mock
+
+import transaction
+import webtest
+from pyramid.config import Configurator
+
+from ..common import dummy_request
+from .base import FunctionalTest
+from .test_oauth2_introspection import custom_token
+
+from twitcher import models
+from twitcher.oauth2 import OAUTH2_VALIDATOR
+from twitcher.owsverify import OWS_VERIFY_CACHE
+from twitcher.store import ServiceStore
+from twitcher.tokenstore import TOKEN_BUFFER
+
+
+class RevocationTestBase(FunctionalTest):
+    token_type = None
+
+    @property
+    def settings(self):
+        settings = super(RevocationTestBase, self).settings.copy()
+        settings.update({
+            # shared with the revocation list of the worker
+            'sqlalchemy.url': 'sqlite:///{}'.format(os.path.join(self.tmpdir.name, 'twitcher.sqlite')),
+            'twitcher.token.type': self.token_type,
+        })
+        return settings
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        super(RevocationTestBase, self).setUp()
+        self.init_database()
+        self.session.add(models.Client(client_id='other', client_secret='other'))
+        transaction.commit()
+        self.config.include('twitcher.oauth2')
+        self.app = self.get_test_app()
+        self.app.authorization = ('Basic', ('dev', 'dev'))
+
+    def tearDown(self):
+        super(RevocationTestBase, self).tearDown()
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def introspect(self, token, app=None):
+        return (app or self.app).post('/oauth/introspect', params={'token': token}).json
+
+    def other_worker(self):
+        """
+        Application with its own registry, like another worker process sharing the database.
+        """
+        config = Configurator(settings=self.settings)
+        config.include('twitcher.models')
+        config.include('twitcher.oauth2')
+        app = webtest.TestApp(config.make_wsgi_app(), extra_environ={'db.session': self.session, 'tm.active': True})
+        app.authorization = ('Basic', ('dev', 'dev'))
+        return app, config.registry
+
+    def revoke(self, token, **kwargs):
+        return self.app.post('/oauth/revoke', params={'token': token}, **kwargs)
+
+    def auth(self, token, app=None):
+        """
+        Status of the cached access verification of a secured service with the token.
+        """
+        return (app or self.app).get('/ows/auth/wps_secured?service=wps&request=execute&version=1.0.0',
+                                     headers={'Authorization': 'Bearer {}'.format(token)},
+                                     expect_errors=True).status_code
+
+    def include_owsproxy(self):
+        ServiceStore(dummy_request(dbsession=self.session)).save_service(
+            name="wps_secured", url="http://localhost:5000/wps", auth='token')
+        transaction.commit()
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+        self.app.authorization = ('Basic', ('dev', 'dev'))
+
+
+class RevocationTest(RevocationTestBase):
+    token_type = 'custom_token'
+
+    def test_revoke(self):
+        token = custom_token(ref='a')
+        assert self.introspect(token)['active'] is True
+        assert self.revoke(token).status_code == 200
+        transaction.commit()
+        assert self.introspect(token) == {'active': False}
+        assert self.session.query(models.RevokedToken).filter_by(jti='a').count() == 1
+        # already revoked
+        assert self.revoke(token).status_code == 200
+        assert self.introspect(custom_token(ref='b'))['active'] is True
+
+    def test_revoked_by_other_worker(self):
+        token = custom_token(ref='a')
+        other, registry = self.other_worker()
+        registry[OAUTH2_VALIDATOR].revocation.refresh_interval = 0
+        assert self.introspect(token, app=other)['active'] is True
+        assert self.revoke(token).status_code == 200
+        transaction.commit()
+        # cached result of the other worker is checked against its refreshed revocations
+        assert self.introspect(token, app=other) == {'active': False}
+
+    def test_revoke_cached_decision(self):
+        self.include_owsproxy()
+        token = custom_token(ref='a')
+        assert self.auth(token) == 200
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 1
+        assert self.revoke(token).status_code == 200
+        transaction.commit()
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 0
+        assert self.auth(token) == 403
+
+    def test_revoked_cached_decision(self):
+        self.include_owsproxy()
+        token = custom_token(ref='a')
+        assert self.auth(token) == 200
+        # revoked by another worker, and only noticed with the refreshed revocations
+        other, _ = self.other_worker()
+        self.config.registry[OAUTH2_VALIDATOR].revocation.refresh_interval = 0
+        assert other.post('/oauth/revoke', params={'token': token}).status_code == 200
+        transaction.commit()
+        assert self.auth(token) == 403
+
+    def test_revoke_token_of_other_client(self):
+        token = custom_token(ref='a', client_id='other')
+        assert self.revoke(token, expect_errors=True).status_code == 403
+        assert self.introspect(token)['active'] is True
+        self.app.authorization = ('Basic', ('other', 'other'))
+        assert self.revoke(token).status_code == 200
+
+    def test_revoke_error(self):
+        token = custom_token(ref='a')
+        validator = self.config.registry[OAUTH2_VALIDATOR]
+        with mock.patch.object(validator, 'validate_bearer_token', side_effect=RuntimeError("database unavailable")):
+            assert self.revoke(token, expect_errors=True).status_code == 503
+        assert self.introspect(token)['active'] is True
+
+    def test_revoke_requires_client(self):
+        self.app.authorization = None
+        assert self.revoke(custom_token(), expect_errors=True).status_code == 401
+        self.app.authorization = ('Basic', ('dev', 'dev'))
+        assert self.app.post('/oauth/revoke', expect_errors=True).status_code == 400
+        assert self.revoke('invalid').status_code == 200
+
+
+class RandomTokenRevocationTest(RevocationTestBase):
+    token_type = 'random_token'
+
+    def test_revoke(self):
+        resp = self.app.get('/oauth/token', params={
+            'grant_type': 'client_credentials', 'client_id': 'dev', 'client_secret': 'dev'})
+        token = resp.json['access_token']
+        transaction.commit()
+        assert self.introspect(token)['active'] is True
+        assert self.revoke(token).status_code == 200
+        transaction.commit()
+        assert self.session.query(models.Token).count() == 0
+        assert self.introspect(token) == {'active': False}
+
+    def test_revoked_by_other_worker(self):
+        resp = self.app.get('/oauth/token', params={
+            'grant_type': 'client_credentials', 'client_id': 'dev', 'client_secret': 'dev'})
+        token = resp.json['access_token']
+        transaction.commit()
+        other, registry = self.other_worker()
+        resp = other.post('/oauth/introspect', params={'token': token})
+        assert resp.json['active'] is True
+        # deleted tokens are cached by other workers no longer than revocations of JWT tokens
+        assert resp.cache_control.max_age <= registry[OAUTH2_VALIDATOR].revocation.refresh_interval
+
+    def test_revoke_cached_decision(self):
+        self.include_owsproxy()
+        resp = self.app.get('/oauth/token', params={
+            'grant_type': 'client_credentials', 'client_id': 'dev', 'client_secret': 'dev'})
+        token = resp.json['access_token']
+        transaction.commit()
+        assert self.auth(token) == 200
+        assert self.revoke(token).status_code == 200
+        transaction.commit()
+        assert self.auth(token) == 403
+
+
+class BufferedTokenRevocationTest(RevocationTestBase):
+    token_type = 'random_token'
+
+    @property
+    def settings(self):
+        settings = super(BufferedTokenRevocationTest, self).settings.copy()
+        settings.update({'twitcher.token_buffer': 'true', 'twitcher.token_buffer.flush_ms': '100'})
+        return settings
+
+    def tearDown(self):
+        for registry in (self.config.registry, self.other_registry):
+            registry[TOKEN_BUFFER].close()
+            registry[TOKEN_BUFFER].engine.dispose()
+        super(BufferedTokenRevocationTest, self).tearDown()
+
+    def test_revoke_token_buffered_by_other_worker(self):
+        other, self.other_registry = self.other_worker()
+        resp = other.get('/oauth/token', params={
+            'grant_type': 'client_credentials', 'client_id': 'dev', 'client_secret': 'dev'})
+        token = resp.json['access_token']
+        assert self.other_registry[TOKEN_BUFFER].get(token) is not None
+        # validated again once written by the other worker
+        assert self.revoke(token).status_code == 200
+        transaction.commit()
+        assert self.session.query(models.Token).count() == 0
+        assert self.introspect(token, app=other) == {'active': False}
+
+    def test_revoke_unknown_token_wait(self):
+        _, self.other_registry = self.other_worker()
+        with mock.patch('twitcher.revocation.time.sleep') as sleep:
+            # tokens which cannot have been issued are not waited for
+            assert self.revoke('invalid').status_code == 200
+            assert not sleep.called
+            assert self.revoke('a' * 30).status_code == 200
+            sleep.assert_called_once_with(0.2)
+            self.config.registry[TOKEN_BUFFER].flush_ms = 60000
+            assert self.revoke('b' * 30).status_code == 200
+            sleep.assert_called_with(1.0)
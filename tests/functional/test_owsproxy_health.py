@@ -0,0 +1,39 @@
+"""
+Testing the fast-fail of OWS proxy requests to services known to be down.
+"""
+import time
+
+import mock
+
+from twitcher.healthcheck import HEALTH_DOWN, OWS_HEALTH_CHECKER
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from .base import FunctionalTest
+
+
+class OWSProxyHealthTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSProxyHealthTest, self).settings.copy()
+        settings.update({'twitcher.health': 'true'})
+        return settings
+
+    def setUp(self):
+        super(OWSProxyHealthTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wps_down", url="http://localhost:5000/wps", auth='public')
+
+        self.config.include('twitcher.owsproxy')
+        self.checker = self.config.registry[OWS_HEALTH_CHECKER]
+        self.checker.start = lambda: None  # no background probes during tests
+        self.app = self.get_test_app()
+
+    def test_service_down_fast_fail(self):
+        self.checker._health['wps_down'] = {'name': 'wps_down', 'status': HEALTH_DOWN, 'checked_at': time.time()}
+        with mock.patch("requests.request") as mocked_request:
+            resp = self.app.get('/ows/proxy/wps_down?service=wps&request=getcapabilities', expect_errors=True)
+            assert not mocked_request.called
+        assert resp.status_code == 503
+        resp.mustcontain('ServiceUnavailable')
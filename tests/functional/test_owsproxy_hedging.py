@@ -0,0 +1,84 @@
+"""
+Testing the hedging of OWS proxy requests to slow services.
+"""
+import threading
+
+import mock
+
+from twitcher.hedging import OWS_PROXY_HEDGER
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from .base import FunctionalTest
+
+
+class OWSProxyHedgingTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSProxyHedgingTest, self).settings.copy()
+        settings.update({'twitcher.ows_proxy_hedging': 'true'})
+        return settings
+
+    def setUp(self):
+        super(OWSProxyHedgingTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wms_hedged", url="http://slow:8080/wms", type="wms", auth='public',
+                                   endpoints=["http://fast:8080/wms"])
+        service_store.save_service(name="wps_hedged", url="http://slow:5000/wps", type="wps", auth='public',
+                                   endpoints=["http://fast:5000/wps"])
+
+        self.config.include('twitcher.owsproxy')
+        self.hedger = self.config.registry[OWS_PROXY_HEDGER]
+        self.hedger.min_samples = 1
+        self.hedger.record('wms_hedged', 0.01)
+        self.app = self.get_test_app()
+
+    def test_slow_endpoint_hedged(self):
+        release = threading.Event()
+
+        def upstream(method, url, **kwargs):
+            if url.startswith("http://slow"):
+                release.wait(5)
+            resp = mock.MagicMock(status_code=200, headers={'Content-Type': 'image/png'})
+            resp.iter_content.return_value = iter([url.encode()])
+            return resp
+
+        with mock.patch("requests.request", side_effect=upstream), \
+                mock.patch("twitcher.owsproxy.select_endpoint", return_value="http://slow:8080/wms"):
+            resp = self.app.get('/ows/proxy/wms_hedged?service=wms&request=getmap&version=1.3.0')
+        release.set()
+        assert resp.status_code == 200
+        assert resp.body.startswith(b"http://fast:8080/wms")
+        assert self.hedger.hedged_total == 1
+
+    def wps_upstream(self, release, streams):
+        def upstream(method, url, **kwargs):
+            streams.append(kwargs['stream'])
+            if url.startswith("http://slow"):
+                release.wait(1)
+            return mock.MagicMock(status_code=200, ok=True, headers={'Content-Type': 'application/json'},
+                                  content=url.encode(), text=url)
+        return upstream
+
+    def test_wps_describeprocess_hedged(self):
+        release, streams = threading.Event(), []
+        self.hedger.record('wps_hedged', 0.01)
+        with mock.patch("requests.request", side_effect=self.wps_upstream(release, streams)), \
+                mock.patch("twitcher.owsproxy.select_endpoint", return_value="http://slow:5000/wps"):
+            resp = self.app.get('/ows/proxy/wps_hedged?service=wps&request=describeprocess&version=1.0.0')
+        release.set()
+        assert resp.body.startswith(b"http://fast:5000/wps")
+        # latencies are measured up to the response headers, without the download of the body
+        assert streams == [True, True]
+        assert self.hedger.hedged_total == 1
+
+    def test_wps_execute_not_hedged(self):
+        release, streams = threading.Event(), []
+        self.hedger.record('wps_hedged', 0.01)
+        with mock.patch("requests.request", side_effect=self.wps_upstream(release, streams)), \
+                mock.patch("twitcher.owsproxy.select_endpoint", return_value="http://slow:5000/wps"):
+            resp = self.app.get('/ows/proxy/wps_hedged?service=wps&request=execute&version=1.0.0&identifier=hello')
+        assert resp.body.startswith(b"http://slow:5000/wps")
+        assert streams == [False]
+        assert self.hedger.hedged_total == 0
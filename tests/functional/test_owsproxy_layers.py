@@ -0,0 +1,106 @@
+"""
+Testing the per-layer access policy of WMS services.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from twitcher.capabilities import WMS_CAPABILITIES_CACHE
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from ..test_capabilities import CAPS, layer_names
+from .base import FunctionalTest
+
+
+class OWSProxyLayersTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSProxyLayersTest, self).settings.copy()
+        settings.update({
+            'twitcher.policy': 'true',
+            'twitcher.policy_file': self.policy_file,
+            'twitcher.ows_verify_cache_ttl': '0',
+            'twitcher.wms_capabilities_cache_ttl': '60',
+        })
+        return settings
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.policy_file = os.path.join(self.tmpdir, 'policy.json')
+        with open(self.policy_file, 'w') as policy_file:
+            json.dump([
+                {'service': 'ncwms', 'layer': 'secret/tasmax', 'subject': 'cert'},
+                {'service': 'ncwms', 'layer': 'restricted/pr', 'subject': '*', 'effect': 'deny'},
+            ], policy_file)
+        super(OWSProxyLayersTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="ncwms", url="http://localhost:8080/ncWMS2/wms", type="wms", auth='public')
+
+        self.config.include('twitcher.owsproxy')
+        self.cache = self.config.registry[WMS_CAPABILITIES_CACHE]
+        self.app = self.get_test_app()
+
+    def tearDown(self):
+        super(OWSProxyLayersTest, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    @staticmethod
+    def upstream(content, content_type='text/xml'):
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(content))}
+        resp = mock.MagicMock(status_code=200, headers=headers)
+        resp.iter_content.return_value = iter([content[i:i + 100] for i in range(0, len(content), 100)])
+        return resp
+
+    def get(self, query, **kwargs):
+        return self.app.get('/ows/proxy/ncwms?service=WMS&version=1.3.0&' + query, expect_errors=True, **kwargs)
+
+    def verify(self, query, **kwargs):
+        url = '/ows/verify/ncwms?service=WMS&version=1.3.0&' + query
+        return self.app.get(url, expect_errors=True, **kwargs).status_code
+
+    def test_getmap_hidden_layer_forbidden(self):
+        assert self.verify('request=GetMap&layers=public/tasmax') == 200
+        assert self.verify('request=GetMap&layers=public/tasmax,secret/tasmax') == 403
+        assert self.verify('request=GetFeatureInfo&layers=public/tasmax&query_layers=restricted/pr') == 403
+        headers = {'X-Ssl-Client-Verify': 'SUCCESS'}
+        assert self.verify('request=GetMap&layers=secret/tasmax', headers=headers) == 200
+        assert self.verify('request=GetMap&layers=restricted/pr', headers=headers) == 403
+
+    def test_getmap_relayed(self):
+        with mock.patch("requests.request", return_value=self.upstream(b'png', 'image/png')):
+            resp = self.get('request=GetMap&layers=public/tasmax')
+        assert resp.status_code == 200
+        assert resp.body == b'png'
+
+    def test_getcapabilities_filtered(self):
+        with mock.patch("requests.request", return_value=self.upstream(CAPS)):
+            resp = self.get('request=GetCapabilities')
+        assert resp.status_code == 200
+        assert 'Content-Length' not in resp.headers or resp.headers['Content-Length'] == str(len(resp.body))
+        assert layer_names(resp.body) == ['public/tasmax', 'secret', 'public/child', 'public/pr']
+
+        with mock.patch("requests.request", return_value=self.upstream(CAPS)):
+            resp = self.get('request=GetCapabilities', headers={'X-Ssl-Client-Verify': 'SUCCESS'})
+        assert layer_names(resp.body) == ['public/tasmax', 'secret/tasmax', 'secret/tasmax/child', 'secret',
+                                          'public/child', 'public/pr']
+
+    def test_getcapabilities_cached_per_hidden_layers(self):
+        with mock.patch("requests.request", return_value=self.upstream(CAPS)) as upstream:
+            first = self.get('request=GetCapabilities')
+            second = self.get('request=GetCapabilities', headers={'Authorization': 'Bearer unknown'})
+        assert upstream.call_count == 1
+        assert second.body == first.body
+        assert second.headers['Content-Type'] == 'text/xml'
+        assert len(self.cache) == 1
+
+    def test_getcapabilities_invalid(self):
+        with mock.patch("requests.request", return_value=self.upstream(b'Internal error')):
+            resp = self.get('request=GetCapabilities')
+        assert resp.status_code != 200
+        assert b'Could not decode content' in resp.body
+        assert len(self.cache) == 0
@@ -0,0 +1,127 @@
+"""
+Testing the offloading of OWS proxy requests to the front-end web server.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from twitcher.adapter.default import DefaultAdapter
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from ..test_capabilities import CAPS, layer_names
+from .base import FunctionalTest
+from .test_adapter import AdapterWithHooks
+
+
+class OWSProxyOffloadTest(FunctionalTest):
+
+    def setUp(self):
+        super(OWSProxyOffloadTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(
+            name="wms_offload",
+            url="http://localhost:8080/ncWMS2/wms",
+            type="wms",
+            auth='public',
+            offload=True)
+        service_store.save_service(
+            name="wps_offload",
+            url="http://localhost:5000/wps",
+            type="wps",
+            auth='public',
+            offload=True)
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def test_offload_redirect_header(self):
+        with mock.patch("requests.request") as mocked_request:
+            resp = self.app.get('/ows/proxy/wms_offload?service=wms&request=getcapabilities')
+            assert not mocked_request.called, "Proxied request should not be sent by twitcher."
+        assert resp.status_code == 200
+        assert resp.body == b''
+        assert resp.headers['X-Accel-Redirect'] == \
+            '/_twitcher_upstream/http/localhost:8080/ncWMS2/wms?service=wms&request=getcapabilities'
+
+    def test_offload_refused_for_post(self):
+        # the web server would drop the body when following the internal redirect
+        with mock.patch("requests.request") as mocked_request:
+            mocked_request.return_value = mock.MagicMock(
+                status_code=200, ok=True, headers={'Content-Type': 'text/xml'}, content=b'<WMS_Capabilities/>')
+            resp = self.app.post('/ows/proxy/wms_offload',
+                                 b'<GetCapabilities service="WMS" version="1.3.0"/>', content_type='text/xml')
+            assert mocked_request.called
+            assert mocked_request.call_args[1]['data'] == b'<GetCapabilities service="WMS" version="1.3.0"/>'
+        assert resp.status_code == 200
+        assert 'X-Accel-Redirect' not in resp.headers
+
+    def test_offload_allowed_by_adapter(self):
+        service = {'name': 'wms_offload', 'type': 'wms', 'offload': True}
+        assert DefaultAdapter({}).offload_allowed(service) is True
+        assert AdapterWithHooks({}).offload_allowed(service) is False
+
+    def test_offload_refused_for_wps(self):
+        # responses of WPS services must have their upstream URLs replaced
+        assert DefaultAdapter({}).offload_allowed({'name': 'wps', 'type': 'wps', 'offload': True}) is False
+        assert DefaultAdapter({}).offload_allowed({'name': 'wps', 'offload': True}) is False
+        with mock.patch("requests.request") as mocked_request:
+            mocked_request.return_value = mock.MagicMock(
+                status_code=200, ok=True, headers={'Content-Type': 'text/xml'},
+                content=b'<wps:Capabilities xmlns:wps="http://www.opengis.net/wps/1.0.0" '
+                        b'xmlns:ows="http://www.opengis.net/ows/1.1" xmlns:xlink="http://www.w3.org/1999/xlink">'
+                        b'<ows:OperationsMetadata><ows:Operation><ows:DCP><ows:HTTP>'
+                        b'<ows:Get xlink:href="http://localhost:5000/wps"/>'
+                        b'</ows:HTTP></ows:DCP></ows:Operation></ows:OperationsMetadata></wps:Capabilities>')
+            resp = self.app.get('/ows/proxy/wps_offload?service=wps&request=getcapabilities')
+            assert mocked_request.called
+        assert 'X-Accel-Redirect' not in resp.headers
+        assert b'http://localhost:5000/wps' not in resp.body
+
+
+class OWSProxyOffloadPolicyTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSProxyOffloadPolicyTest, self).settings.copy()
+        settings.update({
+            'twitcher.policy': 'true',
+            'twitcher.policy_file': self.policy_file,
+        })
+        return settings
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.policy_file = os.path.join(self.tmpdir, 'policy.json')
+        with open(self.policy_file, 'w') as policy_file:
+            json.dump([{'service': 'wms_policy', 'layer': 'secret/tasmax', 'subject': 'cert'}], policy_file)
+        super(OWSProxyOffloadPolicyTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        for name in ("wms_policy", "wms_offload"):
+            service_store.save_service(name=name, url="http://localhost:8080/ncWMS2/wms", type="wms", auth='public',
+                                       offload=True)
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def tearDown(self):
+        super(OWSProxyOffloadPolicyTest, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def test_offload_skipped_with_policy_rules(self):
+        upstream = mock.MagicMock(status_code=200, headers={'Content-Type': 'text/xml'})
+        upstream.iter_content.return_value = iter([CAPS])
+        with mock.patch("requests.request", return_value=upstream) as mocked_request:
+            resp = self.app.get('/ows/proxy/wms_policy?service=wms&request=getcapabilities')
+            assert mocked_request.called
+        assert 'X-Accel-Redirect' not in resp.headers
+        assert 'secret/tasmax' not in layer_names(resp.body)
+        assert 'public/tasmax' in layer_names(resp.body)
+
+    def test_offload_without_policy_rules(self):
+        resp = self.app.get('/ows/proxy/wms_offload?service=wms&request=getcapabilities')
+        assert 'X-Accel-Redirect' in resp.headers
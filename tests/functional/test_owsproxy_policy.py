@@ -0,0 +1,123 @@
+"""
+Testing the access policy engine of the OWS security.
+"""
+import json
+import os
+import shutil
+import tempfile
+
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from .base import FunctionalTest
+
+
+class OWSPolicyFileTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSPolicyFileTest, self).settings.copy()
+        settings.update({
+            'twitcher.policy': 'true',
+            'twitcher.policy_file': self.policy_file,
+            'twitcher.policy_reload_interval': '0',
+            'twitcher.ows_verify_cache_ttl': '0',
+        })
+        return settings
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.policy_file = os.path.join(self.tmpdir, 'policy.json')
+        with open(self.policy_file, 'w') as policy_file:
+            json.dump([
+                {'service': 'wps_public', 'request': 'execute', 'identifier': 'secret', 'effect': 'deny'},
+                {'service': 'wps_secured', 'request': 'execute', 'identifier': 'hello', 'subject': 'cert'},
+            ], policy_file)
+        super(OWSPolicyFileTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wps_public", url="http://localhost:5000/wps", auth='public')
+        service_store.save_service(name="wps_secured", url="http://localhost:5000/wps", auth='token')
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def tearDown(self):
+        super(OWSPolicyFileTest, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def verify(self, service, identifier, **kwargs):
+        url = '/ows/verify/{}?service=wps&request=execute&version=1.0.0&identifier={}'.format(service, identifier)
+        return self.app.get(url, expect_errors=True, **kwargs).status_code
+
+    def test_public_service_denied_process(self):
+        assert self.verify('wps_public', 'secret') == 403
+        assert self.verify('wps_public', 'hello') == 200
+
+    def test_secured_service_allowed_process(self):
+        headers = {'X-Ssl-Client-Verify': 'SUCCESS'}
+        assert self.verify('wps_secured', 'hello', headers=headers) == 200
+        assert self.verify('wps_secured', 'hello') == 403
+        assert self.verify('wps_secured', 'other', headers=headers) == 403
+
+
+class OWSPolicyDatabaseTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSPolicyDatabaseTest, self).settings.copy()
+        settings.update({
+            'twitcher.policy': 'true',
+            'twitcher.policy_reload_interval': '0',
+            'twitcher.ows_verify_cache_ttl': '0',
+        })
+        return settings
+
+    def setUp(self):
+        super(OWSPolicyDatabaseTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wps_public", url="http://localhost:5000/wps", auth='public')
+
+        self.config.include('twitcher.api')
+        self.config.scan('twitcher.api')
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+        self.app.authorization = ('Basic', ('testuser', 'testpassword'))
+
+    def test_rules_reloaded(self):
+        url = '/ows/verify/wps_public?service=wps&request=getcapabilities'
+        assert self.app.get(url).status_code == 200
+        rule = self.app.post_json('/policies', {'service': 'wps_public', 'effect': 'deny'}).json
+        assert rule['subject'] == '*'
+        assert self.app.get(url, expect_errors=True).status_code == 403
+        assert self.app.get('/policies').json == [rule]
+        assert self.app.delete('/policies/{}'.format(rule['id'])).json is True
+        assert self.app.get(url).status_code == 200
+
+    def test_extent_rules(self):
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="ncwms", url="http://localhost:8080/ncWMS2/wms", type="wms", auth='public')
+        self.app.post_json('/policies', {'service': 'ncwms', 'bbox': '-10,35,30,70', 'subject': 'cert'})
+        headers = {'X-Ssl-Client-Verify': 'SUCCESS'}
+        url = '/ows/verify/ncwms?service=wms&request=getmap&version=1.3.0&crs=CRS:84&layers=tas&bbox={}'
+        assert self.app.get(url.format('0,40,10,50'), headers=headers).status_code == 200
+        assert self.app.get(url.format('0,40,10,50'), expect_errors=True).status_code == 403
+        assert self.app.get(url.format('-20,40,10,50'), headers=headers, expect_errors=True).status_code == 403
+
+    def test_extent_rules_execute(self):
+        self.app.post_json('/policies', {'service': 'wps_public', 'bbox': '-10,35,30,70'})
+        url = '/ows/verify/wps_public?service=wps&request=execute&version=1.0.0&identifier=subset'
+        assert self.app.get(url).status_code == 200
+        assert self.app.get(url + '&DataInputs=region=0,40,10,50', expect_errors=True).status_code == 403
+        body = """<?xml version="1.0" encoding="UTF-8"?>
+        <wps:Execute service="WPS" version="1.0.0"
+            xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+          <wps:DataInputs><wps:Input><wps:Data>
+            <ows:BoundingBox crs="EPSG:4326"><ows:LowerCorner>{}</ows:LowerCorner><ows:UpperCorner>{}</ows:UpperCorner>
+            </ows:BoundingBox>
+          </wps:Data></wps:Input></wps:DataInputs>
+          <ows:Identifier>subset</ows:Identifier>
+        </wps:Execute>"""
+        verify = '/ows/verify/wps_public'
+        assert self.app.post(verify, body.format('0 40', '10 50'), content_type='text/xml').status_code == 200
+        assert self.app.post(verify, body.format('-20 40', '10 50'), content_type='text/xml',
+                             expect_errors=True).status_code == 403
@@ -0,0 +1,55 @@
+"""
+Testing the routing of WPS process executions to dedicated backends.
+"""
+import mock
+
+from twitcher.routing import OWS_PROXY_ROUTER
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from .base import FunctionalTest
+
+EXECUTE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<wps:Execute service="WPS" version="1.0.0"
+    xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+  <ows:Identifier>%s</ows:Identifier>
+</wps:Execute>"""
+
+
+class OWSProxyRoutingTest(FunctionalTest):
+    def setUp(self):
+        super(OWSProxyRoutingTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="emu", url="http://emu:5000/wps", type="wps", auth='public',
+                                   routes=[{'identifier': 'heavy', 'url': 'http://heavy:5000/wps',
+                                            'max_concurrent': 1}])
+
+        self.config.include('twitcher.owsproxy')
+        self.router = self.config.registry[OWS_PROXY_ROUTER]
+        self.app = self.get_test_app()
+
+    def upstream(self, method, url, **kwargs):
+        return mock.MagicMock(status_code=200, ok=True, headers={'Content-Type': 'application/json'},
+                              content=url.encode())
+
+    def test_get_execute_routed(self):
+        with mock.patch("requests.request", side_effect=self.upstream):
+            resp = self.app.get('/ows/proxy/emu?service=wps&request=execute&version=1.0.0&identifier=heavy')
+        assert resp.body == b"http://heavy:5000/wps?service=wps&request=execute&version=1.0.0&identifier=heavy"
+
+    def test_post_execute_routed(self):
+        with mock.patch("requests.request", side_effect=self.upstream):
+            resp = self.app.post('/ows/proxy/emu', params=EXECUTE % b'heavy', content_type='text/xml')
+            assert resp.body == b"http://heavy:5000/wps"
+            resp = self.app.post('/ows/proxy/emu', params=EXECUTE % b'hello', content_type='text/xml')
+            assert resp.body == b"http://emu:5000/wps"
+
+    def test_saturated_route_rejected(self):
+        route = self.router.route({'name': 'emu', 'routes': [{'identifier': 'heavy', 'url': 'http://heavy:5000/wps',
+                                                              'max_concurrent': 1}]}, 'heavy')
+        self.router.acquire(route)
+        with mock.patch("requests.request", side_effect=self.upstream):
+            resp = self.app.post('/ows/proxy/emu', params=EXECUTE % b'heavy', content_type='text/xml',
+                                 expect_errors=True)
+        assert resp.status_code == 503
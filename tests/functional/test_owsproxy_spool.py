@@ -0,0 +1,49 @@
+"""
+Testing the spooling of OWS proxy responses.
+"""
+from wsgiref.util import FileWrapper
+
+import mock
+
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from .base import FunctionalTest
+
+
+class OWSProxySpoolTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSProxySpoolTest, self).settings.copy()
+        settings.update({
+            'twitcher.ows_proxy_spool': 'true',
+            'twitcher.ows_proxy_spool_memory_size': '16',
+        })
+        return settings
+
+    def setUp(self):
+        super(OWSProxySpoolTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wms_spool", url="http://localhost:8080/wms", type="wms", auth='public',
+                                   chunk_size=8)
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def test_spilled_spool_sent_with_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(filelike, block_size):
+            wrapped.append(block_size)
+            return FileWrapper(filelike, block_size)
+
+        upstream = mock.MagicMock(status_code=200, headers={'Content-Type': 'image/png'}, raw=None)
+        upstream.iter_content.return_value = iter([b'a' * 10, b'b' * 10, b'c' * 10])
+        with mock.patch("requests.request", return_value=upstream):
+            resp = self.app.get('/ows/proxy/wms_spool?service=wms&request=getmap&version=1.3.0',
+                                extra_environ={'wsgi.file_wrapper': file_wrapper})
+        assert resp.status_code == 200
+        assert resp.body == b'a' * 10 + b'b' * 10 + b'c' * 10
+        assert resp.headers['Content-Length'] == '30'
+        assert wrapped == [8], "spilled spool should be sent with the service chunk size"
@@ -0,0 +1,63 @@
+"""
+Testing OWS proxy requests to a service listening on a Unix domain socket.
+"""
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+
+from twitcher.store import ServiceStore
+
+from ..common import WPS_CAPS_EMU_XML, dummy_request
+from ..test_transport import UnixHTTPServer
+from .base import FunctionalTest
+
+
+class CapabilitiesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with open(WPS_CAPS_EMU_XML, 'rb') as xml:
+            body = xml.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, *args):
+        pass
+
+
+class OWSProxyUnixSocketTest(FunctionalTest):
+
+    def setUp(self):
+        super(OWSProxyUnixSocketTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = UnixHTTPServer(os.path.join(self.tmpdir, 'emu.sock'), CapabilitiesHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="emu_unix", url="http+unix://{}/wps".format(self.server.server_address),
+                                   auth='public')
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.remove(self.server.server_address)
+        os.rmdir(self.tmpdir)
+        super(OWSProxyUnixSocketTest, self).tearDown()
+
+    def test_getcaps(self):
+        resp = self.app.get('/ows/proxy/emu_unix?service=wps&request=getcapabilities')
+        assert resp.status_code == 200
+        resp.mustcontain('</wps:Capabilities>')
+        resp.mustcontain('xlink:href="http://localhost/ows/proxy/emu_unix"')
+        assert 'http+unix' not in resp.text
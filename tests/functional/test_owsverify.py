@@ -0,0 +1,149 @@
+"""
+Testing the cached OWS access verification endpoint.
+"""
+from unittest import mock
+
+from twitcher.owsverify import OWS_VERIFY_CACHE
+from twitcher.policy import OWS_POLICY
+from twitcher.store import ServiceStore
+
+from ..common import dummy_request
+from .base import FunctionalTest
+
+
+class OWSVerifyCacheTest(FunctionalTest):
+
+    def setUp(self):
+        super(OWSVerifyCacheTest, self).setUp()
+        self.init_database()
+        self.service_store = ServiceStore(dummy_request(dbsession=self.session))
+        self.service_store.save_service(name="wps_public", url="http://localhost:5000/wps", auth='public')
+        self.service_store.save_service(name="wps_secured", url="http://localhost:5000/wps", auth='token')
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def test_auth_allowed_cached(self):
+        url = '/ows/auth/wps_public?service=wps&request=execute&version=1.0.0'
+        resp = self.app.get(url)
+        assert resp.status_code == 200
+        assert resp.body == b''
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 1
+
+        # decision is answered from cache without looking up the service again
+        self.service_store.delete_service(name="wps_public")
+        resp = self.app.get(url)
+        assert resp.status_code == 200
+
+        # other request types are not shared with the cached decision
+        resp = self.app.get('/ows/auth/wps_public?service=wps&request=describeprocess&version=1.0.0',
+                            expect_errors=True)
+        assert resp.status_code == 401
+
+    def test_auth_unauthorized(self):
+        resp = self.app.get('/ows/auth/wps_secured?service=wps&request=execute&version=1.0.0', expect_errors=True)
+        assert resp.status_code == 401
+        assert resp.body == b''
+
+    def test_auth_forbidden(self):
+        resp = self.app.get('/ows/auth/wps_secured?service=wps&request=execute&version=1.0.0',
+                            headers={'Authorization': 'Bearer invalid'}, expect_errors=True)
+        assert resp.status_code == 403
+        assert resp.body == b''
+
+    def test_auth_public_request(self):
+        resp = self.app.get('/ows/auth/wps_secured?service=wps&request=getcapabilities')
+        assert resp.status_code == 200
+
+    def test_auth_post_not_cached(self):
+        url = '/ows/auth/wps_secured?service=wps&request=getcapabilities'
+        assert self.app.get(url).status_code == 200
+        # the body of the request is verified, not the cached decision of the query
+        resp = self.app.post(url, params=b'<wps:Execute xmlns:wps="http://www.opengis.net/wps/1.0.0" '
+                                         b'service="WPS" version="1.0.0"/>',
+                             content_type='text/xml', expect_errors=True)
+        assert resp.status_code == 401
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 1
+
+    def test_auth_error_not_cached(self):
+        url = '/ows/auth/wps_public?service=wps&request=getcapabilities'
+        with mock.patch('twitcher.owsregistry.OWSRegistry.get_service_by_name', side_effect=RuntimeError):
+            assert self.app.get(url, expect_errors=True).status_code == 403
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 0
+        assert self.app.get(url).status_code == 200
+
+    def test_auth_public_service_not_parsed(self):
+        # public services are allowed before the body of the OWS request is parsed
+        resp = self.app.post('/ows/auth/wps_public', params=b'<not-xml', content_type='text/xml')
+        assert resp.status_code == 200
+        resp = self.app.post('/ows/auth/wps_secured', params=b'<not-xml', content_type='text/xml',
+                             expect_errors=True)
+        assert resp.status_code == 403
+
+
+class OWSVerifyPolicyTest(FunctionalTest):
+    @property
+    def settings(self):
+        settings = super(OWSVerifyPolicyTest, self).settings.copy()
+        settings.update({
+            'twitcher.policy': 'true',
+            'twitcher.policy_reload_interval': '60',
+        })
+        return settings
+
+    def setUp(self):
+        super(OWSVerifyPolicyTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wps_public", url="http://localhost:5000/wps", auth='public')
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def test_auth_policy_reloaded(self):
+        url = '/ows/auth/wps_public?service=wps&request=execute&version=1.0.0&identifier=hello'
+        assert self.app.get(url).status_code == 200
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 1
+        # decisions of the previous rules are not reused
+        self.config.registry[OWS_POLICY].load([{'service': 'wps_public', 'effect': 'deny'}])
+        assert self.app.get(url, expect_errors=True).status_code == 401
+
+    def test_auth_policy_due_to_reload(self):
+        self.config.registry[OWS_POLICY].reload_interval = 0
+        url = '/ows/auth/wps_public?service=wps&request=execute&version=1.0.0&identifier=hello'
+        assert self.app.get(url).status_code == 200
+        assert len(self.config.registry[OWS_VERIFY_CACHE]) == 0
+
+
+class OWSVerifyBatchTest(FunctionalTest):
+
+    def setUp(self):
+        super(OWSVerifyBatchTest, self).setUp()
+        self.init_database()
+        service_store = ServiceStore(dummy_request(dbsession=self.session))
+        service_store.save_service(name="wps_public", url="http://localhost:5000/wps", auth='public')
+        service_store.save_service(name="wps_secured", url="http://localhost:5000/wps", auth='token')
+        service_store.save_service(name="wms_secured", url="http://localhost:8080/wms", type='wms', auth='token')
+
+        self.config.include('twitcher.owsproxy')
+        self.app = self.get_test_app()
+
+    def test_verify_batch(self):
+        body = {"requests": [
+            {"service": "wps_public", "request": "execute", "identifier": "hello"},
+            {"service": "wps_secured", "request": "GetCapabilities"},
+            {"service": "wps_secured", "request": "execute", "identifier": "hello"},
+            {"service": "wms_secured", "request": "getmap"},
+            {"service": "wms_secured", "request": "execute"},
+            {"service": "unknown", "request": "getcapabilities"},
+        ]}
+        resp = self.app.post_json('/ows/verify', body, headers={'Authorization': 'Bearer invalid'})
+        assert resp.status_code == 200
+        access = [decision['access'] for decision in resp.json['decisions']]
+        assert access == [True, True, False, False, False, False]
+        assert resp.json['decisions'][0] == {
+            "service": "wps_public", "request": "execute", "identifier": "hello", "access": True}
+
+    def test_verify_batch_invalid_body(self):
+        resp = self.app.post_json('/ows/verify', {"requests": "wps_public"}, expect_errors=True)
+        assert resp.status_code == 400
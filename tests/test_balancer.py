@@ -0,0 +1,76 @@
+import pytest
+
+from twitcher.balancer import UpstreamBalancer, service_endpoints
+
+from .test_cache import FakeTimer
+
+URLS = ['http://a/wps', 'http://b/wps', 'http://c/wps']
+
+
+def test_service_endpoints():
+    service = {'url': URLS[0], 'endpoints': [URLS[1], URLS[0], URLS[2]]}
+    assert service_endpoints(service) == URLS
+    assert service_endpoints({'url': URLS[0]}) == URLS[:1]
+
+
+def test_invalid_strategy():
+    with pytest.raises(ValueError):
+        UpstreamBalancer(strategy='round_robin')
+
+
+def test_least_outstanding():
+    balancer = UpstreamBalancer(strategy='least_outstanding')
+    balancer.acquire(URLS[0])
+    balancer.acquire(URLS[1])
+    assert balancer.select(URLS) == URLS[2]
+    balancer.acquire(URLS[2])
+    balancer.acquire(URLS[2])
+    balancer.release(URLS[0], latency=0.1)
+    assert balancer.select(URLS) == URLS[0]
+
+
+def test_ewma():
+    balancer = UpstreamBalancer(strategy='ewma', decay=0.5)
+    for url, latency in zip(URLS, [0.3, 0.1, 0.2]):
+        balancer.acquire(url)
+        balancer.release(url, latency=latency)
+    assert balancer.select(URLS) == URLS[1]
+    balancer.acquire(URLS[1])
+    balancer.release(URLS[1], latency=0.5)  # ewma = 0.3
+    assert balancer.select(URLS) == URLS[2]
+
+
+def test_unhealthy_backoff():
+    timer = FakeTimer()
+    balancer = UpstreamBalancer(backoff=1, max_backoff=3, timer=timer)
+    with pytest.raises(IOError):
+        with balancer.track(URLS[0]):
+            raise IOError("connection refused")
+    assert not balancer.is_healthy(URLS[0])
+    assert balancer.select(URLS[:2]) == URLS[1]
+
+    # re-admitted after delay, but next failure doubles it
+    timer.now = 1
+    assert balancer.is_healthy(URLS[0])
+    with balancer.track(URLS[0]) as outcome:
+        outcome['failed'] = True
+    timer.now = 2.5
+    assert not balancer.is_healthy(URLS[0])
+    timer.now = 3
+    assert balancer.is_healthy(URLS[0])
+
+    # success resets the failures
+    with balancer.track(URLS[0]):
+        pass
+    assert balancer.json()[URLS[0]]['failures'] == 0
+
+
+def test_all_unhealthy_selects_first_admitted():
+    timer = FakeTimer()
+    balancer = UpstreamBalancer(backoff=10, timer=timer)
+    balancer.acquire(URLS[0])
+    balancer.release(URLS[0], failed=True)
+    timer.now = 5
+    balancer.acquire(URLS[1])
+    balancer.release(URLS[1], failed=True)
+    assert balancer.select(URLS[:2]) == URLS[0]
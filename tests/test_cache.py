@@ -0,0 +1,51 @@
+from twitcher.cache import ExpiringCache
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_expiring_cache_ttl():
+    timer = FakeTimer()
+    cache = ExpiringCache(maxsize=10, ttl=10, timer=timer)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=2)
+    cache.set('c', 3, ttl=100)  # capped by cache ttl
+    cache.set('d', 4, ttl=0)    # never stored
+    assert cache.get('a') == 1
+    assert cache.get('b') == 2
+    assert 'd' not in cache
+    timer.now = 5
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    timer.now = 10
+    assert cache.get('a') is None
+    assert cache.get('c') is None
+
+
+def test_expiring_cache_lru_eviction():
+    cache = ExpiringCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' becomes least recently used
+    cache.set('c', 3)
+    assert len(cache) == 2
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.pop('c') == 3
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_expiring_cache_evict():
+    cache = ExpiringCache(maxsize=10, ttl=10)
+    cache.set('a', (200, 'x'))
+    cache.set('b', (403, 'y'))
+    cache.set('c', (200, 'x'))
+    assert cache.evict(lambda key, value: value[1] == 'x') == 2
+    assert len(cache) == 1
+    assert cache.get('b') == (403, 'y')
@@ -0,0 +1,94 @@
+import lxml.etree
+import pytest
+
+from twitcher.capabilities import filter_capabilities
+from twitcher.xmlparser import XMLLimitExceeded, XMLLimits
+
+from .common import WMS_CAPS_NCWMS2_111_XML, WMS_CAPS_NCWMS2_130_XML
+
+CAPS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities xmlns="http://www.opengis.net/wms" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.3.0">
+  <Capability>
+    <!-- layers -->
+    <Layer>
+      <Title>Datasets</Title>
+      <Layer>
+        <Title>Public</Title>
+        <Name>public/tasmax</Name>
+        <Style><Name>default</Name></Style>
+      </Layer>
+      <Layer queryable="1">
+        <Title>Secret</Title>
+        <Name>secret/tasmax</Name>
+        <Layer><Name>secret/tasmax/child</Name></Layer>
+      </Layer>
+      <Layer>
+        <Name>secret</Name>
+        <Layer><Name>public/child</Name></Layer>
+      </Layer>
+      <Layer>
+        <Title>Group</Title>
+        <Layer><Name>restricted/pr</Name></Layer>
+        <Layer><Name>public/pr</Name></Layer>
+      </Layer>
+    </Layer>
+  </Capability>
+</WMS_Capabilities>"""
+
+
+def layer_names(document):
+    root = lxml.etree.fromstring(document)
+    return [element.text for element in root.iter('{*}Name')
+            if lxml.etree.QName(element.getparent()).localname == 'Layer']
+
+
+def filtered(document, hidden, chunk_size=16, limits=None):
+    chunks = [document[i:i + chunk_size] for i in range(0, len(document), chunk_size)]
+    return b''.join(filter_capabilities(chunks, frozenset(hidden), limits))
+
+
+def test_filter_capabilities_hidden_layers():
+    document = filtered(CAPS, {'secret/tasmax', 'secret', 'restricted/pr'})
+    assert layer_names(document) == ['public/tasmax', 'public/pr']
+    root = lxml.etree.fromstring(document)
+    assert root.nsmap == {None: 'http://www.opengis.net/wms', 'xlink': 'http://www.w3.org/1999/xlink'}
+    assert [title.text for title in root.iter('{*}Title')] == ['Datasets', 'Public', 'Group']
+    assert b'<!-- layers -->' in document
+
+
+def test_filter_capabilities_unchanged():
+    for path in (WMS_CAPS_NCWMS2_111_XML, WMS_CAPS_NCWMS2_130_XML):
+        with open(path, 'rb') as xml:
+            document = xml.read()
+        expected = lxml.etree.fromstring(document)
+        for chunk_size in (7, 1024):
+            result = lxml.etree.fromstring(filtered(document, set(), chunk_size))
+            assert [(e.tag, e.text, e.tail, dict(e.attrib)) for e in result.iter()] == \
+                [(e.tag, e.text, e.tail, dict(e.attrib)) for e in expected.iter()]
+
+
+def test_filter_capabilities_ncwms():
+    with open(WMS_CAPS_NCWMS2_130_XML, 'rb') as xml:
+        document = xml.read()
+    names = layer_names(document)
+    assert layer_names(filtered(document, names[1:], 1024)) == names[:1]
+
+
+def test_filter_capabilities_doctype():
+    with open(WMS_CAPS_NCWMS2_111_XML, 'rb') as xml:
+        document = xml.read()
+    assert b'<!DOCTYPE WMT_MS_Capabilities SYSTEM ' in filtered(document, set(), 1024)
+
+
+def test_filter_capabilities_limits():
+    with pytest.raises(XMLLimitExceeded):
+        filtered(CAPS, set(), limits=XMLLimits(max_depth=3))
+    with pytest.raises(XMLLimitExceeded):
+        filtered(CAPS, set(), limits=XMLLimits(max_elements=10))
+    with pytest.raises(XMLLimitExceeded):
+        filtered(CAPS, set(), limits=XMLLimits(max_size=100))
+
+
+def test_filter_capabilities_invalid():
+    with pytest.raises(lxml.etree.XMLSyntaxError):
+        filtered(b'<WMS_Capabilities><Layer></WMS_Capabilities>', set())
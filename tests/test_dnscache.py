@@ -0,0 +1,127 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from twitcher.dnscache import DNSCache
+from twitcher.transport import upstream_session
+
+from .test_cache import FakeTimer
+
+
+class StubResolver(object):
+    """
+    Resolver answering configured addresses, counting its calls.
+    """
+
+    def __init__(self, records, ttl=None):
+        self.records = records
+        self.ttl = ttl
+        self.calls = 0
+
+    def __call__(self, host, port):
+        self.calls += 1
+        if host not in self.records:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        addresses = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (ip, port))
+                     for ip in self.records[host]]
+        return addresses, self.ttl
+
+
+def addresses(infos):
+    return [info[4][0] for info in infos]
+
+
+def test_lookup_cached():
+    resolver = StubResolver({'wps.test': ['10.0.0.1']})
+    cache = DNSCache(resolve=resolver)
+    assert addresses(cache.lookup('wps.test', 80)) == ['10.0.0.1']
+    assert addresses(cache.lookup('wps.test', 80)) == ['10.0.0.1']
+    assert resolver.calls == 1
+    assert cache.json()['hits'] == 1
+
+
+def test_lookup_ttl():
+    timer = FakeTimer()
+    resolver = StubResolver({'wps.test': ['10.0.0.1']}, ttl=10)
+    cache = DNSCache(resolve=resolver, ttl=60, refresh=1, timer=timer)
+    cache.lookup('wps.test', 80)
+    timer.now += 9
+    cache.lookup('wps.test', 80)
+    assert resolver.calls == 1
+    timer.now += 2  # record TTL honored rather than the default one
+    cache.lookup('wps.test', 80)
+    assert resolver.calls == 2
+
+
+def test_negative_cache():
+    timer = FakeTimer()
+    resolver = StubResolver({})
+    cache = DNSCache(resolve=resolver, negative_ttl=5, timer=timer)
+    for _ in range(3):
+        with pytest.raises(socket.gaierror):
+            cache.lookup('unknown.test', 80)
+    assert resolver.calls == 1
+    timer.now += 6
+    with pytest.raises(socket.gaierror):
+        cache.lookup('unknown.test', 80)
+    assert resolver.calls == 2
+
+
+def test_background_refresh():
+    timer = FakeTimer()
+    resolver = StubResolver({'wps.test': ['10.0.0.1']}, ttl=10)
+    cache = DNSCache(resolve=resolver, refresh=0.5, timer=timer)
+    cache.lookup('wps.test', 80)
+    resolver.records['wps.test'] = ['10.0.0.2']
+    timer.now += 6
+    # known address is returned immediately while refreshed in background
+    assert addresses(cache.lookup('wps.test', 80)) == ['10.0.0.1']
+    for _ in range(100):
+        if resolver.calls == 2 and not cache._entries[('wps.test', 80)].refreshing:
+            break
+        time.sleep(0.01)
+    assert addresses(cache.lookup('wps.test', 80)) == ['10.0.0.2']
+    assert cache.json()['refreshes'] == 1
+
+
+def test_round_robin():
+    resolver = StubResolver({'wps.test': ['10.0.0.1', '10.0.0.2', '10.0.0.3']})
+    cache = DNSCache(resolve=resolver)
+    first = [addresses(cache.lookup('wps.test', 80))[0] for _ in range(4)]
+    assert first == ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.1']
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_resolves_with_cache(http_server):
+    resolver = StubResolver({'upstream.test': ['127.0.0.1']})
+    session = upstream_session(dns_cache=DNSCache(resolve=resolver))
+    url = 'http://upstream.test:{}/wps'.format(http_server.server_port)
+    assert session.get(url).text == 'ok'
+    # new connection, resolved from the cache
+    assert session.get(url, headers={'Connection': 'close'}).text == 'ok'
+    assert session.get(url).text == 'ok'
+    assert resolver.calls == 1
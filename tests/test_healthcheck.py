@@ -0,0 +1,73 @@
+import threading
+import time
+
+from twitcher.healthcheck import HEALTH_DOWN, HEALTH_UP, HealthChecker
+
+SERVICES = [
+    {'name': 'emu', 'url': 'http://emu/wps', 'type': 'wps', 'endpoints': ['http://emu2/wps']},
+    {'name': 'ncwms', 'url': 'http://ncwms/wms', 'type': 'wms'},
+]
+
+
+class FakeProbe(object):
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, url, service, method, timeout):
+        with self.lock:
+            self.calls.append(url)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        status = HEALTH_DOWN if url in self.down else HEALTH_UP
+        return {'url': url, 'status': status, 'status_code': 200, 'latency': 0.01,
+                'checked_at': time.time(), 'error': None}
+
+
+def test_check_services():
+    probe = FakeProbe(down=['http://emu/wps', 'http://ncwms/wms'])
+    checker = HealthChecker(lambda: SERVICES, probe=probe)
+    health = checker.check_services(SERVICES)
+    assert sorted(probe.calls) == ['http://emu/wps', 'http://emu2/wps', 'http://ncwms/wms']
+    assert health['emu']['status'] == HEALTH_UP, "service is up as long as one of its endpoints is up"
+    assert health['ncwms']['status'] == HEALTH_DOWN
+    assert not checker.is_down('emu')
+    assert checker.is_down('ncwms')
+    assert checker.get('unknown') is None
+
+    # unregistered services are forgotten
+    checker.check_services(SERVICES[:1])
+    assert checker.get('ncwms') is None
+
+
+def test_check_services_bounded_concurrency():
+    services = [{'name': 'svc{}'.format(i), 'url': 'http://svc{}/wps'.format(i)} for i in range(20)]
+    probe = FakeProbe()
+    checker = HealthChecker(lambda: services, probe=probe, concurrency=3)
+    health = checker.check_services(services, spread=0.05)
+    assert len(health) == 20
+    assert probe.max_active <= 3
+
+
+def test_stale_health_ignored():
+    checker = HealthChecker(lambda: SERVICES, probe=FakeProbe(down=['http://ncwms/wms']), interval=1)
+    checker.check_services(SERVICES[1:])
+    checker._health['ncwms']['checked_at'] -= 10
+    assert not checker.is_down('ncwms')
+
+
+def test_shared_state_file(tmpdir):
+    state_file = str(tmpdir.join('health.json'))
+    leader = HealthChecker(lambda: SERVICES, probe=FakeProbe(down=['http://ncwms/wms']), state_file=state_file)
+    follower = HealthChecker(lambda: SERVICES, probe=FakeProbe(), state_file=state_file)
+    assert leader._elected()
+    assert not follower._elected(), "only one worker should probe the services"
+    leader.check_services(SERVICES)
+    assert follower.is_down('ncwms')
+    assert not follower.is_down('emu')
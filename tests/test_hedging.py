@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from twitcher.hedging import LatencyWindow, RequestHedger
+
+PRIMARY = 'http://a/wms'
+ALTERNATE = 'http://b/wms'
+
+
+class FakeResponse(object):
+    def __init__(self, url):
+        self.url = url
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_hedger(**kwargs):
+    hedger = RequestHedger(min_samples=5, min_delay=0.01, **kwargs)
+    for _ in range(10):
+        hedger.record('wms', 0.01)
+    return hedger
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100, percentile=90)
+    for latency in range(100):
+        window.add(latency / 100.0)
+    assert window.value() == 0.9
+    window.add(0.0)  # refreshed only after some new samples
+    assert window.value() == 0.9
+
+
+def test_no_hedge_without_samples():
+    hedger = RequestHedger(min_samples=5)
+    assert hedger.delay('wms') is None
+    endpoint, resp = hedger.send('wms', FakeResponse, PRIMARY, ALTERNATE)
+    assert endpoint == PRIMARY
+    assert hedger.hedged_total == 0
+
+
+def test_fast_request_not_hedged():
+    hedger = make_hedger()
+    endpoint, resp = hedger.send('wms', FakeResponse, PRIMARY, ALTERNATE)
+    assert endpoint == PRIMARY
+    assert hedger.hedged_total == 0
+
+
+def test_slow_request_hedged():
+    hedger = make_hedger()
+    release = threading.Event()
+    responses = []
+
+    def send(url):
+        if url == PRIMARY:
+            release.wait(5)
+        resp = FakeResponse(url)
+        responses.append(resp)
+        return resp
+
+    endpoint, resp = hedger.send('wms', send, PRIMARY, ALTERNATE)
+    assert endpoint == ALTERNATE
+    assert not resp.closed
+    assert hedger.hedged_total == 1
+    assert hedger.hedge_wins_total == 1
+    release.set()
+    hedger.executor.shutdown(wait=True)
+    loser = [r for r in responses if r.url == PRIMARY][0]
+    assert loser.closed, "Response of cancelled request should be closed."
+
+
+def test_failed_request_falls_back_to_hedge():
+    hedger = make_hedger()
+    hedged = threading.Event()
+
+    def send(url):
+        if url == PRIMARY:
+            hedged.wait(5)
+            raise IOError("connection reset")
+        hedged.set()
+        time.sleep(0.05)
+        return FakeResponse(url)
+
+    endpoint, resp = hedger.send('wms', send, PRIMARY, ALTERNATE)
+    assert endpoint == ALTERNATE
+
+
+def test_all_requests_failed():
+    hedger = make_hedger()
+
+    def send(url):
+        time.sleep(0.05)
+        raise IOError("connection refused")
+
+    with pytest.raises(IOError):
+        hedger.send('wms', send, PRIMARY, ALTERNATE)
+    assert hedger.hedged_total == 1
+
+
+def test_budget():
+    hedger = make_hedger(budget=0.0)
+    hedger._tokens = 1
+    release = threading.Event()
+
+    def send(url):
+        if url == PRIMARY:
+            release.wait(0.1)
+        return FakeResponse(url)
+
+    assert hedger.send('wms', send, PRIMARY, ALTERNATE)[0] == ALTERNATE
+    assert hedger.send('wms', send, PRIMARY, ALTERNATE)[0] == PRIMARY
+    assert hedger.hedged_total == 1
+    assert hedger.budget_exhausted_total == 1
+    release.set()
@@ -27,6 +27,10 @@ class OWSRegistryTest(BaseTest):
             'auth': 'token',
             'public': False,
             'verify': True,
+            'offload': False,
+            'chunk_size': None,
+            'endpoints': [],
+            'routes': [],
             'purl': 'http://myservice/wps'}
         # register
         resp = self.reg.register_service(**service)
@@ -47,3 +51,10 @@ class OWSRegistryTest(BaseTest):
         # clear
         resp = self.reg.clear_services()
         assert resp is True
+
+    def test_get_services_by_names(self):
+        self.reg.register_service(name='emu', url='http://localhost/wps')
+        self.reg.register_service(name='hummingbird', url='http://localhost/wps')
+        resp = self.reg.get_services_by_names(['emu', 'hummingbird', 'unknown'])
+        assert sorted(resp) == ['emu', 'hummingbird']
+        assert resp['emu']['url'] == 'http://localhost/wps'
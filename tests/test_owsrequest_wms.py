@@ -47,3 +47,26 @@ class OWSRequestWmsTestCase(unittest.TestCase):
         assert ows_req.request == 'getmetadata'
         assert ows_req.service == 'wms'
         assert ows_req.version == '1.3.0'
+
+    def test_get_getmap_kvp(self):
+        params = dict(REQUEST="GetMap", SERVICE="WMS", VERSION="1.3.0", LAYERS="tas,pr",
+                      BBOX="-180,-90,180,90", Width="256")
+        request = DummyRequest(params=params)
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'getmap'
+        assert ows_req.param('layers') == 'tas,pr'
+        assert ows_req.param('BBOX') == '-180,-90,180,90'
+        assert ows_req.kvp['width'] == '256'
+        assert ows_req.param('styles') is None
+
+    def test_get_getmap_bboxes(self):
+        params = dict(REQUEST="GetMap", SERVICE="WMS", VERSION="1.3.0", LAYERS="tas", CRS="EPSG:4326",
+                      BBOX="40,-10,50,10")
+        assert OWSRequest(DummyRequest(params=params)).bboxes == [(-10.0, 40.0, 10.0, 50.0)]
+        params = dict(REQUEST="GetMap", SERVICE="WMS", VERSION="1.1.1", LAYERS="tas", SRS="EPSG:4326",
+                      BBOX="-10,40,10,50")
+        assert OWSRequest(DummyRequest(params=params)).bboxes == [(-10.0, 40.0, 10.0, 50.0)]
+        params = dict(REQUEST="GetMap", SERVICE="WMS", VERSION="1.3.0", LAYERS="tas", CRS="EPSG:2154",
+                      BBOX="0,0,1,1")
+        with pytest.raises(OWSInvalidParameterValue):
+            OWSRequest(DummyRequest(params=params)).bboxes
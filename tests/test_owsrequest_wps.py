@@ -1,11 +1,15 @@
 import pytest
 import unittest
 
+import mock
+
 from pyramid import testing
+from pyramid.request import apply_request_extensions
 from pyramid.testing import DummyRequest
 
-from twitcher.owsrequest import OWSRequest
-from twitcher.owsexceptions import OWSInvalidParameterValue, OWSMissingParameterValue
+from twitcher import xmlparser
+from twitcher.owsrequest import OWSRequest, ows_parser_factory
+from twitcher.owsexceptions import OWSInvalidParameterValue, OWSMissingParameterValue, OWSNoApplicableCode
 
 
 class OWSRequestWpsTestCase(unittest.TestCase):
@@ -84,6 +88,86 @@ class OWSRequestWpsTestCase(unittest.TestCase):
         with pytest.raises(OWSInvalidParameterValue):
             OWSRequest(request)
 
+    def test_post_execute_bboxes(self):
+        request = DummyRequest(post={})
+        request.body = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+        <wps:Execute service="WPS" version="1.0.0"
+            xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+          <ows:Identifier>subset</ows:Identifier>
+          <wps:DataInputs>
+            <wps:Input>
+              <ows:Identifier>region</ows:Identifier>
+              <wps:Data>
+                <wps:BoundingBoxData crs="EPSG:4326" dimensions="2">
+                  <ows:LowerCorner>-10 40</ows:LowerCorner>
+                  <ows:UpperCorner>10 50</ows:UpperCorner>
+                </wps:BoundingBoxData>
+              </wps:Data>
+            </wps:Input>
+            <wps:Input>
+              <ows:Identifier>other</ows:Identifier>
+              <wps:Data>
+                <ows:BoundingBox crs="urn:ogc:def:crs:EPSG::4326">
+                  <ows:LowerCorner>40 -10</ows:LowerCorner>
+                  <ows:UpperCorner>50 10</ows:UpperCorner>
+                </ows:BoundingBox>
+              </wps:Data>
+            </wps:Input>
+          </wps:DataInputs>
+        </wps:Execute>"""
+        ows_req = OWSRequest(request)
+        assert ows_req.bboxes == [(-10.0, 40.0, 10.0, 50.0), (-10.0, 40.0, 10.0, 50.0)]
+        assert ows_req.identifier == 'subset'
+
+    def test_post_execute_bboxes_before_identifier(self):
+        request = DummyRequest(post={})
+        request.body = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+        <wps:Execute service="WPS" version="1.0.0"
+            xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+          <wps:DataInputs>
+            <wps:Input>
+              <ows:Identifier>region</ows:Identifier>
+              <wps:Data>
+                <wps:BoundingBoxData crs="EPSG:4326" dimensions="2">
+                  <ows:LowerCorner>-10 40</ows:LowerCorner>
+                  <ows:UpperCorner>10 50</ows:UpperCorner>
+                </wps:BoundingBoxData>
+              </wps:Data>
+            </wps:Input>
+          </wps:DataInputs>
+          <ows:Identifier>subset</ows:Identifier>
+        </wps:Execute>"""
+        ows_req = OWSRequest(request)
+        assert ows_req.identifier == 'subset'
+        assert ows_req.bboxes == [(-10.0, 40.0, 10.0, 50.0)]
+
+    def test_post_execute_bboxes_without_identifier(self):
+        request = DummyRequest(post={})
+        request.body = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+        <wps:Execute service="WPS" version="1.0.0"
+            xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+          <wps:DataInputs>
+            <wps:Input>
+              <wps:Data>
+                <ows:BoundingBox crs="EPSG:4326">
+                  <ows:LowerCorner>-10 40</ows:LowerCorner>
+                  <ows:UpperCorner>10 50</ows:UpperCorner>
+                </ows:BoundingBox>
+              </wps:Data>
+            </wps:Input>
+          </wps:DataInputs>
+        </wps:Execute>"""
+        ows_req = OWSRequest(request)
+        assert ows_req.identifier is None
+        assert ows_req.bboxes == [(-10.0, 40.0, 10.0, 50.0)]
+
+    def test_get_execute_bboxes(self):
+        params = dict(request="Execute", service="WPS", version="1.0.0", identifier="subset")
+        assert OWSRequest(DummyRequest(params=params)).bboxes == []
+        params['DataInputs'] = "region=-10,40,10,50,EPSG:4326"
+        with pytest.raises(OWSInvalidParameterValue):
+            OWSRequest(DummyRequest(params=params)).bboxes
+
     def test_post_describeprocess_request(self):
         request = DummyRequest(post={})
         request.body = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
@@ -134,3 +218,117 @@ class OWSRequestWpsTestCase(unittest.TestCase):
         assert ows_req.request == 'execute'
         assert ows_req.service == 'wps'
         assert ows_req.version == '1.0.0'
+
+    def test_post_execute_large_inputs(self):
+        request = DummyRequest(post={})
+        request.body = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <wps:Execute service="WPS" version="1.0.0"
+            xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+    <ows:Identifier>Buffer</ows:Identifier>
+    <wps:DataInputs>
+        <wps:Input>
+            <ows:Identifier>InputPolygon</ows:Identifier>
+            <wps:Data><wps:ComplexData>%s</wps:ComplexData></wps:Data>
+        </wps:Input>
+    </wps:DataInputs>
+</wps:Execute>""" % (b'<gml:Polygon xmlns:gml="http://www.opengis.net/gml"/>' * 100000)
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'execute'
+        assert ows_req.version == '1.0.0'
+        assert ows_req.identifier == 'Buffer'
+        # body only read until the process identifier
+        assert ows_req.parser.consumed < 10000 < len(request.body)
+
+    def test_post_execute_large_inputs_bboxes(self):
+        request = DummyRequest(post={})
+        request.body = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <wps:Execute service="WPS" version="1.0.0"
+            xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+    <ows:Identifier>Buffer</ows:Identifier>
+    <wps:DataInputs>
+        <wps:Input>
+            <ows:Identifier>InputPolygon</ows:Identifier>
+            <wps:Data><wps:ComplexData>%s</wps:ComplexData></wps:Data>
+        </wps:Input>
+        <wps:Input>
+            <ows:Identifier>region</ows:Identifier>
+            <wps:Data>
+                <wps:BoundingBoxData crs="EPSG:4326" dimensions="2">
+                  <ows:LowerCorner>-10 40</ows:LowerCorner>
+                  <ows:UpperCorner>10 50</ows:UpperCorner>
+                </wps:BoundingBoxData>
+            </wps:Data>
+        </wps:Input>
+    </wps:DataInputs>
+</wps:Execute>""" % (b'<gml:Polygon xmlns:gml="http://www.opengis.net/gml"/>' * 100000)
+        ows_req = OWSRequest(request)
+        # the rest of the body is scanned beyond the element limit
+        assert ows_req.bboxes == [(-10.0, 40.0, 10.0, 50.0)]
+        assert ows_req.parser.consumed == len(request.body)
+
+    def test_post_describeprocess_identifier(self):
+        request = DummyRequest(post={})
+        request.body = b"""<DescribeProcess service="WPS" version="1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+          <ows:Identifier>intersection</ows:Identifier>
+          <ows:Identifier>union</ows:Identifier>
+        </DescribeProcess>"""
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'describeprocess'
+        assert ows_req.identifier == 'intersection'
+
+    def test_post_parser_reused(self):
+        request = DummyRequest(post={})
+        request.body = b'<Execute service="WPS" version="1.0.0"><Identifier>hello</Identifier><DataInputs>'
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'execute'
+        parser = ows_req.parser._reader.parser
+        request._process_finished_callbacks()
+        # given back once the request is finished, although only read up to the root element
+        assert xmlparser._local.parser is parser
+        request = DummyRequest(post={})
+        request.body = b'<DescribeProcess service="WPS" version="1.0.0"><Identifier>other</Identifier>' \
+                       b'</DescribeProcess>'
+        ows_req = OWSRequest(request)
+        assert ows_req.parser._reader.parser is parser
+        assert ows_req.identifier == 'other'
+        request._process_finished_callbacks()
+        # not reused once parsing failed
+        request = DummyRequest(post={})
+        request.body = b'<Execute service="WPS" version="1.0.0"></Other>'
+        with pytest.raises(OWSNoApplicableCode):
+            OWSRequest(request).identifier
+        request._process_finished_callbacks()
+        assert xmlparser._local.parser is None
+
+    def test_post_invalid_xml(self):
+        request = DummyRequest(post={})
+        request.body = b"<Execute service="
+        with pytest.raises(OWSNoApplicableCode):
+            OWSRequest(request)
+
+    def test_post_nested_too_deep(self):
+        request = DummyRequest(post={})
+        request.body = b'<Execute service="WPS" version="1.0.0">' + b'<a>' * 100 + b'</a>' * 100 + b'</Execute>'
+        ows_req = OWSRequest(request)
+        assert ows_req.request == 'execute'
+        with pytest.raises(OWSInvalidParameterValue):
+            ows_req.identifier
+
+    def test_lazy_request_parsed_once(self):
+        request = DummyRequest(params=dict(request="DescribeProcess", service="wps"))
+        ows_req = OWSRequest(request, lazy=True)
+        assert not ows_req.parsed
+        with mock.patch('twitcher.owsrequest.ows_parser_factory', wraps=ows_parser_factory) as factory:
+            for _ in range(2):
+                with pytest.raises(OWSMissingParameterValue):
+                    ows_req.request
+            assert ows_req.parsed
+            assert factory.call_count == 1
+
+    def test_shared_ows_request(self):
+        self.config.include('twitcher.owsrequest')
+        self.config.commit()
+        request = DummyRequest(params=dict(request="GetCapabilities", service="WPS"))
+        apply_request_extensions(request)
+        assert request.ows_request is request.ows_request
+        assert request.ows_request.request == 'getcapabilities'
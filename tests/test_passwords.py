@@ -0,0 +1,60 @@
+import mock
+import pytest
+
+from twitcher import passwords
+from twitcher.basicauth import BasicAuthUsers
+from twitcher.passwords import hash_password, is_hashed, verify_password
+
+from .test_cache import FakeTimer
+
+
+@pytest.mark.parametrize('scheme', [passwords.SCRYPT, passwords.PBKDF2])
+def test_hash_password(scheme):
+    stored = hash_password('secret', scheme)
+    assert stored.startswith(scheme + '$')
+    assert is_hashed(stored)
+    assert stored != hash_password('secret', scheme)
+    assert verify_password('secret', stored)
+    assert not verify_password('other', stored)
+
+
+def test_verify_plain_password():
+    assert not is_hashed('secret')
+    assert verify_password('secret', 'secret')
+    assert not verify_password('other', 'secret')
+
+
+def test_verify_malformed_password():
+    assert not verify_password('secret', 'scrypt$16384$8$1$salt')
+    assert not verify_password('secret', 'pbkdf2_sha256$many$salt$hash')
+
+
+def test_basicauth_users():
+    users = BasicAuthUsers.from_settings({
+        'twitcher.username': 'demo',
+        'twitcher.password': 'demo',
+        'twitcher.users': '\nadmin:{}\n'.format(hash_password('admin')),
+    })
+    assert users.check('demo', 'demo')
+    assert users.check('admin', 'admin')
+    assert not users.check('admin', 'demo')
+    assert not users.check('other', 'admin')
+
+
+def test_basicauth_verifications_cached():
+    users = BasicAuthUsers({'admin': hash_password('admin')}, cache_ttl=10)
+    users.verifier.cache.timer = timer = FakeTimer()
+    with mock.patch('twitcher.passwords.verify_password', wraps=verify_password) as verify:
+        assert users.check('admin', 'admin')
+        assert users.check('admin', 'admin')
+        assert verify.call_count == 1
+        # failed verifications are not cached
+        assert not users.check('admin', 'wrong')
+        assert not users.check('admin', 'wrong')
+        assert verify.call_count == 3
+        timer.now += 10
+        assert users.check('admin', 'admin')
+        assert verify.call_count == 4
+        # entries of a changed password are not used
+        users.users['admin'] = hash_password('new')
+        assert not users.check('admin', 'admin')
@@ -0,0 +1,133 @@
+import json
+import time
+
+import mock
+import pytest
+
+from twitcher.policy import FilePolicySource, PolicyEngine, PolicyTable, policy_subjects
+
+from .test_cache import FakeTimer
+
+RULES = [
+    {'service': 'emu', 'request': 'execute', 'subject': 'scope:compute'},
+    {'service': 'emu', 'request': 'execute', 'identifier': 'secret', 'subject': 'scope:compute', 'effect': 'deny'},
+    {'service': 'emu', 'request': 'execute', 'identifier': 'secret', 'subject': 'client:admin'},
+    {'service': '*', 'request': 'getcapabilities', 'subject': '*'},
+    {'service': 'private', 'subject': '*', 'effect': 'deny'},
+]
+
+
+def test_policy_decide():
+    table = PolicyTable(RULES)
+    assert table.decide('emu', 'execute', ['*', 'scope:compute'], 'hello') is True
+    assert table.decide('emu', 'execute', ['*'], 'hello') is None
+    assert table.decide('emu', 'getcapabilities', ['*']) is True
+    assert table.decide('other', 'describeprocess', ['*']) is None
+    assert table.decide('private', 'getcapabilities', ['*']) is False
+
+
+def test_policy_deny_overrides_allow():
+    table = PolicyTable(RULES)
+    assert table.decide('emu', 'execute', ['*', 'client:admin'], 'secret') is True
+    assert table.decide('emu', 'execute', ['*', 'client:admin', 'scope:compute'], 'secret') is False
+
+
+def test_policy_hidden_layers():
+    table = PolicyTable([
+        {'service': 'ncwms', 'layer': 'restricted/tasmax', 'subject': 'scope:restricted'},
+        {'service': 'ncwms', 'layer': 'secret/tasmax', 'subject': '*', 'effect': 'deny'},
+        {'service': 'ncwms', 'layer': 'secret/tasmax', 'subject': 'client:admin'},
+    ])
+    assert table.restricts_layers('ncwms')
+    assert not table.restricts_layers('other')
+    assert table.hidden_layers('ncwms', ['*']) == {'restricted/tasmax', 'secret/tasmax'}
+    assert table.hidden_layers('ncwms', ['*', 'scope:restricted']) == {'secret/tasmax'}
+    assert table.hidden_layers('ncwms', ['*', 'client:admin']) == {'restricted/tasmax', 'secret/tasmax'}
+    # layer rules do not decide access to the service
+    assert table.decide('ncwms', 'getmap', ['*']) is None
+    assert table.covers('ncwms')
+
+
+def test_policy_extent_allowed():
+    table = PolicyTable([
+        {'service': 'ncwms', 'bbox': '-10,35,30,70', 'subject': 'scope:europe'},
+        {'service': 'ncwms', 'bbox': [-130, 20, -60, 55], 'subject': 'scope:america'},
+        {'service': 'ncwms', 'bbox': '0,40,5,45', 'subject': '*', 'effect': 'deny'},
+    ])
+    assert table.restricts_extent('ncwms')
+    assert not table.restricts_extent('other')
+    europe = (10.0, 45.0, 20.0, 50.0)
+    assert table.extent_allowed('ncwms', ['*', 'scope:europe'], [europe])
+    assert not table.extent_allowed('ncwms', ['*', 'scope:america'], [europe])
+    assert not table.extent_allowed('ncwms', ['*'], [europe])
+    assert not table.extent_allowed('ncwms', ['*', 'scope:europe'], [(-20.0, 45.0, 20.0, 50.0)])
+    assert not table.extent_allowed('ncwms', ['*', 'scope:europe'], [(4.0, 44.0, 10.0, 50.0)])
+    assert table.extent_allowed('ncwms', ['*', 'scope:europe', 'scope:america'], [europe, (-100.0, 30.0, -90.0, 40.0)])
+    assert table.decide('ncwms', 'getmap', ['*']) is None
+
+
+def test_policy_invalid_bbox():
+    with pytest.raises(ValueError):
+        PolicyTable([{'service': 'ncwms', 'bbox': '10,0,0,10'}])
+
+
+def test_policy_covers():
+    assert PolicyTable(RULES[:3]).covers('emu')
+    assert not PolicyTable(RULES[:3]).covers('other')
+    assert PolicyTable(RULES).covers('other')
+
+
+def test_policy_invalid_effect():
+    with pytest.raises(ValueError):
+        PolicyTable([{'service': 'emu', 'effect': 'maybe'}])
+
+
+def test_policy_file_reloaded(tmp_path):
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps({'rules': RULES[:1]}))
+    timer = FakeTimer()
+    engine = PolicyEngine(FilePolicySource(str(path)), reload_interval=5, timer=timer)
+    assert engine.decide(None, 'emu', 'execute', ['*', 'scope:compute']) is True
+    path.write_text(json.dumps({'rules': RULES[:1] + [{'service': 'emu', 'effect': 'deny'}]}))
+    assert engine.decide(None, 'emu', 'execute', ['*', 'scope:compute']) is True
+    timer.now += 5
+    assert engine.decide(None, 'emu', 'execute', ['*', 'scope:compute']) is False
+    # invalid rules are not applied
+    path.write_text('[{"effect": "maybe"}]')
+    timer.now += 5
+    assert engine.decide(None, 'emu', 'execute', ['*', 'scope:compute']) is False
+
+
+def test_policy_subjects():
+    request = mock.MagicMock(headers={'Authorization': 'Bearer abc', 'X-Ssl-Client-Verify': 'SUCCESS'})
+
+    def verify_request(scopes=None):
+        request.client.client_id = 'dev'
+        request.scopes = ['compute']
+        return True
+    request.verify_request.side_effect = verify_request
+    assert policy_subjects(request) == ['*', 'cert', 'client:dev', 'scope:compute']
+    request.verify_request.side_effect = None
+    request.verify_request.return_value = False
+    assert policy_subjects(request) == ['*', 'cert']
+
+
+@pytest.mark.slow
+def test_policy_benchmark():
+    """
+    Decision cost with 10k rules, compared with 10 rules.
+    """
+    def decision_cost(count):
+        rules = [{'service': 'svc{}'.format(i % 100), 'request': 'execute', 'identifier': 'proc{}'.format(i),
+                  'subject': 'client:c{}'.format(i % 50)} for i in range(count)]
+        table = PolicyTable(rules)
+        subjects = ['*', 'client:c7', 'scope:compute']
+        start = time.perf_counter()
+        for i in range(100000):
+            table.decide('svc7', 'execute', subjects, 'proc{}'.format(i % count))
+        return (time.perf_counter() - start) / 100000
+
+    small, large = decision_cost(10), decision_cost(10000)
+    print("decision with 10 rules: {:.2f}us, with 10k rules: {:.2f}us".format(small * 1e6, large * 1e6))
+    assert large < 50e-6
+    assert large < small * 3
@@ -0,0 +1,67 @@
+import http.client
+import io
+
+import pytest
+from requests.models import Response
+from urllib3.response import HTTPResponse
+
+from twitcher.owsproxy import BufferedResponse
+from twitcher.relay import relay_chunk_size
+
+
+class FakeSocket(object):
+    def __init__(self, data):
+        self.data = data
+
+    def makefile(self, mode):
+        return io.BytesIO(self.data)
+
+
+def upstream_response(body, chunked=False):
+    """
+    Response of requests over an HTTP stream, as received from an upstream service.
+    """
+    if chunked:
+        payload = b''.join(b'%x\r\n%s\r\n' % (len(body[i:i + 1000]), body[i:i + 1000])
+                           for i in range(0, len(body), 1000))
+        message = b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n' + payload + b'0\r\n\r\n'
+    else:
+        message = b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+    original = http.client.HTTPResponse(FakeSocket(message))
+    original.begin()
+    resp = Response()
+    resp.status_code = 200
+    resp.raw = HTTPResponse(body=original, preload_content=False, decode_content=False,
+                            original_response=original)
+    return resp
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_relay_raw_body(chunked):
+    body = bytes(range(256)) * 1000
+    app_iter = BufferedResponse(upstream_response(body, chunked=chunked), chunk_size=4096)
+    chunks = list(app_iter)
+    app_iter.close()
+    assert b''.join(chunks) == body
+    assert max(len(chunk) for chunk in chunks) <= 4096
+
+
+def test_relay_chunk_size():
+    settings = {'twitcher.ows_proxy_chunk_size': '1024'}
+    assert relay_chunk_size(settings) == 1024
+    assert relay_chunk_size(settings, {'name': 'wms', 'chunk_size': None}) == 1024
+    assert relay_chunk_size(settings, {'name': 'wms', 'chunk_size': 1024 * 1024}) == 1024 * 1024
+    assert relay_chunk_size({}) == 64 * 1024
+
+
+def test_relay_large_body():
+    """
+    Bytes relayed from a large body are the same as those of the content iterator of requests.
+    """
+    body = bytes(range(256)) * (64 * 1024)
+    chunk_size = 64 * 1024
+    expected = b''.join(upstream_response(body).iter_content(chunk_size))
+    app_iter = BufferedResponse(upstream_response(body), chunk_size)
+    relayed = b''.join(app_iter)
+    app_iter.close()
+    assert relayed == expected == body
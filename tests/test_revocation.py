@@ -0,0 +1,137 @@
+import datetime
+import os
+import tempfile
+import time
+import unittest
+import uuid
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from twitcher import models
+from twitcher.models.meta import Base
+from twitcher.revocation import BloomFilter, RevocationList
+from twitcher.tokenstore import purge_expired_tokens
+
+from .test_cache import FakeTimer
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [uuid.uuid4().hex for _ in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
+    assert len(bloom) == 1000
+
+
+class RevocationListTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = sa.create_engine('sqlite:///' + os.path.join(self.tmpdir.name, 'twitcher.sqlite'))
+        Base.metadata.create_all(self.engine)
+        self.timer = FakeTimer()
+        self.hour = datetime.timedelta(hours=1)
+        self.now = datetime.datetime.utcnow()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def revocation_list(self, **kwargs):
+        kwargs.setdefault('refresh_interval', 5)
+        return RevocationList(self.engine, timer=self.timer, **kwargs)
+
+    def revoke(self, revocation, token_id, expires):
+        with Session(self.engine) as session:
+            revocation.revoke(session, token_id, expires)
+            session.commit()
+
+    def test_revoke(self):
+        worker, other = self.revocation_list(), self.revocation_list()
+        assert not worker.is_revoked('a')
+        assert not other.is_revoked('a')
+        self.revoke(worker, 'a', self.now + self.hour)
+        self.revoke(worker, 'a', self.now + self.hour)
+        assert worker.is_revoked('a')
+        assert not worker.is_revoked('b')
+        assert not worker.is_revoked(None)
+        # refreshed by the other workers after the refresh interval
+        assert not other.is_revoked('a')
+        self.timer.now += 5
+        assert other.is_revoked('a')
+        with Session(self.engine) as session:
+            assert session.query(models.RevokedToken).count() == 1
+
+    def test_revoke_rolled_back(self):
+        worker = self.revocation_list()
+        assert not worker.is_revoked('a')
+        with Session(self.engine) as session:
+            worker.revoke(session, 'a', self.now + self.hour)
+            assert not worker.is_revoked('a')
+            session.rollback()
+        assert not worker.is_revoked('a')
+        with Session(self.engine) as session:
+            assert session.query(models.RevokedToken).count() == 0
+
+    def test_revoke_concurrently(self):
+        worker, other = self.revocation_list(), self.revocation_list()
+        assert not other.is_revoked('a')
+        self.revoke(worker, 'a', self.now + self.hour)
+        # already recorded by the other worker, whose revocations are not loaded yet
+        self.revoke(other, 'a', self.now + self.hour)
+        assert worker.is_revoked('a')
+        assert other.is_revoked('a')
+        with Session(self.engine) as session:
+            assert session.query(models.RevokedToken).count() == 1
+
+    def test_reload_forgets_expired(self):
+        self.revoke(self.revocation_list(), 'expired', self.now - self.hour)
+        self.revoke(self.revocation_list(), 'valid', self.now + self.hour)
+        revocation = self.revocation_list(reload_interval=60)
+        assert revocation.is_revoked('valid')
+        assert not revocation.is_revoked('expired')
+        assert len(revocation) == 1
+        assert purge_expired_tokens(self.engine) == 0
+        with Session(self.engine) as session:
+            assert [row.jti for row in session.query(models.RevokedToken)] == ['valid']
+
+    def test_filter_grows(self):
+        revocation = self.revocation_list(capacity=10)
+        assert not revocation.is_revoked('a')
+        with Session(self.engine) as session:
+            for i in range(50):
+                revocation.revoke(session, str(i), self.now + self.hour)
+            session.commit()
+        assert all(revocation.is_revoked(str(i)) for i in range(50))
+        assert not revocation.is_revoked('50')
+
+    def test_database_unavailable(self):
+        revocation = RevocationList(sa.create_engine('sqlite:///' + os.path.join(self.tmpdir.name, 'missing', 'db')),
+                                    timer=self.timer)
+        assert not revocation.is_revoked('a')
+
+    @pytest.mark.slow
+    def test_revocation_benchmark(self):
+        """
+        Cost of the revocation check of valid tokens with 100k revoked tokens.
+        """
+        revoked = [uuid.uuid4().hex for _ in range(100000)]
+        with self.engine.begin() as connection:
+            connection.execute(models.RevokedToken.__table__.insert(), [
+                {'jti': jti, 'expires': self.now + self.hour, 'revoked': self.now} for jti in revoked])
+        revocation = self.revocation_list(refresh_interval=3600)
+        start = time.perf_counter()
+        revocation.reload()
+        reload = time.perf_counter() - start
+        valid = [uuid.uuid4().hex for _ in range(100000)]
+        start = time.perf_counter()
+        false_positives = sum(revocation.is_revoked(jti) for jti in valid)
+        check = (time.perf_counter() - start) / len(valid)
+        print("revocation check with 100k revoked tokens: {:.2f}us, reload: {:.2f}s".format(check * 1e6, reload))
+        assert false_positives == 0
+        assert all(revocation.is_revoked(jti) for jti in revoked[:1000])
+        assert check < 50e-6
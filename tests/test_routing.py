@@ -0,0 +1,58 @@
+import threading
+
+from twitcher.routing import ProcessRouter
+
+SERVICE = {
+    'name': 'emu',
+    'url': 'http://emu/wps',
+    'routes': [
+        {'identifier': 'heavy', 'url': 'http://heavy1/wps', 'max_concurrent': 1},
+        {'identifier': 'heavy', 'url': 'http://heavy2/wps', 'max_concurrent': 1},
+        {'identifier': 'light', 'url': 'http://light/wps', 'max_concurrent': None},
+    ],
+}
+
+
+def test_route_lookup():
+    router = ProcessRouter()
+    assert router.route(SERVICE, 'heavy').urls == ['http://heavy1/wps', 'http://heavy2/wps']
+    assert router.route(SERVICE, 'hello') is None
+    assert router.route(SERVICE, None) is None
+    assert router.route({'name': 'other', 'url': 'http://other/wps', 'routes': []}, 'heavy') is None
+
+
+def test_table_compiled_once():
+    router = ProcessRouter()
+    table = router.table(SERVICE)
+    assert router.table(dict(SERVICE)) is table
+    changed = dict(SERVICE, routes=SERVICE['routes'][:1])
+    assert router.table(changed) is not table
+    assert router.route(changed, 'light') is None
+
+
+def test_concurrency_limit():
+    router = ProcessRouter()
+    route = router.route(SERVICE, 'heavy')
+    first = router.acquire(route)
+    second = router.acquire(route)
+    assert {first, second} == {'http://heavy1/wps', 'http://heavy2/wps'}
+    assert router.acquire(route) is None
+    router.release(route, first)
+    assert router.acquire(route) == first
+    assert router.json()['emu']['heavy']['rejected'] == 1
+
+
+def test_unlimited_route():
+    router = ProcessRouter()
+    route = router.route(SERVICE, 'light')
+    assert all(router.acquire(route) == 'http://light/wps' for _ in range(100))
+
+
+def test_wait_for_free_slot():
+    router = ProcessRouter(timeout=5)
+    route = router.route(dict(SERVICE, routes=SERVICE['routes'][:1]), 'heavy')
+    url = router.acquire(route)
+    timer = threading.Timer(0.05, router.release, args=(route, url))
+    timer.start()
+    assert router.acquire(route) == url
+    timer.join()
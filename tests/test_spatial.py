@@ -0,0 +1,77 @@
+import random
+import time
+
+import pytest
+
+from twitcher.spatial import GridIndex, RegionIndex, extent_allowed, normalize_crs, parse_bbox
+
+
+def test_normalize_crs():
+    assert normalize_crs('EPSG:4326') == ('EPSG:4326', False)
+    assert normalize_crs('urn:ogc:def:crs:EPSG::4326') == ('EPSG:4326', True)
+    assert normalize_crs('http://www.opengis.net/def/crs/EPSG/0/4326') == ('EPSG:4326', True)
+    assert normalize_crs('urn:ogc:def:crs:OGC:1.3:CRS84') == ('CRS:84', True)
+    assert normalize_crs('EPSG:900913') == ('EPSG:3857', False)
+    assert normalize_crs(None) == ('CRS:84', False)
+    with pytest.raises(ValueError):
+        normalize_crs('EPSG:2154')
+
+
+def test_parse_bbox():
+    assert parse_bbox('-10,40,10,50') == (-10.0, 40.0, 10.0, 50.0)
+    assert parse_bbox('40,-10,50,10', 'EPSG:4326', latlon=True) == (-10.0, 40.0, 10.0, 50.0)
+    assert parse_bbox(['40', '-10', '50', '10'], 'urn:ogc:def:crs:EPSG::4326') == (-10.0, 40.0, 10.0, 50.0)
+    minx, miny, maxx, maxy = parse_bbox('-20037508.34,-20037508.34,20037508.34,20037508.34', 'EPSG:3857')
+    assert minx == pytest.approx(-180) and maxx == pytest.approx(180)
+    assert miny == pytest.approx(-85.0511, abs=1e-4) and maxy == pytest.approx(85.0511, abs=1e-4)
+    for value in ('1,2,3', '10,0,0,10', 'a,b,c,d', 'nan,0,1,1'):
+        with pytest.raises(ValueError):
+            parse_bbox(value)
+
+
+def test_grid_index():
+    index = GridIndex(cell_size=5)
+    index.insert((0, 0, 5, 5))
+    index.insert((-20, -20, -11, -11))
+    assert index.containing((1, 1, 2, 2))
+    assert index.containing((5, 5, 5, 5))
+    assert not index.containing((4, 4, 6, 6))
+    assert index.intersecting((4, 4, 6, 6))
+    assert index.intersecting((-180, -90, 180, 90))
+    assert not index.intersecting((6, 6, 10, 10))
+
+
+def test_extent_allowed():
+    index = RegionIndex()
+    index.add((0, 0, 10, 10))
+    index.add((2, 2, 3, 3), allow=False)
+    assert extent_allowed([index], [(5, 5, 6, 6)], restricted=True)
+    assert not extent_allowed([index], [(1, 1, 2.5, 2.5)], restricted=True)
+    assert not extent_allowed([index], [(5, 5, 11, 11)], restricted=True)
+    assert extent_allowed([index], [(5, 5, 11, 11)], restricted=False)
+    assert not extent_allowed([], [(5, 5, 6, 6)], restricted=True)
+
+
+@pytest.mark.slow
+def test_extent_benchmark():
+    """
+    Decision cost with 10k regions, compared with 10 regions.
+    """
+    def decision_cost(count):
+        rand = random.Random(count)
+        index = RegionIndex(cell_size=5)
+        for _ in range(count):
+            x, y = rand.uniform(-180, 170), rand.uniform(-90, 80)
+            index.add((x, y, x + rand.uniform(0.1, 10), y + rand.uniform(0.1, 10)), allow=rand.random() < 0.9)
+        bboxes = []
+        for _ in range(1000):
+            x, y = rand.uniform(-180, 179), rand.uniform(-90, 89)
+            bboxes.append((x, y, x + 1, y + 1))
+        start = time.perf_counter()
+        for i in range(100000):
+            extent_allowed([index], [bboxes[i % 1000]], restricted=True)
+        return (time.perf_counter() - start) / 100000
+
+    small, large = decision_cost(10), decision_cost(10000)
+    print("decision with 10 regions: {:.2f}us, with 10k regions: {:.2f}us".format(small * 1e6, large * 1e6))
+    assert large < 100e-6
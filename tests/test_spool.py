@@ -0,0 +1,72 @@
+from twitcher.spool import ResponseSpool
+
+
+class FakeUpstreamResponse(object):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def test_spool_in_memory():
+    spool = ResponseSpool(memory_size=100, max_memory=1000, max_disk=1000)
+    upstream = FakeUpstreamResponse([b'a' * 10, b'b' * 10])
+    app_iter = spool.spool(upstream)
+    assert upstream.closed, "upstream connection should be released once drained"
+    assert app_iter.length == 20
+    assert spool.metrics.memory_bytes == 20
+    assert spool.metrics.disk_bytes == 0
+    assert b''.join(app_iter) == b'a' * 10 + b'b' * 10
+    app_iter.close()
+    metrics = spool.metrics.json()
+    assert metrics['active'] == 0
+    assert metrics['memory_bytes'] == 0
+    assert metrics['spooled_total'] == 1
+    assert metrics['bytes_total'] == 20
+
+
+def test_spool_spilled_to_disk():
+    spool = ResponseSpool(memory_size=15, max_memory=1000, max_disk=1000)
+    upstream = FakeUpstreamResponse([b'a' * 10, b'b' * 10, b'c' * 10])
+    app_iter = spool.spool(upstream)
+    assert upstream.closed
+    assert app_iter.file._rolled
+    assert app_iter.spilled, "spilled spool should be sent as file by the WSGI server"
+    assert app_iter.fileno() >= 0
+    assert spool.metrics.memory_bytes == 0
+    assert spool.metrics.disk_bytes == 30
+    assert spool.metrics.spilled_total == 1
+    assert b''.join(app_iter) == b'a' * 10 + b'b' * 10 + b'c' * 10
+    app_iter.close()
+    assert spool.metrics.disk_bytes == 0
+
+
+def test_spool_memory_ceiling_spills_to_disk():
+    spool = ResponseSpool(memory_size=100, max_memory=15, max_disk=1000)
+    first = spool.spool(FakeUpstreamResponse([b'a' * 10]))
+    second = spool.spool(FakeUpstreamResponse([b'b' * 10]))
+    assert spool.metrics.memory_bytes == 10
+    assert spool.metrics.disk_bytes == 10
+    assert spool.metrics.active == 2
+    first.close()
+    second.close()
+    assert spool.metrics.active == 0
+
+
+def test_spool_disk_ceiling_streams_remainder():
+    spool = ResponseSpool(memory_size=10, max_memory=1000, max_disk=25)
+    upstream = FakeUpstreamResponse([b'a' * 10, b'b' * 10, b'c' * 10, b'd' * 10])
+    app_iter = spool.spool(upstream)
+    assert not upstream.closed, "upstream connection is still needed for the remaining content"
+    assert app_iter.length is None
+    assert spool.metrics.overflow_total == 1
+    assert b''.join(app_iter) == b'a' * 10 + b'b' * 10 + b'c' * 10 + b'd' * 10
+    app_iter.close()
+    assert upstream.closed
+    assert spool.metrics.disk_bytes == 0
@@ -54,3 +54,40 @@ class ServiceStoreTestCase(BaseTest):
         services = self.service_store.list_services()
         assert len(services) == 1
         self.service_store.clear_services()
+
+    def test_service_store_endpoints(self):
+        self.service_store.save_service(
+            name="pelican",
+            url="http://somewhere.over.the/ocean",
+            endpoints=["http://somewhere.else/ocean"],
+        )
+        service = self.service_store.add_endpoint(name="pelican", url="http://somewhere.beyond/ocean")
+        assert service.json()['endpoints'] == ["http://somewhere.else/ocean", "http://somewhere.beyond/ocean"]
+        # main url and existing endpoints are not duplicated
+        self.service_store.add_endpoint(name="pelican", url="http://somewhere.over.the/ocean")
+        service = self.service_store.add_endpoint(name="pelican", url="http://somewhere.beyond/ocean")
+        assert len(service.endpoints) == 2
+        service = self.service_store.remove_endpoint(name="pelican", url="http://somewhere.else/ocean")
+        assert service.json()['endpoints'] == ["http://somewhere.beyond/ocean"]
+        self.service_store.clear_services()
+        assert self.service_store.list_services() == []
+
+    def test_service_store_routes(self):
+        self.service_store.save_service(
+            name="pelican",
+            url="http://somewhere.over.the/ocean",
+            routes=[{'identifier': 'dive', 'url': "http://somewhere.deep/ocean", 'max_concurrent': 2}],
+        )
+        service = self.service_store.fetch_by_name(name="pelican")
+        assert service.json()['routes'] == [
+            {'identifier': 'dive', 'url': "http://somewhere.deep/ocean", 'max_concurrent': 2}]
+        # routes are replaced
+        service = self.service_store.save_service(
+            name="pelican",
+            url="http://somewhere.over.the/ocean",
+            routes=[{'identifier': 'fly', 'url': "http://somewhere.high/ocean"}],
+        )
+        assert service.json()['routes'] == [
+            {'identifier': 'fly', 'url': "http://somewhere.high/ocean", 'max_concurrent': None}]
+        self.service_store.clear_services()
+        assert self.service_store.list_services() == []
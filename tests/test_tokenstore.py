@@ -0,0 +1,196 @@
+import datetime
+import os
+import tempfile
+import time
+import unittest
+import uuid
+from types import SimpleNamespace
+
+import pytest
+import sqlalchemy as sa
+from pyramid import testing
+from sqlalchemy.orm import Session
+
+from twitcher import models
+from twitcher.models.meta import Base
+from twitcher.oauth2 import RandomTokenValidator
+from twitcher.tokenstore import (
+    DURABILITY_FSYNC,
+    DURABILITY_JOURNAL,
+    TOKEN_PURGER,
+    TokenBuffer,
+    TokenPurger,
+    find_reusable_token,
+    normalize_scope,
+    purge_expired_tokens,
+)
+
+
+class TokenStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = sa.create_engine('sqlite:///' + os.path.join(self.tmpdir.name, 'twitcher.sqlite'))
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(models.Client.__table__.insert(), [{'client_id': 'dev', 'client_secret': 'dev'}])
+        self.now = datetime.datetime.utcnow()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def insert_tokens(self, count, expires, prefix='token'):
+        rows = [{'client_id': 'dev', 'access_token': '{}-{}'.format(prefix, i), 'expires': expires, 'scope': 'compute'}
+                for i in range(count)]
+        with self.engine.begin() as connection:
+            connection.execute(models.Token.__table__.insert(), rows)
+
+    def count_tokens(self):
+        with self.engine.connect() as connection:
+            return connection.execute(sa.select([sa.func.count()]).select_from(models.Token.__table__)).scalar()
+
+    def test_purge_expired_tokens(self):
+        self.insert_tokens(25, self.now - datetime.timedelta(seconds=1), prefix='expired')
+        self.insert_tokens(5, self.now + datetime.timedelta(hours=1), prefix='valid')
+        assert purge_expired_tokens(self.engine, now=self.now, batch_size=10) == 25
+        assert self.count_tokens() == 5
+        assert purge_expired_tokens(self.engine, now=self.now, batch_size=10) == 0
+
+    def test_find_reusable_token(self):
+        hour = datetime.timedelta(hours=1)
+        with self.engine.begin() as connection:
+            connection.execute(models.Token.__table__.insert(), [
+                {'client_id': 'dev', 'access_token': 'a', 'expires': self.now + hour, 'scope': 'compute register'},
+                {'client_id': 'dev', 'access_token': 'b', 'expires': self.now + 2 * hour, 'scope': 'compute register'},
+                {'client_id': 'dev', 'access_token': 'c', 'expires': self.now + 3 * hour, 'scope': 'compute'},
+            ])
+        with Session(self.engine) as session:
+            assert find_reusable_token(session, 'dev', ['register', 'compute'], self.now).access_token == 'b'
+            assert find_reusable_token(session, 'dev', ['compute'], self.now).access_token == 'c'
+            assert find_reusable_token(session, 'dev', ['register', 'compute'], self.now + 3 * hour) is None
+            assert find_reusable_token(session, 'dev', None, self.now) is None
+            assert find_reusable_token(session, 'other', ['compute'], self.now) is None
+        assert normalize_scope(['b', 'a', 'b']) == 'a b'
+        assert normalize_scope([]) is None
+
+    def test_purger(self):
+        self.insert_tokens(3, self.now - datetime.timedelta(seconds=1))
+        purger = TokenPurger(self.engine, interval=0.01)
+        purger.start()
+        try:
+            deadline = time.monotonic() + 5
+            while self.count_tokens() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            purger.stop()
+        assert self.count_tokens() == 0
+
+    def test_includeme(self):
+        config = testing.setUp(settings={'sqlalchemy.url': 'sqlite://', 'twitcher.token_purge_interval': '0'})
+        config.include('twitcher.tokenstore')
+        assert TOKEN_PURGER not in config.registry
+        config = testing.setUp(settings={'sqlalchemy.url': 'sqlite://', 'twitcher.token_purge_interval': '60'})
+        config.include('twitcher.tokenstore')
+        assert config.registry[TOKEN_PURGER].interval == 60
+        testing.tearDown()
+
+    def new_token(self, access_token, scope='compute'):
+        return models.Token(client_id='dev', access_token=access_token, scope=scope, expires_in=3600)
+
+    def test_buffer(self):
+        buffer = TokenBuffer(self.engine, flush_ms=60000, flush_size=1000)
+        try:
+            buffer.add(self.new_token('a'))
+            buffer.add(self.new_token('b', scope='compute register'))
+            assert buffer.get('a').client_id == 'dev'
+            assert buffer.find_reusable_token('dev', ['register', 'compute'], self.now).access_token == 'b'
+            assert buffer.find_reusable_token('dev', ['compute'], self.now + datetime.timedelta(hours=2)) is None
+            assert self.count_tokens() == 0
+            assert buffer.flush() == 2
+            assert buffer.get('a') is None
+            assert self.count_tokens() == 2
+            assert buffer.flush() == 0
+        finally:
+            buffer.close()
+
+    def test_buffer_flush_size(self):
+        buffer = TokenBuffer(self.engine, flush_ms=60000, flush_size=3)
+        try:
+            for i in range(3):
+                buffer.add(self.new_token(str(i)))
+            deadline = time.monotonic() + 5
+            while self.count_tokens() < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert self.count_tokens() == 3
+        finally:
+            buffer.close()
+
+    def test_buffer_flush_on_close(self):
+        buffer = TokenBuffer(self.engine, flush_ms=60000)
+        buffer.add(self.new_token('a'))
+        buffer.close()
+        assert self.count_tokens() == 1
+        assert len(buffer) == 0
+
+    def test_buffer_journal(self):
+        journal_dir = os.path.join(self.tmpdir.name, 'journal')
+        buffer = TokenBuffer(self.engine, flush_ms=60000, durability=DURABILITY_FSYNC, journal_dir=journal_dir)
+        buffer.add(self.new_token('a'))
+        buffer.add(self.new_token('b'))
+        journals = os.listdir(journal_dir)
+        assert len(journals) == 1
+        with open(os.path.join(journal_dir, journals[0])) as journal:
+            lines = journal.readlines()
+        assert len(lines) == 2
+        # journal of a worker which crashed, with an interrupted last line
+        with open(os.path.join(journal_dir, 'tokens-0-crashed.journal'), 'w') as journal:
+            journal.write(lines[0].replace('"a"', '"c"') + lines[1][:10])
+        other = TokenBuffer(self.engine, durability=DURABILITY_JOURNAL, journal_dir=journal_dir)
+        try:
+            # the journal of the running buffer is locked and left alone
+            assert other.replay() == 1
+            assert self.count_tokens() == 1
+            assert sorted(os.listdir(journal_dir)) == journals
+        finally:
+            buffer.close()
+        assert self.count_tokens() == 3
+        assert os.listdir(journal_dir) == []
+
+    def test_buffer_durability(self):
+        with pytest.raises(ValueError):
+            TokenBuffer(self.engine, durability='disk')
+        with pytest.raises(ValueError):
+            TokenBuffer(self.engine, durability=DURABILITY_JOURNAL)
+
+    @pytest.mark.slow
+    def test_validation_benchmark(self):
+        """
+        Token validation, lookup of reusable tokens and purge with 1M stored tokens.
+        """
+        expires = self.now + datetime.timedelta(hours=1)
+        with self.engine.begin() as connection:
+            for batch in range(100):
+                connection.execute(models.Token.__table__.insert(), [
+                    {'client_id': 'dev', 'access_token': uuid.uuid4().hex, 'expires': expires, 'scope': 'compute'}
+                    for _ in range(10000)])
+        self.insert_tokens(1000, self.now + datetime.timedelta(hours=1), prefix='valid')
+        self.insert_tokens(100000, self.now - datetime.timedelta(seconds=1), prefix='expired')
+        validator = RandomTokenValidator()
+        with Session(self.engine) as session:
+            request = SimpleNamespace(dbsession=session)
+            start = time.perf_counter()
+            for i in range(1000):
+                assert validator.validate_bearer_token('valid-{}'.format(i), ['compute'], request)
+            validation = (time.perf_counter() - start) / 1000
+            start = time.perf_counter()
+            for i in range(1000):
+                assert find_reusable_token(session, 'dev', ['compute'], self.now) is not None
+            lookup = (time.perf_counter() - start) / 1000
+        start = time.perf_counter()
+        deleted = purge_expired_tokens(self.engine, now=self.now)
+        purge = time.perf_counter() - start
+        print("with 1.1M tokens, validation: {:.0f}us, reusable token lookup: {:.0f}us, purge of {} tokens: {:.1f}s"
+              .format(validation * 1e6, lookup * 1e6, deleted, purge))
+        assert deleted == 100000
+        assert validation < 1e-3
+        assert lookup < 1e-3
@@ -0,0 +1,61 @@
+import os
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from twitcher.transport import requests_url, unix_session, upstream_send
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class EchoPathHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.path.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def unix_server():
+    tmpdir = tempfile.mkdtemp()
+    server = UnixHTTPServer(os.path.join(tmpdir, 'emu.sock'), EchoPathHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    os.remove(server.server_address)
+    os.rmdir(tmpdir)
+
+
+def test_requests_url():
+    assert requests_url('http+unix:///var/run/emu.sock/wps?service=wps') == \
+        'http+unix://%2Fvar%2Frun%2Femu.sock/wps?service=wps'
+
+
+def test_unix_socket_request(unix_server):
+    send = upstream_send()
+    url = 'http+unix://{}/wps'.format(unix_server.server_address)
+    resp = send('GET', url, params={'service': 'wps', 'request': 'GetCapabilities'})
+    assert resp.status_code == 200
+    assert resp.text == '/wps?service=wps&request=GetCapabilities'
+    resp = send('GET', url + '/outputs')
+    assert resp.text == '/wps/outputs'
+    pool = unix_session().get_adapter(url)._unix_pools[unix_server.server_address]
+    assert pool.num_connections == 1, "Connection to the socket should be reused."
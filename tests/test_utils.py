@@ -42,6 +42,18 @@ def test_baseurl():
         'https://localhost:8094/wps'
     with pytest.raises(ValueError):
         utils.baseurl('ftp://localhost:8094/wps')
+    assert utils.baseurl('http+unix:///var/run/emu.sock/wps?service=wps') == 'http+unix:///var/run/emu.sock/wps'
+    with pytest.raises(ValueError):
+        utils.baseurl('http+unix:///var/run/emu/wps')
+
+
+def test_split_unix_socket_url():
+    assert utils.split_unix_socket_url('http+unix:///var/run/emu.sock/wps?service=wps') == \
+        ('/var/run/emu.sock', '/wps?service=wps')
+    assert utils.split_unix_socket_url('http+unix:///var/run/emu.socket') == ('/var/run/emu.socket', '/')
+    assert utils.split_unix_socket_url('http+unix://%2Fvar%2Frun%2Femu.sock/wps') == ('/var/run/emu.sock', '/wps')
+    assert utils.is_unix_socket_url('http+unix:///var/run/emu.sock/wps')
+    assert not utils.is_unix_socket_url('http://localhost:5000/wps')
 
 
 def test_path_elements():
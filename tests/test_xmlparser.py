@@ -0,0 +1,55 @@
+import lxml.etree
+import pytest
+
+from twitcher import xmlparser
+from twitcher.xmlparser import XMLLimitExceeded, XMLLimits, XMLReader, parse_xml
+
+
+def nested(depth):
+    return b'<a>' * depth + b'</a>' * depth
+
+
+def test_parse_xml():
+    root = parse_xml(b'<Capabilities><Service/></Capabilities>')
+    assert root.tag == 'Capabilities'
+    assert root[0].tag == 'Service'
+
+
+def test_parser_reused():
+    parse_xml(b'<a/>')
+    parser = xmlparser._local.parser
+    assert parse_xml(b'<b><c/></b>').tag == 'b'
+    assert xmlparser._local.parser is parser
+    with pytest.raises(lxml.etree.XMLSyntaxError):
+        parse_xml(b'<a><b>')
+    # parser in an unknown state is discarded
+    assert xmlparser._local.parser is None
+    assert parse_xml(b'<d/>').tag == 'd'
+
+
+def test_entities_not_resolved(tmp_path):
+    secret = tmp_path / 'secret.txt'
+    secret.write_text('secret')
+    xml = '<!DOCTYPE a [<!ENTITY e SYSTEM "file://{}">]><a>&e;</a>'.format(secret).encode()
+    assert b'secret' not in lxml.etree.tostring(parse_xml(xml))
+
+
+def test_depth_limit():
+    limits = XMLLimits(max_depth=10)
+    assert parse_xml(nested(10), limits).tag == 'a'
+    with pytest.raises(XMLLimitExceeded):
+        parse_xml(nested(11), limits)
+
+
+def test_elements_limit():
+    limits = XMLLimits(max_elements=100)
+    with pytest.raises(XMLLimitExceeded):
+        parse_xml(b'<a>' + b'<b/>' * 100 + b'</a>', limits)
+
+
+def test_size_limit_aborts_early():
+    reader = XMLReader(b'<a>' + b'<b/>' * 100000 + b'</a>', XMLLimits(max_size=1000, max_elements=10 ** 6),
+                       chunk_size=100)
+    with pytest.raises(XMLLimitExceeded):
+        reader.close()
+    assert reader.consumed == 1000
@@ -61,6 +61,9 @@ class AdapterInterface(object):
         - :meth:`Request.body`
 
         This method can modified those members to adapt the request for specific service logic.
+
+        The parsed OWS request is available with ``request.ows_request``, shared with the security check,
+        so that it is never parsed again (see :class:`twitcher.owsrequest.OWSRequest`).
         """
         raise NotImplementedError
 
@@ -75,6 +78,20 @@ class AdapterInterface(object):
         """
         raise NotImplementedError
 
+    def offload_allowed(self, service: ServiceConfig) -> bool:
+        """
+        Indicates if the proxied request can be offloaded to the front-end web server.
+
+        .. versionadded:: 0.11.0
+
+        When a service is configured with ``offload`` enabled, the proxied request is not performed by Twitcher.
+        Instead, an internal redirect header is returned for the front-end web server (e.g. `nginx`) to proxy the
+        request itself. Because the body is never seen by Twitcher in that case, :meth:`request_hook`,
+        :meth:`send_request` and :meth:`response_hook` are all bypassed. The adapter must therefore explicitly
+        declare that skipping them is safe for the given service. Returns ``False`` by default.
+        """
+        return False
+
     def send_request(self, request: Request, service: ServiceConfig) -> Response:
         """
         Performs the provided request in order to obtain a proxied response.
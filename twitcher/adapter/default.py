@@ -4,7 +4,6 @@ Factories to create storage backends.
 
 from twitcher.adapter.base import AdapterInterface
 from twitcher.models.service import ServiceConfig
-from twitcher.owsproxy import send_request
 from twitcher.owssecurity import OWSSecurity
 from twitcher.owsregistry import OWSRegistry
 from twitcher.store import ServiceStore
@@ -48,5 +47,18 @@ class DefaultAdapter(AdapterInterface):
     def response_hook(self, response, service):
         return response
 
+    def offload_allowed(self, service: ServiceConfig) -> bool:
+        # responses of WPS services are checked for their content type and their URLs are replaced
+        if str(service.get('type') or 'wps').lower() == 'wps':
+            return False
+        # hooks of this adapter do nothing, but derived implementations could override them
+        cls = type(self)
+        return (
+            cls.request_hook is DefaultAdapter.request_hook and
+            cls.response_hook is DefaultAdapter.response_hook and
+            cls.send_request is DefaultAdapter.send_request
+        )
+
     def send_request(self, request: Request, service: ServiceConfig) -> Response:
+        from twitcher.owsproxy import send_request
         return send_request(request, service)
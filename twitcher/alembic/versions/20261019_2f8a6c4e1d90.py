@@ -0,0 +1,23 @@
+"""index tokens by client
+
+Revision ID: 2f8a6c4e1d90
+Revises: 9e3b7c5d2a18
+Create Date: 2026-10-19 23:02:51.640913
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2f8a6c4e1d90'
+down_revision = '9e3b7c5d2a18'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('token', schema=None) as batch_op:
+        batch_op.create_index('ix_token_client_id_expires', ['client_id', 'expires'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('token', schema=None) as batch_op:
+        batch_op.drop_index('ix_token_client_id_expires')
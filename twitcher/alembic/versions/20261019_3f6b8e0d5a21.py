@@ -0,0 +1,35 @@
+"""add policy rules
+
+Revision ID: 3f6b8e0d5a21
+Revises: e4a9c2d17b06
+Create Date: 2026-10-19 18:20:44.915362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6b8e0d5a21'
+down_revision = 'e4a9c2d17b06'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('policy_rules',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('service', sa.String(length=40), nullable=False),
+    sa.Column('request', sa.String(length=40), nullable=False),
+    sa.Column('identifier', sa.String(length=255), nullable=False),
+    sa.Column('subject', sa.String(length=255), nullable=False),
+    sa.Column('effect', sa.String(length=10), nullable=False),
+    sa.Column('updated', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_policy_rules'))
+    )
+    with op.batch_alter_table('policy_rules', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_policy_rules_updated'), ['updated'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('policy_rules', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_policy_rules_updated'))
+    op.drop_table('policy_rules')
@@ -0,0 +1,41 @@
+"""hash client secrets
+
+Revision ID: 5a7d3e9c1b46
+Revises: c41f9a6b2e87
+Create Date: 2026-10-19 22:05:14.532871
+
+Secrets are replaced by their salted hash, which cannot be reverted: the downgrade only restores
+the unique index and keeps the column wide enough for the hashes.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from twitcher.passwords import hash_password, is_hashed
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7d3e9c1b46'
+down_revision = 'c41f9a6b2e87'
+branch_labels = None
+depends_on = None
+
+client = sa.table(
+    'client',
+    sa.column('client_id', sa.String),
+    sa.column('client_secret', sa.String),
+)
+
+def upgrade():
+    with op.batch_alter_table('client', schema=None) as batch_op:
+        batch_op.drop_index('ix_client_client_secret')
+        batch_op.alter_column('client_secret', existing_type=sa.String(length=55), type_=sa.String(length=255),
+                              existing_nullable=False)
+    conn = op.get_bind()
+    for client_id, client_secret in conn.execute(sa.select([client.c.client_id, client.c.client_secret])).fetchall():
+        if not is_hashed(client_secret):
+            conn.execute(client.update().where(client.c.client_id == client_id).values(
+                client_secret=hash_password(client_secret)))
+
+def downgrade():
+    with op.batch_alter_table('client', schema=None) as batch_op:
+        batch_op.create_index('ix_client_client_secret', ['client_secret'], unique=True)
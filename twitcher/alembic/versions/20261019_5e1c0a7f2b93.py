@@ -0,0 +1,24 @@
+"""add service offload
+
+Revision ID: 5e1c0a7f2b93
+Revises: d9cff565b8db
+Create Date: 2026-10-19 09:12:31.512473
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1c0a7f2b93'
+down_revision = 'd9cff565b8db'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('services', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('_offload', sa.Integer(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('services', schema=None) as batch_op:
+        batch_op.drop_column('_offload')
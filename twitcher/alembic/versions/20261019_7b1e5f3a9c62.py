@@ -0,0 +1,34 @@
+"""add revoked tokens
+
+Revision ID: 7b1e5f3a9c62
+Revises: 2f8a6c4e1d90
+Create Date: 2026-10-19 23:36:18.904127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b1e5f3a9c62'
+down_revision = '2f8a6c4e1d90'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('revoked_token',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('jti', sa.String(length=255), nullable=False),
+    sa.Column('expires', sa.DateTime(), nullable=True),
+    sa.Column('revoked', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_revoked_token'))
+    )
+    op.create_index(op.f('ix_revoked_token_jti'), 'revoked_token', ['jti'], unique=True)
+    op.create_index(op.f('ix_revoked_token_expires'), 'revoked_token', ['expires'], unique=False)
+    op.create_index(op.f('ix_revoked_token_revoked'), 'revoked_token', ['revoked'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_revoked_token_revoked'), table_name='revoked_token')
+    op.drop_index(op.f('ix_revoked_token_expires'), table_name='revoked_token')
+    op.drop_index(op.f('ix_revoked_token_jti'), table_name='revoked_token')
+    op.drop_table('revoked_token')
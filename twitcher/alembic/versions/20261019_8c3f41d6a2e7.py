@@ -0,0 +1,32 @@
+"""add service endpoints
+
+Revision ID: 8c3f41d6a2e7
+Revises: 5e1c0a7f2b93
+Create Date: 2026-10-19 11:02:47.208336
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3f41d6a2e7'
+down_revision = '5e1c0a7f2b93'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('service_endpoints',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('url', sa.String(length=255), nullable=False),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], name=op.f('fk_service_endpoints_service_id_services'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_service_endpoints'))
+    )
+    with op.batch_alter_table('service_endpoints', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_service_endpoints_service_id'), ['service_id'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('service_endpoints', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_service_endpoints_service_id'))
+    op.drop_table('service_endpoints')
@@ -0,0 +1,24 @@
+"""add layer to policy rules
+
+Revision ID: 8d2c5f71a9e4
+Revises: 3f6b8e0d5a21
+Create Date: 2026-10-19 20:05:12.407561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2c5f71a9e4'
+down_revision = '3f6b8e0d5a21'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('policy_rules', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('layer', sa.String(length=255), nullable=False, server_default='*'))
+
+def downgrade():
+    with op.batch_alter_table('policy_rules', schema=None) as batch_op:
+        batch_op.drop_column('layer')
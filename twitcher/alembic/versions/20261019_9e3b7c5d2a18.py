@@ -0,0 +1,25 @@
+"""index tokens
+
+Revision ID: 9e3b7c5d2a18
+Revises: 5a7d3e9c1b46
+Create Date: 2026-10-19 22:41:07.318452
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b7c5d2a18'
+down_revision = '5a7d3e9c1b46'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('token', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_token_access_token'), ['access_token'], unique=True)
+        batch_op.create_index(batch_op.f('ix_token_expires'), ['expires'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('token', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_token_expires'))
+        batch_op.drop_index(batch_op.f('ix_token_access_token'))
@@ -0,0 +1,24 @@
+"""add service chunk size
+
+Revision ID: b7e2d94c1f35
+Revises: 8c3f41d6a2e7
+Create Date: 2026-10-19 14:27:05.318920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d94c1f35'
+down_revision = '8c3f41d6a2e7'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('services', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('chunk_size', sa.Integer(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('services', schema=None) as batch_op:
+        batch_op.drop_column('chunk_size')
@@ -0,0 +1,24 @@
+"""add bbox to policy rules
+
+Revision ID: c41f9a6b2e87
+Revises: 8d2c5f71a9e4
+Create Date: 2026-10-19 21:12:36.180245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f9a6b2e87'
+down_revision = '8d2c5f71a9e4'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    with op.batch_alter_table('policy_rules', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('bbox', sa.String(length=255), nullable=False, server_default='*'))
+
+def downgrade():
+    with op.batch_alter_table('policy_rules', schema=None) as batch_op:
+        batch_op.drop_column('bbox')
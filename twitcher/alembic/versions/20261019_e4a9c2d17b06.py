@@ -0,0 +1,34 @@
+"""add service routes
+
+Revision ID: e4a9c2d17b06
+Revises: b7e2d94c1f35
+Create Date: 2026-10-19 16:48:12.603217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c2d17b06'
+down_revision = 'b7e2d94c1f35'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('service_routes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('service_id', sa.Integer(), nullable=False),
+    sa.Column('identifier', sa.String(length=255), nullable=False),
+    sa.Column('url', sa.String(length=255), nullable=False),
+    sa.Column('max_concurrent', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['service_id'], ['services.id'], name=op.f('fk_service_routes_service_id_services'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_service_routes'))
+    )
+    with op.batch_alter_table('service_routes', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_service_routes_service_id'), ['service_id'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('service_routes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_service_routes_service_id'))
+    op.drop_table('service_routes')
@@ -3,6 +3,14 @@ from cornice import Service
 from cornice.validators import colander_body_validator
 
 from twitcher.__version__ import __version__
+from twitcher.balancer import OWS_PROXY_BALANCER
+from twitcher.dnscache import OWS_PROXY_DNS_CACHE
+from twitcher.healthcheck import OWS_HEALTH_CHECKER, HEALTH_UNKNOWN
+from twitcher import models
+from twitcher.hedging import OWS_PROXY_HEDGER
+from twitcher.policy import OWS_POLICY, POLICY_EFFECTS, normalize_rule
+from twitcher.routing import OWS_PROXY_ROUTER
+from twitcher.spool import OWS_PROXY_SPOOL
 
 
 import logging
@@ -19,6 +27,50 @@ service = Service(name='service',
                   permission='view',
                   description="Get or remove a service item")
 
+service_endpoints = Service(name='service_endpoints',
+                            path='/services/{name}/endpoints',
+                            permission='view',
+                            description="List, add or remove upstream endpoints of a service")
+
+service_health = Service(name='service_health',
+                         path='/services/{name}/health',
+                         permission='view',
+                         description="Get the health of a service")
+
+policies = Service(name='policies',
+                   path='/policies',
+                   permission='view',
+                   description="List or add access policy rules")
+
+policy = Service(name='policy',
+                 path='/policies/{id}',
+                 permission='view',
+                 description="Remove an access policy rule")
+
+metrics = Service(name='metrics',
+                  path='/metrics',
+                  permission='view',
+                  description="Get usage metrics of the worker")
+
+
+class EndpointsSchema(colander.SequenceSchema):
+    endpoint = colander.SchemaNode(colander.String(),
+                                   description='Upstream endpoint URL')
+
+
+class RouteSchema(colander.MappingSchema):
+    identifier = colander.SchemaNode(colander.String(),
+                                     description='WPS process identifier')
+    url = colander.SchemaNode(colander.String(),
+                              description='Backend URL executing the process')
+    max_concurrent = colander.SchemaNode(colander.Integer(),
+                                         missing=None, validator=colander.Range(min=1),
+                                         description='Maximum concurrent requests to the backend URL')
+
+
+class RoutesSchema(colander.SequenceSchema):
+    route = RouteSchema()
+
 
 # Register service request schema
 class ServicesPostBodySchema(colander.MappingSchema):
@@ -38,6 +90,45 @@ class ServicesPostBodySchema(colander.MappingSchema):
     auth = colander.SchemaNode(colander.String(),
                                missing=colander.drop, default='token',
                                description='Authentication method')
+    offload = colander.SchemaNode(colander.Boolean(),
+                                  missing=colander.drop, default=False,
+                                  description='Offload proxied requests to the front-end web server')
+    chunk_size = colander.SchemaNode(colander.Integer(),
+                                     missing=colander.drop, validator=colander.Range(min=1),
+                                     description='Size in bytes of the relayed response chunks')
+    endpoints = EndpointsSchema(missing=colander.drop,
+                                description='Additional upstream endpoints replicating the service URL')
+    routes = RoutesSchema(missing=colander.drop,
+                          description='Routes of process identifiers to dedicated backend URLs')
+
+
+class EndpointPostBodySchema(colander.MappingSchema):
+    url = colander.SchemaNode(colander.String(),
+                              description='Upstream endpoint URL')
+
+
+class PolicyRulePostBodySchema(colander.MappingSchema):
+    service = colander.SchemaNode(colander.String(),
+                                  missing='*',
+                                  description='Service name')
+    request = colander.SchemaNode(colander.String(),
+                                  missing='*',
+                                  description='OWS request type')
+    identifier = colander.SchemaNode(colander.String(),
+                                     missing='*',
+                                     description='WPS process identifier')
+    layer = colander.SchemaNode(colander.String(),
+                                missing='*',
+                                description='WMS layer name')
+    bbox = colander.SchemaNode(colander.String(),
+                               missing='*',
+                               description='Region as minx,miny,maxx,maxy in longitude/latitude')
+    subject = colander.SchemaNode(colander.String(),
+                                  missing='*',
+                                  description="Subject: '*', 'cert', 'client:<client_id>' or 'scope:<scope>'")
+    effect = colander.SchemaNode(colander.String(),
+                                 missing='allow', validator=colander.OneOf(POLICY_EFFECTS),
+                                 description='Effect of the rule: allow or deny')
 
 
 # Create our cornice service views
@@ -77,6 +168,86 @@ class TwitcherAPI(object):
         """Remove registered service."""
         return request.owsregistry.unregister_service(name=request.matchdict['name'])
 
+    @staticmethod
+    @service_endpoints.get(tags=['service', 'endpoints'])
+    def list_service_endpoints(request):
+        """List upstream endpoints of a registered service."""
+        service = request.owsregistry.get_service_by_name(name=request.matchdict['name'])
+        return service.get('endpoints', [])
+
+    @staticmethod
+    @service_endpoints.post(tags=['service', 'endpoints'],
+                            validators=(colander_body_validator, ),
+                            schema=EndpointPostBodySchema())
+    def add_service_endpoint(request):
+        """Add an upstream endpoint to a registered service."""
+        return request.owsregistry.add_service_endpoint(name=request.matchdict['name'], url=request.validated['url'])
+
+    @staticmethod
+    @service_endpoints.delete(tags=['service', 'endpoints'])
+    def remove_service_endpoint(request):
+        """Remove an upstream endpoint, given by the 'url' query parameter, from a registered service."""
+        return request.owsregistry.remove_service_endpoint(name=request.matchdict['name'],
+                                                           url=request.params.get('url', ''))
+
+    @staticmethod
+    @service_health.get(tags=['service', 'health'])
+    def get_service_health(request):
+        """Get the latest health check of a registered service."""
+        name = request.matchdict['name']
+        checker = request.registry.get(OWS_HEALTH_CHECKER)
+        health = checker.get(name) if checker is not None else None
+        return health or {'name': name, 'status': HEALTH_UNKNOWN}
+
+    @staticmethod
+    @policies.get(tags=['policies', 'list'])
+    def list_policy_rules(request):
+        """List access policy rules stored in the database."""
+        return [rule.json() for rule in request.dbsession.query(models.PolicyRule).all()]
+
+    @staticmethod
+    @policies.post(tags=['policies', 'add'],
+                   validators=(colander_body_validator, ),
+                   schema=PolicyRulePostBodySchema())
+    def add_policy_rule(request):
+        """Add an access policy rule, applied once the policy is reloaded."""
+        rule = models.PolicyRule(**normalize_rule(request.validated))
+        request.dbsession.add(rule)
+        request.dbsession.flush()
+        return rule.json()
+
+    @staticmethod
+    @policy.delete(tags=['policies', 'remove'])
+    def remove_policy_rule(request):
+        """Remove an access policy rule, applied once the policy is reloaded."""
+        query = request.dbsession.query(models.PolicyRule)
+        return bool(query.filter(models.PolicyRule.id == request.matchdict['id']).delete())
+
+    @staticmethod
+    @metrics.get(tags=['metrics'])
+    def get_metrics(request):
+        """Get usage metrics of the worker handling the request."""
+        body = {}
+        spool = request.registry.get(OWS_PROXY_SPOOL)
+        if spool is not None:
+            body['spool'] = spool.metrics.json()
+        balancer = request.registry.get(OWS_PROXY_BALANCER)
+        if balancer is not None:
+            body['endpoints'] = balancer.json()
+        dns_cache = request.registry.get(OWS_PROXY_DNS_CACHE)
+        if dns_cache is not None:
+            body['dns'] = dns_cache.json()
+        hedger = request.registry.get(OWS_PROXY_HEDGER)
+        if hedger is not None:
+            body['hedging'] = hedger.json()
+        policy_engine = request.registry.get(OWS_POLICY)
+        if policy_engine is not None:
+            body['policy'] = policy_engine.json()
+        router = request.registry.get(OWS_PROXY_ROUTER)
+        if router is not None:
+            body['routes'] = router.json()
+        return body
+
 
 def includeme(config):
     config.include('twitcher.basicauth')
@@ -0,0 +1,171 @@
+"""
+Load balancing between the upstream endpoints of a service.
+
+A service can define additional ``endpoints`` replicating its main ``url``. For each proxied request,
+one of them is selected according to the configured strategy:
+
+*least_outstanding*
+    The endpoint with the fewest requests in progress from this worker.
+
+*ewma*
+    The endpoint with the lowest exponentially weighted moving average of its response latency,
+    weighted by the requests in progress.
+
+Endpoints are tracked passively. A connection error or a ``5xx`` status marks the endpoint unhealthy for
+a delay that doubles on each consecutive failure, after which it is admitted again. Only when every endpoint
+is unhealthy, the one to be admitted first is selected anyway.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_PROXY_BALANCER = 'owsproxy_balancer'
+
+BALANCER_STRATEGIES = ('least_outstanding', 'ewma')
+
+
+class EndpointState(object):
+    def __init__(self) -> None:
+        self.outstanding = 0
+        self.ewma = 0.0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    def json(self) -> Dict[str, Number]:
+        return {
+            'outstanding': self.outstanding,
+            'ewma': self.ewma,
+            'failures': self.failures,
+            'unhealthy_until': self.unhealthy_until,
+        }
+
+
+class UpstreamBalancer(object):
+    """
+    Selects upstream endpoints and tracks their load and health within the worker.
+    """
+
+    def __init__(self,
+                 strategy: str = 'least_outstanding',
+                 decay: float = 0.3,
+                 backoff: Number = 1,
+                 max_backoff: Number = 300,
+                 timer: Callable[[], float] = time.monotonic,
+                 ) -> None:
+        if strategy not in BALANCER_STRATEGIES:
+            raise ValueError("Unknown balancer strategy: {}".format(strategy))
+        self.strategy = strategy
+        self.decay = decay
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timer = timer
+        self._states = {}  # type: Dict[str, EndpointState]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'UpstreamBalancer':
+        settings = get_settings(container)
+        return cls(
+            strategy=settings.get('twitcher.ows_proxy_balancer', 'least_outstanding'),
+            decay=float(settings.get('twitcher.ows_proxy_balancer_decay', 0.3)),
+            backoff=float(settings.get('twitcher.ows_proxy_balancer_backoff', 1)),
+            max_backoff=float(settings.get('twitcher.ows_proxy_balancer_max_backoff', 300)),
+        )
+
+    def _state(self, url: str) -> EndpointState:
+        state = self._states.get(url)
+        if state is None:
+            state = self._states[url] = EndpointState()
+        return state
+
+    def _score(self, state: EndpointState) -> float:
+        if self.strategy == 'ewma':
+            return state.ewma * (state.outstanding + 1)
+        return state.outstanding
+
+    def is_healthy(self, url: str) -> bool:
+        with self._lock:
+            state = self._states.get(url)
+            return state is None or state.unhealthy_until <= self.timer()
+
+    def select(self, urls: List[str]) -> str:
+        """
+        Selects the endpoint to employ amongst the given URLs.
+        """
+        if len(urls) == 1:
+            return urls[0]
+        with self._lock:
+            now = self.timer()
+            states = [(url, self._state(url)) for url in urls]
+            healthy = [(url, state) for url, state in states if state.unhealthy_until <= now]
+            if not healthy:
+                return min(states, key=lambda item: item[1].unhealthy_until)[0]
+            best = min(self._score(state) for _, state in healthy)
+            return random.choice([url for url, state in healthy if self._score(state) == best])
+
+    def acquire(self, url: str) -> None:
+        with self._lock:
+            self._state(url).outstanding += 1
+
+    def release(self, url: str, latency: Optional[float] = None, failed: bool = False) -> None:
+        """
+        Records the outcome of a request to the endpoint.
+
+        :param url: endpoint URL.
+        :param latency: seconds until the response headers were received, if any.
+        :param failed: whether the request failed due to the endpoint (connection error or ``5xx`` status).
+        """
+        with self._lock:
+            state = self._state(url)
+            state.outstanding = max(state.outstanding - 1, 0)
+            if latency is not None:
+                if state.ewma:
+                    state.ewma = self.decay * latency + (1 - self.decay) * state.ewma
+                else:
+                    state.ewma = latency
+            if failed:
+                state.failures += 1
+                delay = min(self.backoff * 2 ** (state.failures - 1), self.max_backoff)
+                state.unhealthy_until = self.timer() + delay
+                LOGGER.warning("Upstream endpoint [%s] marked unhealthy for %ss.", url, delay)
+            else:
+                state.failures = 0
+                state.unhealthy_until = 0.0
+
+    @contextmanager
+    def track(self, url: str) -> Iterator[Dict[str, bool]]:
+        """
+        Tracks a request to the endpoint. The caller can set ``failed`` in the yielded outcome.
+
+        Raised errors are considered connection failures.
+        """
+        outcome = {'failed': False}
+        self.acquire(url)
+        start = self.timer()
+        try:
+            yield outcome
+        except Exception:
+            self.release(url, failed=True)
+            raise
+        self.release(url, latency=self.timer() - start, failed=outcome['failed'])
+
+    def json(self) -> Dict[str, Dict[str, Number]]:
+        with self._lock:
+            return {url: state.json() for url, state in self._states.items()}
+
+
+def service_endpoints(service: Dict) -> List[str]:
+    """
+    All upstream URLs of the service, starting with its main URL.
+    """
+    urls = [service['url']]
+    urls.extend(url for url in service.get('endpoints') or [] if url not in urls)
+    return urls
@@ -3,7 +3,14 @@ Basic Authentication.
 
 Taken from:
 https://docs.pylonsproject.org/projects/pyramid-cookbook/en/latest/auth/basic.html
+
+Administrators are configured with ``twitcher.username`` and ``twitcher.password``, and additional ones with
+``twitcher.users`` (one ``username:password`` per line). Passwords can be stored hashed (see
+:mod:`twitcher.passwords`), and successful verifications are cached for ``twitcher.basicauth_cache_ttl`` seconds.
+The cache is created again with the configuration, and is thus dropped when it is reloaded.
 """
+from typing import Dict
+
 from pyramid.settings import asbool
 from pyramid.authentication import BasicAuthAuthenticationPolicy
 from pyramid.authorization import ACLAuthorizationPolicy
@@ -16,8 +23,12 @@ from pyramid.security import (
     forget)
 from pyramid.view import forbidden_view_config
 
+from twitcher.passwords import PasswordVerifier
+from twitcher.typedefs import AnySettingsContainer, Number
 from twitcher.utils import get_settings
 
+BASICAUTH_USERS = 'basicauth_users'
+
 
 @forbidden_view_config()
 def forbidden_view(request):
@@ -31,11 +42,45 @@ def forbidden_view(request):
     return response
 
 
+class BasicAuthUsers(object):
+    """
+    Passwords of the administrators, and cache of their successful verifications.
+    """
+
+    def __init__(self, users: Dict[str, str], cache_ttl: Number = 60, cache_size: int = 128) -> None:
+        self.users = users
+        self.verifier = PasswordVerifier(cache_ttl=cache_ttl, cache_size=cache_size)
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'BasicAuthUsers':
+        settings = get_settings(container)
+        users = {}
+        if settings.get('twitcher.username'):
+            users[settings['twitcher.username']] = settings.get('twitcher.password') or ''
+        for line in (settings.get('twitcher.users') or '').splitlines():
+            username, sep, password = line.strip().partition(':')
+            if username and sep:
+                users[username] = password
+        return cls(users,
+                   cache_ttl=float(settings.get('twitcher.basicauth_cache_ttl', 60)),
+                   cache_size=int(settings.get('twitcher.basicauth_cache_size', 128)))
+
+    def check(self, username: str, password: str) -> bool:
+        stored = self.users.get(username)
+        if stored is None:
+            return self.verifier.reject(password)
+        return self.verifier.verify(username, password, stored)
+
+
+def get_basicauth_users(request) -> BasicAuthUsers:
+    users = request.registry.get(BASICAUTH_USERS)
+    if users is None:
+        users = request.registry[BASICAUTH_USERS] = BasicAuthUsers.from_settings(request)
+    return users
+
+
 def check_credentials(username, password, request):
-    settings = request.registry.settings
-    _username = settings['twitcher.username']
-    _password = settings['twitcher.password']
-    if username == _username and password == _password:
+    if get_basicauth_users(request).check(username, password):
         # an empty list is enough to indicate logged-in
         return []
 
@@ -50,6 +95,7 @@ class Root:
 def includeme(config):
     settings = get_settings(config)
     if asbool(settings.get('twitcher.basicauth', True)):
+        config.registry[BASICAUTH_USERS] = BasicAuthUsers.from_settings(settings)
         authn_policy = BasicAuthAuthenticationPolicy(check=check_credentials, debug=True)
         authz_policy = ACLAuthorizationPolicy()
         config.set_authorization_policy(authz_policy)
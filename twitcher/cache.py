@@ -0,0 +1,84 @@
+"""
+In-memory caches shared by Twitcher components.
+
+Caches are local to the worker process. They are meant to avoid repeating costly operations
+(database queries, token validations, parsing) within a short period, not to share state between workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from twitcher.typedefs import Number
+
+
+class ExpiringCache(object):
+    """
+    Thread-safe cache of bounded size where each entry expires after a given time-to-live.
+
+    Once ``maxsize`` entries are stored, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Number = 60, timer: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the value stored under ``key`` if it has not yet expired, or ``default`` otherwise.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires <= self.timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[Number] = None) -> None:
+        """
+        Stores the ``value`` under ``key`` for ``ttl`` seconds.
+
+        The time-to-live can only shorten the default one of the cache, which is used if omitted.
+        Nothing is stored if the resulting time-to-live is not positive.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self.timer() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def evict(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """
+        Removes the entries for which ``predicate(key, value)`` is true, and returns how many were removed.
+        """
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self) -> int:
+        return len(self._data)
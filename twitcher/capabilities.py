@@ -0,0 +1,284 @@
+"""
+Filtering of the layers listed by WMS capabilities documents.
+
+The document is filtered while it is streamed from the upstream service: parser events are written back
+as soon as they are received, without building any tree. The events of a ``Layer`` element are only held
+until its ``Name`` is known, and the whole element, including its nested layers, is dropped if its name
+is hidden from the client.
+
+Filtered documents depend only on the set of hidden layers, and are therefore cached per set of hidden layers
+(see :meth:`twitcher.policy.PolicyTable.hidden_layers`) for ``twitcher.wms_capabilities_cache_ttl`` seconds,
+and shared by all clients with the same layer restrictions.
+"""
+from typing import FrozenSet, Hashable, Iterable, Iterator, Optional
+
+import lxml.etree
+from pyramid.request import Request
+from requests.models import Response as RequestsResponse
+
+from twitcher.cache import ExpiringCache
+from twitcher.models.service import ServiceConfig
+from twitcher.owsexceptions import OWSException
+from twitcher.owsrequest import OWSRequest
+from twitcher.policy import request_hidden_layers
+from twitcher.typedefs import AnySettingsContainer
+from twitcher.utils import get_settings
+from twitcher.xmlparser import PARSER_OPTIONS, XMLLimitExceeded, XMLLimits
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+WMS_CAPABILITIES_CACHE = 'wms_capabilities_cache'
+
+
+def localname(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+class _Output(object):
+    def __init__(self) -> None:
+        self.parts = []
+
+    def write(self, data: bytes) -> None:
+        self.parts.append(data)
+
+    def pop(self) -> bytes:
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+class CapabilitiesFilter(object):
+    """
+    Parser target writing back the events of the document, except those of hidden layers.
+    """
+
+    def __init__(self, hidden: FrozenSet[str], limits: Optional[XMLLimits] = None) -> None:
+        self.hidden = hidden
+        self.limits = limits or XMLLimits()
+        self.output = _Output()
+        self._xmlfile = lxml.etree.xmlfile(self.output, encoding='utf-8', buffered=False)
+        self._xf = self._xmlfile.__enter__()
+        self._xf.write_declaration()
+        self._elements = []
+        self._started = False
+        self._depth = 0
+        self._count = 0
+        self._nsmap = {}
+        self._skip = 0  # depth within a dropped layer
+        self._pending = None  # output of the layer held until its name is known
+        self._pending_depth = 0
+        self._name = None  # text of the name of the held layer
+
+    # parser target interface
+
+    def doctype(self, name: str, pubid: Optional[str], system: Optional[str]) -> None:
+        doctype = '<!DOCTYPE {}'.format(name)
+        if pubid:
+            doctype += ' PUBLIC "{}" "{}"'.format(pubid, system or '')
+        elif system:
+            doctype += ' SYSTEM "{}"'.format(system)
+        self._xf.write_doctype(doctype + '>')
+
+    def start_ns(self, prefix: str, uri: str) -> None:
+        self._nsmap[prefix or None] = uri
+
+    def start(self, tag: str, attrib: dict) -> None:
+        self._depth += 1
+        self._count += 1
+        if self._depth > self.limits.max_depth:
+            raise XMLLimitExceeded("XML document is nested deeper than {} elements".format(self.limits.max_depth))
+        if self._count > self.limits.max_elements:
+            raise XMLLimitExceeded("XML document has more than {} elements".format(self.limits.max_elements))
+        nsmap, self._nsmap = self._nsmap, {}
+        if self._skip:
+            self._skip += 1
+            return
+        # without entity substitution, libxml2 reports ampersands of attribute values as character references
+        attrib = {key: value.replace('&#38;', '&') for key, value in attrib.items()}
+        is_layer = localname(tag) == 'Layer'
+        if self._pending is not None:
+            if is_layer:
+                # nested layer before the name of its parent, which is a category kept with its allowed children
+                self._release()
+            else:
+                self._pending_depth += 1
+                if self._pending_depth == 1 and localname(tag) == 'Name':
+                    self._name = []
+                self._pending.append((self._start, (tag, attrib, nsmap)))
+                return
+        if is_layer:
+            self._pending = [(self._start, (tag, attrib, nsmap))]
+            self._pending_depth = 0
+            return
+        self._start(tag, attrib, nsmap)
+
+    def end(self, tag: str) -> None:
+        self._depth -= 1
+        if self._skip:
+            self._skip -= 1
+            return
+        if self._pending is not None:
+            if self._pending_depth == 0:
+                # layer without name
+                self._release()
+            else:
+                self._pending_depth -= 1
+                self._pending.append((self._end, ()))
+                if self._name is not None and self._pending_depth == 0:
+                    name, self._name = ''.join(self._name).strip(), None
+                    if name in self.hidden:
+                        self._pending = None
+                        self._skip = 1
+                    else:
+                        self._release()
+                return
+        self._end()
+
+    def data(self, data: str) -> None:
+        if self._skip:
+            return
+        if self._pending is not None:
+            if self._name is not None:
+                self._name.append(data)
+            self._pending.append((self._xf.write, (data, )))
+            return
+        self._xf.write(data)
+
+    def comment(self, text: str) -> None:
+        self._write_node(lxml.etree.Comment(text))
+
+    def pi(self, target: str, data: Optional[str] = None) -> None:
+        self._write_node(lxml.etree.ProcessingInstruction(target, data))
+
+    def close(self) -> None:
+        # also called when parsing fails, in which case the output is left incomplete
+        if self._started and not self._elements:
+            self._xmlfile.__exit__(None, None, None)
+
+    # output
+
+    def _write_node(self, node) -> None:
+        if self._skip:
+            return
+        if self._pending is not None:
+            self._pending.append((self._xf.write, (node, )))
+            return
+        self._xf.write(node)
+
+    def _start(self, tag: str, attrib: dict, nsmap: dict) -> None:
+        self._started = True
+        element = self._xf.element(tag, attrib, nsmap=nsmap or None)
+        element.__enter__()
+        self._elements.append(element)
+
+    def _end(self) -> None:
+        self._elements.pop().__exit__(None, None, None)
+
+    def _release(self) -> None:
+        events, self._pending, self._name = self._pending, None, None
+        for write, args in events:
+            write(*args)
+
+
+def filter_capabilities(chunks: Iterable[bytes],
+                        hidden: FrozenSet[str],
+                        limits: Optional[XMLLimits] = None,
+                        ) -> Iterator[bytes]:
+    """
+    Streams the WMS capabilities document received in ``chunks`` without its ``hidden`` layers.
+
+    :raises lxml.etree.XMLSyntaxError: if the document is not well-formed.
+    :raises XMLLimitExceeded: if the document exceeds one of the limits.
+    """
+    limits = limits or XMLLimits()
+    target = CapabilitiesFilter(hidden, limits)
+    parser = lxml.etree.XMLParser(target=target, **PARSER_OPTIONS)
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > limits.max_size:
+            raise XMLLimitExceeded("XML document is larger than {} bytes".format(limits.max_size))
+        parser.feed(chunk)
+        data = target.output.pop()
+        if data:
+            yield data
+    parser.close()
+    yield target.output.pop()
+
+
+class FilteredCapabilities(object):
+    """
+    Streams the capabilities document of the upstream response without the hidden layers,
+    and stores it in the ``cache`` under ``key`` with its content type once fully sent.
+
+    The beginning of the document is filtered on creation, so that documents which cannot be parsed at all
+    are reported before any response is sent. Failures occurring later interrupt the document.
+    """
+
+    def __init__(self,
+                 resp: RequestsResponse,
+                 hidden: FrozenSet[str],
+                 limits: Optional[XMLLimits] = None,
+                 chunk_size: int = 64 * 1024,
+                 cache: Optional[ExpiringCache] = None,
+                 key: Optional[Hashable] = None,
+                 ) -> None:
+        self.resp = resp
+        self.cache = cache
+        self.key = key
+        self._chunks = filter_capabilities(resp.iter_content(chunk_size), hidden, limits)
+        self._first = next(self._chunks, b'')
+
+    def __iter__(self) -> Iterator[bytes]:
+        parts = [self._first]
+        yield self._first
+        try:
+            for data in self._chunks:
+                if self.cache is not None:
+                    parts.append(data)
+                yield data
+        except (lxml.etree.XMLSyntaxError, XMLLimitExceeded) as exc:
+            LOGGER.error("Could not filter capabilities document: %s", exc)
+            return
+        if self.cache is not None:
+            self.cache.set(self.key, (self.resp.headers.get('Content-Type'), b''.join(parts)))
+
+    def close(self) -> None:
+        self.resp.close()
+
+
+def capabilities_hidden_layers(request: Request, service: ServiceConfig) -> FrozenSet[str]:
+    """
+    Layers to remove from the response if the request is a WMS ``GetCapabilities`` request.
+    """
+    if str(service.get('type') or '').lower() != 'wms':
+        return frozenset()
+    ows_request = getattr(request, 'ows_request', None) or OWSRequest(request, lazy=True)
+    try:
+        if ows_request.service != 'wms' or ows_request.request != 'getcapabilities':
+            return frozenset()
+    except OWSException:
+        return frozenset()
+    return request_hidden_layers(request, service['name'])
+
+
+def capabilities_cache_key(request: Request, service: ServiceConfig, hidden: FrozenSet[str]) -> Hashable:
+    """
+    Key of the filtered document, shared by all clients from which the same layers are hidden.
+    """
+    return service['name'], service['url'], request.matchdict.get('extra_path'), request.query_string, hidden
+
+
+def capabilities_cache_from_settings(container: AnySettingsContainer) -> ExpiringCache:
+    settings = get_settings(container)
+    return ExpiringCache(
+        maxsize=int(settings.get('twitcher.wms_capabilities_cache_size', 64)),
+        ttl=float(settings.get('twitcher.wms_capabilities_cache_ttl', 0)),
+    )
+
+
+def includeme(config):
+    cache = capabilities_cache_from_settings(config)
+    if cache.ttl > 0:
+        config.registry[WMS_CAPABILITIES_CACHE] = cache
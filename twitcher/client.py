@@ -100,6 +100,28 @@ class TwitcherService(object):
         else:
             return resp.json()
 
+    def add_service_endpoint(self, name, url):
+        """Add an upstream endpoint to the OWS service with given name."""
+        req_url = "{}/services/{}/endpoints".format(self.base_url, name)
+        resp = requests.post(req_url, json={"url": url},
+                             auth=(self.username, self.password),
+                             verify=self.verify)
+        if not resp.ok:
+            LOGGER.error("Could not add service endpoint")
+        else:
+            return resp.json()
+
+    def remove_service_endpoint(self, name, url):
+        """Remove an upstream endpoint from the OWS service with given name."""
+        req_url = "{}/services/{}/endpoints".format(self.base_url, name)
+        resp = requests.delete(req_url, params={"url": url},
+                               auth=(self.username, self.password),
+                               verify=self.verify)
+        if not resp.ok:
+            LOGGER.error("Could not remove service endpoint")
+        else:
+            return resp.json()
+
     def unregister_service(self, name):
         """Remove registered service with given name."""
         req_url = "{}/services/{}".format(self.base_url, name)
@@ -0,0 +1,252 @@
+"""
+In-process cache of the DNS resolution of upstream service hosts.
+
+Every new upstream connection otherwise performs a blocking ``getaddrinfo`` call. Resolved addresses are kept
+for their time-to-live, and refreshed in the background shortly before they expire so that requests never wait
+for the resolver of a known host. Failed resolutions are also cached for a short time (negative caching).
+Successive connections to a host are distributed round-robin over its addresses.
+
+The system resolver does not provide the TTL of the records, the configured ``ttl`` is used instead.
+When `dnspython` is installed (``pip install pyramid_twitcher[dns]``), the ``dnspython`` resolver can be selected
+to honor the TTL of the records.
+"""
+import ipaddress
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_PROXY_DNS_CACHE = 'owsproxy_dns_cache'
+
+# (family, type, proto, canonname, sockaddr) as returned by 'socket.getaddrinfo'
+AddrInfo = Tuple[int, int, int, str, Tuple[Any, ...]]
+# resolved addresses and their time-to-live in seconds, if known
+Resolution = Tuple[List[AddrInfo], Optional[Number]]
+
+
+def system_resolve(host: str, port: int) -> Resolution:
+    """
+    Resolves the host with the system resolver, which does not provide any TTL.
+    """
+    return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM), None
+
+
+def dnspython_resolve(host: str, port: int) -> Resolution:
+    """
+    Resolves the host with `dnspython` and returns the lowest TTL of its ``A`` and ``AAAA`` records.
+
+    Hosts unknown to DNS fall back to the system resolver, which also considers ``/etc/hosts``.
+    """
+    import dns.exception
+    import dns.resolver
+
+    addresses = []
+    ttl = None
+    for rdtype, family in (('A', socket.AF_INET), ('AAAA', socket.AF_INET6)):
+        try:
+            answer = dns.resolver.resolve(host, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+            continue
+        except dns.exception.DNSException as exc:
+            raise socket.gaierror(socket.EAI_AGAIN, str(exc))
+        ttl = answer.rrset.ttl if ttl is None else min(ttl, answer.rrset.ttl)
+        for record in answer:
+            sockaddr = (record.address, port) if family == socket.AF_INET else (record.address, port, 0, 0)
+            addresses.append((family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', sockaddr))
+    if not addresses:
+        return system_resolve(host, port)
+    return addresses, ttl
+
+
+RESOLVERS = {
+    'system': system_resolve,
+    'dnspython': dnspython_resolve,
+}
+
+
+class DNSEntry(object):
+    def __init__(self, addresses: List[AddrInfo], error: Optional[socket.gaierror],
+                 expires: float, refresh_at: float) -> None:
+        self.addresses = addresses
+        self.error = error
+        self.expires = expires
+        self.refresh_at = refresh_at
+        self.refreshing = False
+        self.counter = 0
+
+
+class DNSCache(object):
+    """
+    Thread-safe cache of resolved host addresses.
+
+    :param resolve: function resolving a host and port, raising :class:`socket.gaierror` on failure.
+    :param ttl: time-to-live of resolutions for which the resolver provides none.
+    :param min_ttl: lower bound of the time-to-live of resolved records.
+    :param max_ttl: upper bound of the time-to-live of resolved records.
+    :param negative_ttl: time-to-live of failed resolutions.
+    :param refresh: fraction of the time-to-live after which a resolution is refreshed in the background.
+    :param maxsize: maximum number of cached hosts, least recently used ones are evicted first.
+    """
+
+    def __init__(self,
+                 resolve: Callable[[str, int], Resolution] = system_resolve,
+                 ttl: Number = 60,
+                 min_ttl: Number = 1,
+                 max_ttl: Number = 3600,
+                 negative_ttl: Number = 5,
+                 refresh: float = 0.8,
+                 maxsize: int = 1024,
+                 timer: Callable[[], float] = time.monotonic,
+                 ) -> None:
+        self.resolve = resolve
+        self.ttl = ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.refresh = refresh
+        self.maxsize = maxsize
+        self.timer = timer
+        self._entries = OrderedDict()  # type: Dict[Tuple[str, int], DNSEntry]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.refreshes = 0
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'DNSCache':
+        settings = get_settings(container)
+        resolver = settings.get('twitcher.dns_cache_resolver', 'system')
+        if resolver not in RESOLVERS:
+            raise ValueError("Unknown DNS resolver: {}".format(resolver))
+        return cls(
+            resolve=RESOLVERS[resolver],
+            ttl=float(settings.get('twitcher.dns_cache_ttl', 60)),
+            min_ttl=float(settings.get('twitcher.dns_cache_min_ttl', 1)),
+            max_ttl=float(settings.get('twitcher.dns_cache_max_ttl', 3600)),
+            negative_ttl=float(settings.get('twitcher.dns_cache_negative_ttl', 5)),
+            refresh=float(settings.get('twitcher.dns_cache_refresh', 0.8)),
+            maxsize=int(settings.get('twitcher.dns_cache_size', 1024)),
+        )
+
+    def _resolve(self, host: str, port: int) -> DNSEntry:
+        now = self.timer()
+        try:
+            addresses, ttl = self.resolve(host, port)
+        except socket.gaierror as exc:
+            return DNSEntry([], exc, expires=now + self.negative_ttl, refresh_at=now + self.negative_ttl)
+        ttl = min(max(self.ttl if ttl is None else ttl, self.min_ttl), self.max_ttl)
+        return DNSEntry(list(addresses), None, expires=now + ttl, refresh_at=now + ttl * self.refresh)
+
+    def _store(self, key: Tuple[str, int], entry: DNSEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key: Tuple[str, int], entry: DNSEntry) -> None:
+        try:
+            fresh = self._resolve(*key)
+            if fresh.error is not None:
+                # keep serving the known addresses until they expire, retrying later
+                LOGGER.warning("Refresh of DNS resolution of [%s] failed: %s", key[0], fresh.error)
+                entry.refresh_at = self.timer() + self.negative_ttl
+                return
+            fresh.counter = entry.counter
+            self._store(key, fresh)
+        finally:
+            entry.refreshing = False
+
+    def lookup(self, host: str, port: int) -> List[AddrInfo]:
+        """
+        Addresses of the host, starting with the next one in turn.
+
+        :raises socket.gaierror: if the host cannot be resolved.
+        """
+        key = (host, port)
+        now = self.timer()
+        refresh = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires > now:
+                self._entries.move_to_end(key)
+                if entry.error is not None:
+                    self.negative_hits += 1
+                    raise socket.gaierror(*entry.error.args)
+                self.hits += 1
+                if now >= entry.refresh_at and not entry.refreshing:
+                    entry.refreshing = True
+                    refresh = entry
+                    self.refreshes += 1
+                index = entry.counter % len(entry.addresses)
+                entry.counter += 1
+                addresses = entry.addresses[index:] + entry.addresses[:index]
+            else:
+                entry = None
+                self.misses += 1
+        if refresh is not None:
+            threading.Thread(target=self._refresh, args=(key, refresh), daemon=True).start()
+        if entry is not None:
+            return addresses
+        entry = self._resolve(host, port)
+        entry.counter = 1
+        self._store(key, entry)
+        if entry.error is not None:
+            raise entry.error
+        return list(entry.addresses)
+
+    def create_connection(self,
+                          address: Tuple[str, int],
+                          timeout: Optional[Any] = None,
+                          source_address: Optional[Tuple[str, int]] = None,
+                          socket_options: Optional[Sequence[Tuple[int, int, Any]]] = None,
+                          ) -> socket.socket:
+        """
+        Connects to the first reachable address of the host, similarly to :func:`socket.create_connection`.
+
+        IP addresses are connected to directly, without involving the cache.
+        """
+        host, port = address
+        try:
+            ipaddress.ip_address(host.strip('[]'))
+            addresses = socket.getaddrinfo(host.strip('[]'), port, 0, socket.SOCK_STREAM)
+        except ValueError:
+            addresses = self.lookup(host, port)
+        error = None
+        for family, socktype, proto, _, sockaddr in addresses:
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                for option in socket_options or []:
+                    sock.setsockopt(*option)
+                if isinstance(timeout, (int, float)):
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as exc:
+                error = exc
+                if sock is not None:
+                    sock.close()
+        if error is not None:
+            raise error
+        raise OSError("getaddrinfo returns an empty list")
+
+    def json(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'refreshes': self.refreshes,
+            }
@@ -1,6 +1,8 @@
 from twitcher.adapter import get_adapter_factory
 from twitcher.utils import get_settings, get_twitcher_url, is_json_serializable
+from twitcher.introspection import INTROSPECTION_ENDPOINT
 from twitcher.oauth2 import CLIENT_APP_ENDPOINT, TOKEN_ENDPOINT
+from twitcher.revocation import REVOCATION_ENDPOINT
 from twitcher.owsproxy import owsproxy_base_url
 from twitcher import __version__
 from pyramid.settings import asbool
@@ -20,6 +22,8 @@ def frontpage(request):
         'services_uri': "{}/services".format(url),
         'client_uri': "{}{}".format(url, CLIENT_APP_ENDPOINT),
         'token_uri': "{}{}".format(url, TOKEN_ENDPOINT),
+        'introspection_uri': "{}{}".format(url, INTROSPECTION_ENDPOINT),
+        'revocation_uri': "{}{}".format(url, REVOCATION_ENDPOINT),
         'openapi_uri': "{}/__api__".format(url),
     }
     settings = get_settings(request)
@@ -0,0 +1,274 @@
+"""
+Active health checking of the registered OWS services.
+
+A background thread periodically probes every endpoint of each registered service with a cheap
+``GetCapabilities`` (or ``HEAD``) request, and records its status and latency. Probes of a cycle are spread
+randomly over a fraction of the interval to avoid bursts, and are run concurrently up to a bounded number.
+
+Services having all their endpoints down are rejected immediately by the OWS proxy instead of waiting for
+a connection failure. Health of a service is reported by the ``/services/{name}/health`` API.
+
+By default, each worker probes the services independently. When ``twitcher.health.state_file`` is configured,
+a single worker is elected with a lock on that file to probe the services, and shares the results with the
+other workers through it.
+"""
+import fcntl
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import transaction
+from pyramid.config import Configurator
+from pyramid.events import NewRequest
+from pyramid.registry import Registry
+from pyramid.settings import asbool
+
+from twitcher.balancer import service_endpoints
+from twitcher.models.service import ServiceConfig
+from twitcher.transport import upstream_send
+from twitcher.typedefs import AnySettingsContainer, JSON
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_HEALTH_CHECKER = 'owsproxy_health_checker'
+
+HEALTH_UP = 'up'
+HEALTH_DOWN = 'down'
+HEALTH_UNKNOWN = 'unknown'
+
+
+def probe_endpoint(url: str, service: ServiceConfig, method: str = 'getcapabilities', timeout: float = 5) -> JSON:
+    """
+    Probes an endpoint of the service and returns its health record.
+    """
+    start = time.monotonic()
+    record = {'url': url, 'status': HEALTH_DOWN, 'status_code': None, 'latency': None,
+              'checked_at': time.time(), 'error': None}
+    send = upstream_send()
+    try:
+        if method == 'head':
+            resp = send('HEAD', url, timeout=timeout, verify=service.get('verify', True))
+        else:
+            params = {'service': str(service.get('type') or 'wps').upper(), 'request': 'GetCapabilities'}
+            resp = send('GET', url, params=params, timeout=timeout, verify=service.get('verify', True))
+        resp.close()
+        record['status_code'] = resp.status_code
+        record['latency'] = time.monotonic() - start
+        if resp.status_code < 500:
+            record['status'] = HEALTH_UP
+    except Exception as exc:
+        record['error'] = str(exc)
+    return record
+
+
+class HealthChecker(object):
+    """
+    Probes registered services periodically and keeps their latest health records.
+    """
+
+    def __init__(self,
+                 list_services: Callable[[], List[ServiceConfig]],
+                 interval: float = 30,
+                 timeout: float = 5,
+                 concurrency: int = 10,
+                 jitter: float = 0.5,
+                 method: str = 'getcapabilities',
+                 state_file: Optional[str] = None,
+                 probe: Callable[..., JSON] = probe_endpoint,
+                 ) -> None:
+        self.list_services = list_services
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self.method = method
+        self.state_file = state_file
+        self.probe = probe
+        self._health = {}  # type: Dict[str, JSON]
+        self._state_mtime = None
+        self._state_checked = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock_file = None
+        self._leader = False
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer, list_services: Callable[[], List[ServiceConfig]],
+                      ) -> 'HealthChecker':
+        settings = get_settings(container)
+        return cls(
+            list_services,
+            interval=float(settings.get('twitcher.health.interval', 30)),
+            timeout=float(settings.get('twitcher.health.timeout', 5)),
+            concurrency=int(settings.get('twitcher.health.concurrency', 10)),
+            jitter=float(settings.get('twitcher.health.jitter', 0.5)),
+            method=str(settings.get('twitcher.health.method', 'getcapabilities')).lower(),
+            state_file=settings.get('twitcher.health.state_file') or None,
+        )
+
+    def check_service(self, service: ServiceConfig) -> JSON:
+        """
+        Probes all endpoints of the service. The service is up if any of its endpoints is up.
+        """
+        endpoints = [self.probe(url, service, method=self.method, timeout=self.timeout)
+                     for url in service_endpoints(service)]
+        status = HEALTH_UP if any(ep['status'] == HEALTH_UP for ep in endpoints) else HEALTH_DOWN
+        latencies = [ep['latency'] for ep in endpoints if ep['latency'] is not None]
+        return {
+            'name': service['name'],
+            'status': status,
+            'latency': min(latencies) if latencies else None,
+            'checked_at': max(ep['checked_at'] for ep in endpoints),
+            'endpoints': endpoints,
+        }
+
+    def check_services(self, services: List[ServiceConfig], spread: float = 0) -> Dict[str, JSON]:
+        """
+        Probes the services concurrently, each one delayed randomly within ``spread`` seconds.
+        """
+        def run(service: ServiceConfig) -> None:
+            try:
+                record = self.check_service(service)
+            except Exception as exc:
+                LOGGER.warning("Health check of service [%s] failed.", service.get('name'), exc_info=exc)
+                return
+            with self._lock:
+                self._health[service['name']] = record
+
+        names = {service['name'] for service in services}
+        with ThreadPoolExecutor(max_workers=max(self.concurrency, 1)) as executor:
+            schedule = sorted((random.uniform(0, spread), index) for index in range(len(services)))
+            start = time.monotonic()
+            for offset, index in schedule:
+                delay = start + offset - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+                executor.submit(run, services[index])
+        with self._lock:
+            for name in list(self._health):
+                if name not in names:
+                    del self._health[name]
+            health = dict(self._health)
+        self._write_state(health)
+        return health
+
+    def get(self, name: str) -> Optional[JSON]:
+        """
+        Latest health record of the service, if it was checked recently.
+        """
+        self._read_state()
+        with self._lock:
+            record = self._health.get(name)
+        if record is None or time.time() - record['checked_at'] > 3 * self.interval:
+            return None
+        return record
+
+    def is_down(self, name: str) -> bool:
+        record = self.get(name)
+        return record is not None and record['status'] == HEALTH_DOWN
+
+    def _elected(self) -> bool:
+        if not self.state_file:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(self.state_file + '.lock', 'a')
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        return True
+
+    def _write_state(self, health: Dict[str, JSON]) -> None:
+        if not self.state_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as tmp:
+            json.dump(health, tmp)
+        os.replace(tmp.name, self.state_file)
+
+    def _read_state(self) -> None:
+        if not self.state_file or self._leader:
+            return
+        now = time.monotonic()
+        if now - self._state_checked < 1:
+            return
+        self._state_checked = now
+        try:
+            mtime = os.stat(self.state_file).st_mtime
+            if mtime == self._state_mtime:
+                return
+            with open(self.state_file) as state:
+                health = json.load(state)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self._health = health
+            self._state_mtime = mtime
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self._leader = self._elected()
+            if self._leader:
+                try:
+                    services = self.list_services()
+                    self.check_services(services, spread=self.jitter * self.interval)
+                except Exception as exc:
+                    LOGGER.warning("Health check of services failed.", exc_info=exc)
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """
+        Starts the background thread, once per process in case the application was forked after its creation.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='twitcher-health', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def list_registered_services(registry: Registry) -> List[ServiceConfig]:
+    """
+    Lists the services from the database, outside of any request.
+    """
+    from twitcher.models import get_tm_session
+    from twitcher.store import ServiceStore
+
+    manager = transaction.TransactionManager(explicit=True)
+    with manager:
+        dbsession = get_tm_session(registry['dbsession_factory'], manager)
+        store = ServiceStore(SimpleNamespace(dbsession=dbsession))
+        return [service.json() for service in store.list_services()]
+
+
+def includeme(config: Configurator) -> None:
+    settings = get_settings(config)
+    if not asbool(settings.get('twitcher.health', False)):
+        return
+    registry = config.registry
+    checker = HealthChecker.from_settings(settings, lambda: list_registered_services(registry))
+    registry[OWS_HEALTH_CHECKER] = checker
+
+    def start_health_checker(event: NewRequest) -> None:
+        checker.start()
+    config.add_subscriber(start_health_checker, NewRequest)
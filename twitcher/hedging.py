@@ -0,0 +1,201 @@
+"""
+Hedging of idempotent proxied requests against slow upstream responses.
+
+When a proxied ``GET`` request of an idempotent OWS operation (never a WPS ``Execute``) has not received the
+response headers within a delay derived from a percentile of the recent latencies of the service, a duplicate
+request is sent to an alternate endpoint of the service, or over a fresh connection to the same endpoint if it has
+no other. The first response wins and the other one is cancelled.
+
+Hedged requests are limited by a budget, similar to the retry budget of `Finagle`: each request deposits
+``budget`` tokens and each hedged request withdraws one, so that hedged traffic never exceeds that fraction
+of the total requests, plus a small reserve.
+
+See also: https://research.google/pubs/the-tail-at-scale/
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, Tuple
+
+from requests.models import Response as RequestsResponse
+
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_PROXY_HEDGER = 'owsproxy_hedger'
+
+# OWS operations without side effects, which can be sent twice
+IDEMPOTENT_REQUESTS = frozenset([
+    'getcapabilities', 'describeprocess', 'getmap', 'getfeatureinfo', 'getlegendgraphic', 'describelayer',
+    'getfeature', 'describefeaturetype', 'getpropertyvalue', 'getcoverage', 'describecoverage', 'getrecords',
+    'getrecordbyid', 'gettile',
+])
+
+
+class LatencyWindow(object):
+    """
+    Latencies of the most recent responses of a service, with a cached percentile.
+    """
+
+    def __init__(self, size: int, percentile: Number) -> None:
+        self.percentile = percentile
+        self.samples = deque(maxlen=size)
+        self._value = None  # type: Optional[float]
+        self._stale = 0
+
+    def add(self, latency: float) -> None:
+        self.samples.append(latency)
+        self._stale += 1
+
+    def value(self) -> Optional[float]:
+        # sorting the window on each request would be wasteful, refresh only after some new samples
+        if self._value is None or self._stale >= max(len(self.samples) // 10, 1):
+            ordered = sorted(self.samples)
+            index = min(int(len(ordered) * self.percentile / 100.0), len(ordered) - 1)
+            self._value = ordered[index]
+            self._stale = 0
+        return self._value
+
+
+class RequestHedger(object):
+    """
+    Sends requests with a hedged duplicate once they are slower than the usual latency of the service.
+    """
+
+    def __init__(self,
+                 percentile: Number = 95,
+                 min_delay: Number = 0.01,
+                 max_delay: Number = 10,
+                 min_samples: int = 20,
+                 window: int = 1000,
+                 budget: float = 0.05,
+                 max_workers: int = 64,
+                 timer: Callable[[], float] = time.monotonic,
+                 ) -> None:
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = budget
+        self.timer = timer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='twitcher-hedge')
+        # reserve allowing a few hedged requests before the budget is built up by regular requests
+        self._reserve = 10.0
+        self._tokens = self._reserve
+        self._latencies = {}  # type: Dict[str, LatencyWindow]
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.hedged_total = 0
+        self.hedge_wins_total = 0
+        self.budget_exhausted_total = 0
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'RequestHedger':
+        settings = get_settings(container)
+        return cls(
+            percentile=float(settings.get('twitcher.ows_proxy_hedging_percentile', 95)),
+            min_delay=float(settings.get('twitcher.ows_proxy_hedging_min_delay', 0.01)),
+            max_delay=float(settings.get('twitcher.ows_proxy_hedging_max_delay', 10)),
+            min_samples=int(settings.get('twitcher.ows_proxy_hedging_min_samples', 20)),
+            budget=float(settings.get('twitcher.ows_proxy_hedging_budget', 0.05)),
+            max_workers=int(settings.get('twitcher.ows_proxy_hedging_workers', 64)),
+        )
+
+    def record(self, name: str, latency: float) -> None:
+        with self._lock:
+            window = self._latencies.get(name)
+            if window is None:
+                window = self._latencies[name] = LatencyWindow(self.window, self.percentile)
+            window.add(latency)
+
+    def delay(self, name: str) -> Optional[float]:
+        """
+        Delay after which a request to the service is hedged, or ``None`` while too few latencies are known.
+        """
+        with self._lock:
+            window = self._latencies.get(name)
+            if window is None or len(window.samples) < self.min_samples:
+                return None
+            return min(max(window.value(), self.min_delay), self.max_delay)
+
+    def _withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                self.budget_exhausted_total += 1
+                return False
+            self._tokens -= 1
+            self.hedged_total += 1
+            return True
+
+    def _timed(self, name: str, send: Callable[[str], RequestsResponse], url: str) -> RequestsResponse:
+        start = self.timer()
+        resp = send(url)
+        self.record(name, self.timer() - start)
+        return resp
+
+    def send(self, name: str, send: Callable[[str], RequestsResponse], primary: str, alternate: str,
+             ) -> Tuple[str, RequestsResponse]:
+        """
+        Sends the request with ``send`` to the ``primary`` endpoint, hedged to the ``alternate`` one if it is slow.
+
+        :param name: name of the service, to which latencies are attributed.
+        :param send: function sending the request to the given endpoint and returning once headers are received.
+        :returns: endpoint and response of the first successful request.
+        """
+        with self._lock:
+            self.requests_total += 1
+            self._tokens = min(self._tokens + self.budget, self._reserve + self.budget * self.window)
+        delay = self.delay(name)
+        if delay is None:
+            return primary, self._timed(name, send, primary)
+
+        futures = {self.executor.submit(self._timed, name, send, primary): primary}  # type: Dict[Future, str]
+        hedge = None
+        done, _ = wait(futures, timeout=delay)
+        if not done and self._withdraw():
+            LOGGER.debug("Hedging request to [%s] after %.3fs.", name, delay)
+            hedge = self.executor.submit(self._timed, name, send, alternate)
+            futures[hedge] = alternate
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is None:
+                error = next(iter(done)).exception()
+                continue
+            for loser in set(futures) - {winner}:
+                cancel(loser)
+            if winner is hedge:
+                with self._lock:
+                    self.hedge_wins_total += 1
+            return futures[winner], winner.result()
+        raise error
+
+    def json(self) -> Dict[str, Number]:
+        with self._lock:
+            return {
+                'requests_total': self.requests_total,
+                'hedged_total': self.hedged_total,
+                'hedge_wins_total': self.hedge_wins_total,
+                'budget_exhausted_total': self.budget_exhausted_total,
+                'budget_tokens': self._tokens,
+            }
+
+
+def cancel(future: Future) -> None:
+    """
+    Cancels the request of a losing future, closing its response whenever it is received.
+    """
+    if future.cancel():
+        return
+
+    def close(done: Future) -> None:
+        if not done.cancelled() and done.exception() is None:
+            done.result().close()
+    future.add_done_callback(close)
@@ -1,7 +1,7 @@
 """
 Twitcher interfaces to allow alternative implementations in adapters.
 """
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 from pyramid.request import Request
 
@@ -13,6 +13,11 @@ class OWSSecurityInterface(object):
         """Verify that the service request is allowed."""
         raise NotImplementedError
 
+    def verify_access(self, request: Request, service: Dict, service_type: str, request_type: str,
+                      identifier: Optional[str] = None, verify_token: Optional[Callable[[], bool]] = None) -> bool:
+        """Verify that the OWS request type is allowed for the resolved service without parsing the request."""
+        raise NotImplementedError
+
 
 class ServiceStoreInterface(object):
     def __init__(self, request: Request) -> None:
@@ -33,6 +38,15 @@ class ServiceStoreInterface(object):
     def fetch_by_url(self, url: str) -> Service:
         raise NotImplementedError
 
+    def fetch_by_names(self, names: Iterable[str]) -> List[Service]:
+        raise NotImplementedError
+
+    def add_endpoint(self, name: str, url: str) -> Service:
+        raise NotImplementedError
+
+    def remove_endpoint(self, name: str, url: str) -> Service:
+        raise NotImplementedError
+
     def clear_services(self) -> None:
         raise NotImplementedError
 
@@ -54,6 +68,23 @@ class OWSRegistryInterface(object):
         """Lookup OWS service with given ``url``."""
         raise NotImplementedError
 
+    def get_services_by_names(self, names: Iterable[str]) -> Dict[str, Dict]:
+        """Lookup OWS services with given ``names``, mapped by name. Unknown names are omitted."""
+        services = {}
+        for name in names:
+            service = self.get_service_by_name(name)
+            if service:
+                services[name] = service
+        return services
+
+    def add_service_endpoint(self, name: str, url: str) -> Dict:
+        """Add an upstream replica ``url`` to the OWS service with given ``name``."""
+        raise NotImplementedError
+
+    def remove_service_endpoint(self, name: str, url: str) -> Dict:
+        """Remove an upstream replica ``url`` from the OWS service with given ``name``."""
+        raise NotImplementedError
+
     def list_services(self) -> List:
         """List all registered OWS services."""
         raise NotImplementedError
@@ -0,0 +1,179 @@
+"""
+OAuth 2.0 token introspection (:rfc:`7662`).
+
+Protected resources, such as the WPS services behind the proxy, post a ``token`` to ``/oauth/introspect`` and
+receive whether it is ``active``, along with its ``client_id``, ``scope`` and expiration time ``exp``. The token is
+validated by the token validator configured by :mod:`twitcher.oauth2`, without any service or OWS request.
+
+Callers authenticate as registered client applications, with HTTP basic authentication or the ``client_id`` and
+``client_secret`` parameters.
+
+Results are cached per token digest until the token expires, for at most ``twitcher.introspection_cache_ttl``
+seconds, and responses carry a matching ``Cache-Control`` header so that callers can cache them as well.
+Inactive random tokens are never cached, since they could be pending in the buffer of another worker
+(see :class:`twitcher.tokenstore.TokenBuffer`), nor are failed validations, which are answered with status ``503``.
+Cached results of JWT tokens are checked against the revoked tokens (see :mod:`twitcher.revocation`) each time they
+are used, while those of random tokens are only cached up to ``twitcher.revocation_refresh_interval`` seconds.
+"""
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import Optional, Tuple
+
+import jwt
+from oauthlib.oauth2 import RequestValidator
+from pyramid.authentication import extract_http_basic_credentials
+from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid.response import Response
+
+from twitcher.cache import ExpiringCache
+from twitcher.typedefs import JSON, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OAUTH2_INTROSPECTION = 'oauth2_introspection'
+INTROSPECTION_ENDPOINT = '/oauth/introspect'
+
+INACTIVE = {'active': False}
+
+
+def authenticate_client(request: Request, validator: RequestValidator) -> Optional[str]:
+    """
+    Identifier of the client application authenticated by the request, with HTTP basic authentication or
+    the ``client_id`` and ``client_secret`` parameters, if any.
+    """
+    credentials = extract_http_basic_credentials(request)
+    if credentials:
+        client_id, client_secret = credentials.username, credentials.password
+    else:
+        client_id, client_secret = request.POST.get('client_id'), request.POST.get('client_secret')
+    if not client_id:
+        return None
+    caller = SimpleNamespace(dbsession=request.dbsession, client_id=client_id, client_secret=client_secret or '')
+    if not validator.authenticate_client(caller):
+        return None
+    return client_id
+
+
+class TokenIntrospection(object):
+    """
+    Introspects tokens with the ``validator``, caching results per token until it expires.
+    """
+
+    def __init__(self, validator: RequestValidator, cache_ttl: Number = 300, cache_size: int = 10000) -> None:
+        from twitcher.oauth2 import RandomTokenValidator
+
+        self.validator = validator
+        self.cache = ExpiringCache(maxsize=cache_size, ttl=cache_ttl)
+        # tokens revoked by deleting them from the database
+        self.stored_tokens = isinstance(validator, RandomTokenValidator)
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        # digest, so that no token is ever kept in memory
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def authenticate(self, request: Request) -> bool:
+        """
+        Whether the caller provides the credentials of a registered client application.
+        """
+        return authenticate_client(request, self.validator) is not None
+
+    def validate(self, request: Request, token: str) -> JSON:
+        """
+        Introspection result of the token, without cache.
+
+        Errors other than invalid tokens, such as an unavailable database, are raised.
+        """
+        validation = SimpleNamespace(dbsession=request.dbsession, client=None, scopes=[], token_expires=None,
+                                     token_id=None)
+        try:
+            valid = self.validator.validate_bearer_token(token, None, validation)
+        except jwt.InvalidTokenError as exc:
+            LOGGER.debug("Token validation failed.", exc_info=exc)
+            valid = False
+        if not valid:
+            return INACTIVE
+        result = {
+            'active': True,
+            'client_id': getattr(validation.client, 'client_id', None),
+            'scope': ' '.join(validation.scopes),
+            'token_type': 'Bearer',
+        }
+        if validation.token_expires is not None:
+            if validation.token_expires <= time.time():
+                return INACTIVE
+            result['exp'] = validation.token_expires
+        if validation.token_id:
+            result['jti'] = validation.token_id
+        return result
+
+    def introspect(self, request: Request, token: str) -> Tuple[JSON, int]:
+        """
+        Introspection result of the token, and for how many seconds it can be cached by the caller.
+        """
+        key = self.token_key(token)
+        now = time.time()
+        revocation = getattr(self.validator, 'revocation', None)
+        cached = self.cache.get(key)
+        if cached is not None and revocation is not None and revocation.is_revoked(cached[0].get('jti')):
+            # revoked since it was cached, possibly by another worker
+            self.cache.pop(key)
+            return INACTIVE, 0
+        if cached is None:
+            result = self.validate(request, token)
+            deadline = now + self.cache.ttl
+            if 'exp' in result:
+                deadline = min(deadline, result['exp'])
+            if result['active'] and self.stored_tokens and revocation is not None:
+                # revoked by deleting it, which is only noticed once validated again
+                deadline = min(deadline, now + revocation.refresh_interval)
+            elif not result['active'] and self.stored_tokens:
+                # possibly issued by another worker, and not written to the database yet
+                deadline = now
+            cached = (result, deadline)
+            self.cache.set(key, cached, ttl=deadline - now)
+        result, deadline = cached
+        return result, max(int(deadline - now), 0)
+
+    def forget(self, token: str) -> None:
+        self.cache.pop(self.token_key(token))
+
+
+def introspect_token_view(request: Request) -> Response:
+    """
+    Returns the introspection result of the posted ``token`` to an authenticated client application.
+    """
+    introspection = request.registry[OAUTH2_INTROSPECTION]
+    if not introspection.authenticate(request):
+        response = Response(status=401, json={'error': 'invalid_client'}, request=request)
+        response.headers['WWW-Authenticate'] = 'Basic realm="Twitcher"'
+        return response
+    token = request.POST.get('token')
+    if not token:
+        return Response(status=400, json={'error': 'invalid_request'}, request=request)
+    try:
+        result, max_age = introspection.introspect(request, token)
+    except Exception as exc:
+        LOGGER.warning("Token introspection failed.", exc_info=exc)
+        response = Response(status=503, json={'error': 'temporarily_unavailable'}, request=request)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    response = Response(json=result, request=request)
+    response.headers['Cache-Control'] = 'private, max-age={}'.format(max_age) if max_age > 0 else 'no-store'
+    return response
+
+
+def includeme(config: Configurator) -> None:
+    from twitcher.oauth2 import OAUTH2_VALIDATOR
+
+    settings = get_settings(config)
+    config.registry[OAUTH2_INTROSPECTION] = TokenIntrospection(
+        config.registry[OAUTH2_VALIDATOR],
+        cache_ttl=float(settings.get('twitcher.introspection_cache_ttl', 300)),
+        cache_size=int(settings.get('twitcher.introspection_cache_size', 10000)))
+    config.add_route('introspect', INTROSPECTION_ENDPOINT, request_method='POST')
+    config.add_view(introspect_token_view, route_name='introspect')
@@ -7,8 +7,12 @@ import zope.sqlalchemy
 # import or define all models here to ensure they are attached to the
 # Base.metadata prior to any initialization routines
 from .service import Service   # noqa: F401
+from .service import ServiceEndpoint   # noqa: F401
+from .service import ServiceRoute   # noqa: F401
 from .oauth import Client  # noqa: F401
 from .oauth import Token  # noqa: F401
+from .oauth import RevokedToken  # noqa: F401
+from .policy import PolicyRule  # noqa: F401
 
 LOGGER = logging.getLogger("TWITCHER")
 
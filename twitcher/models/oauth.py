@@ -15,7 +15,8 @@ from sqlalchemy import (
     Text,
     String,
     DateTime,
-    ForeignKey
+    ForeignKey,
+    Index,
 )
 from sqlalchemy.orm import relationship
 
@@ -27,7 +28,8 @@ class Client(Base):
     # human readable name, not required
     name = Column(String(40))
     client_id = Column(String(40), primary_key=True)
-    client_secret = Column(String(55), unique=True, index=True, nullable=False)
+    # salted hash of the secret (see twitcher.passwords)
+    client_secret = Column(String(255), nullable=False)
     _redirect_uris = Column(Text)
     default_scope = Column(Text, default='compute')
 
@@ -56,6 +58,10 @@ class Client(Base):
 
 class Token(Base):
     __tablename__ = 'token'
+    __table_args__ = (
+        # lookup of reusable tokens (see twitcher.tokenstore)
+        Index('ix_token_client_id_expires', 'client_id', 'expires'),
+    )
     id = Column(Integer, primary_key=True)
     client_id = Column(
         String(40), ForeignKey('client.client_id', ondelete='CASCADE'),
@@ -63,9 +69,9 @@ class Token(Base):
     )
     client = relationship('Client')
     token_type = Column(String(40))
-    access_token = Column(String(255))
+    access_token = Column(String(255), unique=True, index=True)
     refresh_token = Column(String(255))
-    expires = Column(DateTime)
+    expires = Column(DateTime, index=True)
     scope = Column(Text)
 
     def __init__(self, **kwargs):
@@ -81,3 +87,15 @@ class Token(Base):
         if self.scope:
             return self.scope.split()
         return []
+
+
+class RevokedToken(Base):
+    """
+    Identifier (``jti`` or ``ref`` claim) of a revoked JWT token, kept until the token expires
+    (see :mod:`twitcher.revocation`).
+    """
+    __tablename__ = 'revoked_token'
+    id = Column(Integer, primary_key=True)
+    jti = Column(String(255), unique=True, index=True, nullable=False)
+    expires = Column(DateTime, index=True)
+    revoked = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
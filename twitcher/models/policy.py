@@ -0,0 +1,38 @@
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    String,
+)
+
+from .meta import Base
+
+
+class PolicyRule(Base):
+    """
+    Access rule of the policy engine (see :mod:`twitcher.policy`). Unset criteria match any value (``*``).
+    """
+    __tablename__ = 'policy_rules'
+    id = Column(Integer, primary_key=True)
+    service = Column(String(40), nullable=False, default='*')
+    request = Column(String(40), nullable=False, default='*')
+    identifier = Column(String(255), nullable=False, default='*')
+    layer = Column(String(255), nullable=False, default='*')
+    bbox = Column(String(255), nullable=False, default='*')
+    subject = Column(String(255), nullable=False, default='*')
+    effect = Column(String(10), nullable=False, default='allow')
+    updated = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def json(self) -> Dict:
+        return {
+            'id': self.id,
+            'service': self.service,
+            'request': self.request,
+            'identifier': self.identifier,
+            'layer': self.layer,
+            'bbox': self.bbox,
+            'subject': self.subject,
+            'effect': self.effect}
@@ -1,10 +1,12 @@
 from sqlalchemy import (
     Column,
+    ForeignKey,
     Integer,
     String,
 )
 from sqlalchemy.ext.hybrid import hybrid_property
-from typing import Union
+from sqlalchemy.orm import relationship
+from typing import Dict, List, Optional, Union
 from twitcher.models.meta import Base
 from twitcher.typedefs import TypedDict
 
@@ -16,7 +18,11 @@ ServiceConfig = TypedDict("ServiceConfig", {
     "purl": str,
     "auth": str,
     "public": bool,
-    "verify": bool
+    "verify": bool,
+    "offload": bool,
+    "chunk_size": Optional[int],
+    "endpoints": List[str],
+    "routes": List[Dict]
 }, total=True)
 
 
@@ -29,6 +35,12 @@ class Service(Base):
     purl = Column(String(255))
     _verify = Column(Integer)  # sqlite does not support Boolean
     auth = Column(String(40))
+    _offload = Column(Integer)  # sqlite does not support Boolean
+    chunk_size = Column(Integer)  # size of relayed response chunks, default one if unset
+    endpoints = relationship('ServiceEndpoint', back_populates='service', order_by='ServiceEndpoint.id',
+                             cascade='all, delete-orphan', lazy='selectin')
+    routes = relationship('ServiceRoute', back_populates='service', order_by='ServiceRoute.id',
+                          cascade='all, delete-orphan', lazy='selectin')
 
     @hybrid_property
     def verify(self) -> bool:
@@ -40,6 +52,17 @@ class Service(Base):
     def verify(self, verify: Union[bool, int]) -> None:
         self._verify = int(verify)
 
+    @hybrid_property
+    def offload(self) -> bool:
+        """Return true if the proxied request should be offloaded to the front-end web server."""
+        if self._offload == 1:
+            return True
+        return False
+
+    @offload.setter
+    def offload(self, offload: Union[bool, int]) -> None:
+        self._offload = int(offload)
+
     @property
     def public(self) -> bool:
         """Return true if public access."""
@@ -53,4 +76,38 @@ class Service(Base):
             'purl': self.purl,
             'auth': self.auth,
             'public': self.public,
-            'verify': self.verify}
+            'verify': self.verify,
+            'offload': self.offload,
+            'chunk_size': self.chunk_size,
+            'endpoints': [endpoint.url for endpoint in self.endpoints],
+            'routes': [route.json() for route in self.routes]}
+
+
+class ServiceEndpoint(Base):
+    """
+    Additional upstream replica of a service, balanced with the main service URL.
+    """
+    __tablename__ = 'service_endpoints'
+    id = Column(Integer, primary_key=True)
+    service_id = Column(Integer, ForeignKey('services.id', ondelete='CASCADE'), nullable=False, index=True)
+    service = relationship('Service', back_populates='endpoints')
+    url = Column(String(255), nullable=False)
+
+
+class ServiceRoute(Base):
+    """
+    Backend URL dedicated to the execution of a process of a service, instead of the service URL.
+    """
+    __tablename__ = 'service_routes'
+    id = Column(Integer, primary_key=True)
+    service_id = Column(Integer, ForeignKey('services.id', ondelete='CASCADE'), nullable=False, index=True)
+    service = relationship('Service', back_populates='routes')
+    identifier = Column(String(255), nullable=False)
+    url = Column(String(255), nullable=False)
+    max_concurrent = Column(Integer)  # concurrent requests to the URL within each worker, unlimited if unset
+
+    def json(self) -> Dict:
+        return {
+            'identifier': self.identifier,
+            'url': self.url,
+            'max_concurrent': self.max_concurrent}
@@ -16,7 +16,8 @@ Currently three types of access tokens can be used:
 
 *random_token*
     The access token is a UUID string.
-    The tokens are stored in a local database and can be used for local validation only.
+    The tokens are stored in a local database and can be used for local validation only
+    (see :mod:`twitcher.tokenstore`).
 
 *signed_token*
     A JWT token signed with a X.509 certificate.
@@ -29,6 +30,9 @@ Currently three types of access tokens can be used:
 *keycloak_token*
     A JWT token generated by a `Keycloak <https://www.keycloak.org/>`_ OAuth2 service.
 
+Protected resources can validate tokens with the introspection endpoint (see :mod:`twitcher.introspection`),
+and clients can revoke their tokens before they expire (see :mod:`twitcher.revocation`).
+
 See also the OAuth2
 `token documenation <https://oauthlib.readthedocs.io/en/latest/oauth2/tokens/tokens.html>`_
 
@@ -47,6 +51,7 @@ Further reading:
 * https://docs.apigee.com/api-platform/security/oauth/oauth-20-client-credentials-grant-type
 """
 
+import calendar
 import datetime
 import uuid
 
@@ -57,6 +62,8 @@ import jwt
 from pyramid.settings import asbool
 
 from twitcher import models
+from twitcher.passwords import PasswordVerifier, hash_password
+from twitcher.tokenstore import find_reusable_token, normalize_scope
 from twitcher.utils import get_settings
 
 import logging
@@ -67,13 +74,49 @@ TOKEN_ENDPOINT = '/oauth/token'
 CLIENT_APP_ENDPOINT = '/oauth/client'
 DEFAULT_SCOPES = ['compute']
 
+OAUTH2_VALIDATOR = 'oauth2_validator'
+
 
 class Client():
     client_id = None
 
 
+def set_token_claims(request, client_id, scopes, expires=None, token_id=None):
+    """
+    Sets the client and scopes of the validated access token on the request, as expected by `oauthlib`,
+    its expiration time in seconds since the Epoch (``token_expires``) and its identifier (``token_id``), if known.
+    """
+    request.client = Client()
+    request.client.client_id = client_id
+    request.scopes = list(scopes or [])
+    request.token_expires = int(expires) if expires is not None else None
+    request.token_id = token_id
+
+
+def jwt_token_id(claims):
+    return claims.get('jti') or claims.get('ref')
+
+
+def set_jwt_claims(request, claims):
+    scopes = claims.get('scope') or claims.get('scp') or []
+    if isinstance(scopes, str):
+        scopes = scopes.split()
+    set_token_claims(request, claims.get('client_id') or claims.get('azp'), scopes, claims.get('exp'),
+                     jwt_token_id(claims))
+
+
 class BaseValidator(RequestValidator):
+    """
+    Client secrets are stored as salted hashes. Successful verifications are cached for
+    ``twitcher.client_secret_cache_ttl`` seconds, so that bursts of token requests do not pay the hash each time.
+    """
     default_grants = ["client_credentials"]
+    secret_verifier = None  # type: PasswordVerifier
+    revocation = None  # type: RevocationList
+
+    def is_revoked(self, claims):
+        """Whether the JWT token with these claims was revoked (see :mod:`twitcher.revocation`)."""
+        return self.revocation is not None and self.revocation.is_revoked(jwt_token_id(claims))
 
     def _get_client(self, request, client_id):
         query = request.dbsession.query(models.Client)
@@ -91,14 +134,13 @@ class BaseValidator(RequestValidator):
     def authenticate_client(self, request, *args, **kwargs):
         LOGGER.debug('authenticate_client: {}'.format(request.client_id))
         client = self._get_client(request, request.client_id)
+        verifier = self.secret_verifier or PasswordVerifier(cache_ttl=0)
         if not client:
-            return False
+            return verifier.reject(request.client_secret or '')
         request.client = Client()
         request.client.client_id = request.client_id
         request.user = request.client_id
-        if request.client_secret == client.client_secret:
-            return True
-        return False
+        return verifier.verify(client.client_id, request.client_secret or '', client.client_secret)
 
     def validate_grant_type(self, client_id, grant_type, client, request, *args, **kwargs):
         return grant_type in self.default_grants
@@ -116,12 +158,47 @@ class BaseValidator(RequestValidator):
 
 
 class RandomTokenValidator(BaseValidator):
+    expires_in = 3600
+    # minimum remaining lifetime in seconds of an unexpired token given back to its client, no reuse if None
+    reuse_min_lifetime = None
+    # write-behind buffer of issued tokens, which are inserted by the request issuing them if None
+    token_buffer = None
+
+    def reusable_token(self, request):
+        """Unexpired token of the client for the same scopes, looked up once per token request."""
+        if self.reuse_min_lifetime is None:
+            return None
+        if getattr(request, 'reused_token', False) is False:
+            min_expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.reuse_min_lifetime)
+            tok = None
+            if self.token_buffer is not None:
+                tok = self.token_buffer.find_reusable_token(request.client_id, request.scopes, min_expires)
+            request.reused_token = tok or find_reusable_token(request.dbsession, request.client_id, request.scopes,
+                                                              min_expires)
+        return request.reused_token
+
+    def token_expires_in(self, request):
+        """Lifetime of the token to issue, which is the remaining one of a reused token."""
+        tok = self.reusable_token(request)
+        if tok is None:
+            return self.expires_in
+        return int((tok.expires - datetime.datetime.utcnow()).total_seconds())
+
     def save_bearer_token(self, token_response, request, *args, **kwargs):
         """Persist the Bearer token."""
+        if self.reusable_token(request) is not None:
+            return
         token = models.Token(client_id=request.client_id, **token_response)
-        request.dbsession.add(token)
+        token.scope = normalize_scope(token.scopes)
+        if self.token_buffer is not None:
+            self.token_buffer.add(token)
+        else:
+            request.dbsession.add(token)
 
     def generate_access_token(self, request):
+        tok = self.reusable_token(request)
+        if tok is not None:
+            return tok.access_token
         return tokens.random_token_generator(request)
 
     def validate_bearer_token(self, token, scopes, request):
@@ -137,8 +214,10 @@ class RandomTokenValidator(BaseValidator):
             2) if the token has expired
             3) if the scopes are available
         """
-        query = request.dbsession.query(models.Token)
-        tok = query.filter(models.Token.access_token == token).first()
+        tok = self.token_buffer.get(token) if self.token_buffer is not None else None
+        if tok is None:
+            query = request.dbsession.query(models.Token)
+            tok = query.filter(models.Token.access_token == token).first()
         if not tok:
             return False
         # validate expires
@@ -148,6 +227,8 @@ class RandomTokenValidator(BaseValidator):
         # validate scopes
         if scopes and not set(tok.scopes) & set(scopes):
             return False
+        expires = calendar.timegm(tok.expires.utctimetuple()) if tok.expires is not None else None
+        set_token_claims(request, tok.client_id, tok.scopes, expires)
         return True
 
 
@@ -159,11 +240,16 @@ class SignedTokenValidator(BaseValidator):
 
     def generate_access_token(self, request):
         private_pem_key = open(self.key, "br").read()
-        return tokens.signed_token_generator(private_pem_key, issuer=self.issuer)(request)
+        return tokens.signed_token_generator(private_pem_key, issuer=self.issuer, jti=uuid.uuid4().hex)(request)
 
     def validate_bearer_token(self, token, scopes, request):
         public_pem = open(self.cert, "br").read()
-        return tokens.common.verify_signed_token(public_pem, token)
+        claims = tokens.common.verify_signed_token(public_pem, token)
+        if claims and self.is_revoked(claims):
+            return False
+        if claims:
+            set_jwt_claims(request, claims)
+        return claims
 
 
 class CustomTokenValidator(BaseValidator):
@@ -182,10 +268,13 @@ class CustomTokenValidator(BaseValidator):
 
     def validate_bearer_token(self, token, scopes, request):
         try:
-            jwt.decode(token, self.secret, verify=True, algorithms=['HS256'])
+            claims = jwt.decode(token, self.secret, verify=True, algorithms=['HS256'])
         except Exception:
             return False
         else:
+            if self.is_revoked(claims):
+                return False
+            set_jwt_claims(request, claims)
             return True
 
 
@@ -198,11 +287,14 @@ class KeycloakTokenValidator(BaseValidator):
 
     def validate_bearer_token(self, token, scopes, request):
         try:
-            jwt.decode(token, self.public_key, audience='account', verify=True, algorithms=['RS256'])
+            claims = jwt.decode(token, self.public_key, audience='account', verify=True, algorithms=['RS256'])
         except Exception as e:
             LOGGER.debug('token validation failed: {}'.format(e))
             return False
         else:
+            if self.is_revoked(claims):
+                return False
+            set_jwt_claims(request, claims)
             return True
 
 
@@ -215,8 +307,7 @@ def generate_token_view(request):
     """
     # Extra credentials we need in the validator
     # credentials = {'user': request.user}
-    LOGGER.debug('generate_token_view: client_id={}, client_secret={}'.format(
-        request.client_id, request.client_secret))
+    LOGGER.debug('generate_token_view: client_id={}'.format(request.client_id))
     return request.create_token_response(credentials=None)
 
 
@@ -224,19 +315,22 @@ def register_client_app_view(request):
     """
     Register a new client application and returns ``client_id`` and ``client_secret``.
 
+    Only a hash of the secret is stored, the secret is therefore returned only once.
+
     Uses basic authentication.
     """
+    client_secret = uuid.uuid4().hex
     client = models.Client(
         name=request.params.get('name'),
         client_id=uuid.uuid4().hex,
-        client_secret=uuid.uuid4().hex,
+        client_secret=hash_password(client_secret),
         _redirect_uris=request.params.get('redirect_uri'),
         default_scope=DEFAULT_SCOPES[0])
     request.dbsession.add(client)
     return dict(
         name=client.name,
         client_id=client.client_id,
-        client_secret=client.client_secret,
+        client_secret=client_secret,
         redirect_uri=client.default_redirect_uri,
         scope=client.default_scopes)
 
@@ -269,18 +363,35 @@ def includeme(config):
                 secret=settings.get('keycloak.token.secret'))
         else:  # default
             validator = RandomTokenValidator()
+        validator.secret_verifier = PasswordVerifier(
+            cache_ttl=float(settings.get('twitcher.client_secret_cache_ttl', 60)),
+            cache_size=int(settings.get('twitcher.client_secret_cache_size', 1024)))
 
         # Register grant types to validate token requests.
         config.add_grant_type('oauthlib.oauth2.ClientCredentialsGrant',
                               request_validator=validator)
 
+        expires_in = int(settings.get('twitcher.token.expires_in', '3600'))
+        if isinstance(validator, RandomTokenValidator) and asbool(settings.get('twitcher.token.reuse', False)):
+            validator.expires_in = expires_in
+            validator.reuse_min_lifetime = int(settings.get('twitcher.token.reuse_min_lifetime', 300))
+            expires_in = validator.token_expires_in
+
         # Register the token types to use at token endpoints.
         config.add_token_type('oauthlib.oauth2.BearerToken',
                               request_validator=validator,
                               token_generator=validator.generate_access_token,
-                              expires_in=int(settings.get('twitcher.token.expires_in', '3600')))
+                              expires_in=expires_in)
 
         config.add_route('access_token', TOKEN_ENDPOINT)
         config.add_view(generate_token_view, route_name='access_token')
         config.add_route('client', CLIENT_APP_ENDPOINT)
         config.add_view(register_client_app_view, route_name='client', renderer='json', permission='view')
+
+        # token introspection for protected resources, backed by the same validator
+        config.registry[OAUTH2_VALIDATOR] = validator
+        config.include('twitcher.introspection')
+        config.include('twitcher.revocation')
+
+        # purge of expired tokens and revocations stored in the database
+        config.include('twitcher.tokenstore')
@@ -19,6 +19,7 @@ from pyramid.httpexceptions import (
     HTTPBadRequest,
     HTTPInternalServerError,
     HTTPNotImplemented,
+    HTTPServiceUnavailable,
     status_map,
 )
 
@@ -111,6 +112,12 @@ class OWSAccessFailed(OWSException):
     explanation = "Access to this service failed"
 
 
+class OWSServiceUnavailable(OWSException):
+    status_base = HTTPServiceUnavailable
+    locator = "ServiceUnavailable"
+    explanation = "This service is currently unavailable"
+
+
 class OWSNoApplicableCode(OWSException):
     status_base = HTTPInternalServerError
 
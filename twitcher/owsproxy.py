@@ -5,20 +5,45 @@ The implementation of owsproxy is based on `papyrus_ogcproxy <https://github.com
 
 See also: https://github.com/nive/outpost/blob/master/outpost/proxy.py
 """
-import requests
+from contextlib import nullcontext
+from urllib import parse as urlparse
 
 from pyramid.config import Configurator
 from pyramid.request import Request
 from pyramid.response import Response
 from pyramid.settings import asbool
+from lxml.etree import XMLSyntaxError
 from requests.models import Response as RequestsResponse
-from typing import Iterator
+from typing import ContextManager, Dict, Iterator, Optional, Tuple
 
 from twitcher.adapter.base import AdapterInterface
+from twitcher.balancer import OWS_PROXY_BALANCER, UpstreamBalancer, service_endpoints
+from twitcher.capabilities import (
+    WMS_CAPABILITIES_CACHE,
+    FilteredCapabilities,
+    capabilities_cache_key,
+    capabilities_hidden_layers,
+)
+from twitcher.dnscache import OWS_PROXY_DNS_CACHE, DNSCache
 from twitcher.models.service import ServiceConfig
-from twitcher.owsexceptions import OWSAccessForbidden, OWSAccessFailed, OWSException, OWSNoApplicableCode
+from twitcher.healthcheck import OWS_HEALTH_CHECKER
+from twitcher.hedging import IDEMPOTENT_REQUESTS, OWS_PROXY_HEDGER, RequestHedger
+from twitcher.owsexceptions import (
+    OWSAccessForbidden,
+    OWSAccessFailed,
+    OWSException,
+    OWSNoApplicableCode,
+    OWSServiceUnavailable,
+)
+from twitcher.owsrequest import OWSRequest
+from twitcher.policy import OWS_POLICY
+from twitcher.relay import DEFAULT_CHUNK_SIZE, iter_raw, relay_chunk_size
+from twitcher.routing import OWS_PROXY_ROUTER, ProcessRouter
+from twitcher.spool import OWS_PROXY_SPOOL, ResponseSpool
+from twitcher.transport import OWS_PROXY_SESSION, upstream_send, upstream_session
 from twitcher.typedefs import AnySettingsContainer
-from twitcher.utils import get_settings, get_twitcher_url, is_valid_url, replace_caps_url
+from twitcher.utils import get_settings, get_twitcher_url, is_unix_socket_url, is_valid_url, replace_caps_url
+from twitcher.xmlparser import XMLLimitExceeded, get_xml_limits
 
 import logging
 LOGGER = logging.getLogger('TWITCHER')
@@ -51,29 +76,134 @@ allowed_hosts = (
 )
 
 
-# requests.models.Response defaults its chunk size to 128 bytes, which is very slow
 class BufferedResponse(object):
-    def __init__(self, resp: RequestsResponse) -> None:
+    """
+    Relays the raw body of the upstream response read into a reused buffer (see :func:`twitcher.relay.iter_raw`).
+
+    Chunks are copied once out of the buffer, since WSGI servers may hold them after the iteration.
+    """
+
+    def __init__(self, resp: RequestsResponse, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
         self.resp = resp
+        self.chunk_size = chunk_size
 
     def __iter__(self) -> Iterator[bytes]:
-        return self.resp.iter_content(64 * 1024)
+        for view in iter_raw(self.resp, self.chunk_size):
+            yield bytes(view)
 
+    def close(self) -> None:
+        self.resp.close()
 
-def send_request(request: Request, service: ServiceConfig) -> Response:
+
+def select_endpoint(request: Request, service: ServiceConfig) -> str:
     """
-    Send the request to the proxied service and handle its response.
+    Selects the upstream URL of the service to which the request is sent, amongst its replicated endpoints.
+    """
+    urls = service_endpoints(service)
+    balancer = request.registry.get(OWS_PROXY_BALANCER)
+    if balancer is None:
+        return urls[0]
+    return balancer.select(urls)
+
+
+def alternate_endpoint(request: Request, service: ServiceConfig, endpoint: str) -> str:
+    """
+    Selects another upstream URL of the service than ``endpoint``, or that one if the service has no other.
+    """
+    urls = [url for url in service_endpoints(service) if url != endpoint]
+    if not urls:
+        return endpoint
+    balancer = request.registry.get(OWS_PROXY_BALANCER)
+    if balancer is None:
+        return urls[0]
+    return balancer.select(urls)
+
+
+def track_endpoint(request: Request, endpoint: str) -> ContextManager[Dict[str, bool]]:
+    """
+    Tracks the load and health of the upstream endpoint for the duration of the request to it.
+    """
+    balancer = request.registry.get(OWS_PROXY_BALANCER)
+    if balancer is None:
+        return nullcontext({'failed': False})
+    return balancer.track(endpoint)
+
+
+def service_request_url(request: Request, service: ServiceConfig, endpoint: Optional[str] = None) -> str:
     """
+    Builds the URL of the proxied service targeted by the request.
 
+    The main service URL is employed unless another ``endpoint`` of the service is specified.
+    """
     extra_path = request.matchdict.get('extra_path')
     request_params = request.query_string
 
     # TODO: fix way to build url
-    url = service['url']
+    url = endpoint or service['url']
     if extra_path:
         url += '/' + extra_path
     if request_params:
         url += '?' + request_params
+    return url
+
+
+def process_identifier(request: Request) -> Optional[str]:
+    """
+    Identifier of the WPS process executed by the request, if any.
+    """
+    ows_request = getattr(request, 'ows_request', None) or OWSRequest(request, lazy=True)
+    try:
+        if ows_request.service != 'wps' or ows_request.request != 'execute':
+            return None
+        return ows_request.identifier
+    except OWSException as exc:
+        LOGGER.debug("Could not find process identifier of request: %s", exc)
+        return None
+
+
+def is_idempotent(request: Request) -> bool:
+    """
+    Whether the request is a ``GET`` request of an OWS operation without side effects, which can be sent twice.
+    """
+    if request.method.upper() != 'GET':
+        return False
+    ows_request = getattr(request, 'ows_request', None) or OWSRequest(request, lazy=True)
+    try:
+        return ows_request.request in IDEMPOTENT_REQUESTS
+    except OWSException as exc:
+        LOGGER.debug("Could not find OWS request type of request: %s", exc)
+        return False
+
+
+def send_request(request: Request, service: ServiceConfig) -> Response:
+    """
+    Send the request to the proxied service and handle its response.
+
+    Executions of processes routed by the service are sent to their dedicated backend URL instead.
+    """
+    router = request.registry.get(OWS_PROXY_ROUTER)
+    route = None
+    if router is not None and service.get('routes'):
+        route = router.route(service, process_identifier(request))
+    if route is None:
+        return relay_request(request, service)
+    url = router.acquire(route)
+    if url is None:
+        return OWSServiceUnavailable("Process is busy: {}".format(route.identifier))
+    try:
+        return relay_request(request, dict(service, url=url, endpoints=[]))
+    finally:
+        router.release(route, url)
+
+
+def relay_request(request: Request, service: ServiceConfig) -> Response:
+    """
+    Relays the request to the upstream endpoints of the service.
+
+    Layers hidden from the client by the policy are removed from WMS capabilities documents while they are streamed.
+    """
+    endpoint = select_endpoint(request, service)
+    url = service_request_url(request, service, endpoint)
     LOGGER.debug('url = {}'.format(url))
 
     # forward request to target (without Host Header)
@@ -83,22 +213,78 @@ def send_request(request: Request, service: ServiceConfig) -> Response:
     #
     service_type = service.get('type', 'wps')
     service_verify = service.get('verify', True)
-    if service_type and (service_type.lower() != 'wps'):
+    stream = bool(service_type and (service_type.lower() != 'wps'))
+    method = request.method.upper()
+    body = request.body
+    send = upstream_send(request.registry)
+
+    def upstream_request(upstream: str, stream: bool = stream) -> RequestsResponse:
+        with track_endpoint(request, upstream) as outcome:
+            resp = send(method=method, url=service_request_url(request, service, upstream), data=body,
+                        headers=h, stream=stream, verify=service_verify)
+            outcome['failed'] = resp.status_code >= 500
+        return resp
+
+    def hedged_request(upstream: str) -> RequestsResponse:
+        # returns once headers are received, so that hedging delays are not measured with the body download
+        return upstream_request(upstream, stream=True)
+
+    def send_upstream() -> Tuple[str, RequestsResponse]:
+        # only idempotent requests can be hedged
+        hedger = request.registry.get(OWS_PROXY_HEDGER)
+        if hedger is None or not is_idempotent(request):
+            return endpoint, upstream_request(endpoint)
+        return hedger.send(service['name'], hedged_request, endpoint, alternate_endpoint(request, service, endpoint))
+
+    if stream:
+        hidden = capabilities_hidden_layers(request, service)
+        caps_cache = request.registry.get(WMS_CAPABILITIES_CACHE) if hidden else None
+        caps_key = None
+        if caps_cache is not None:
+            caps_key = capabilities_cache_key(request, service, hidden)
+            cached = caps_cache.get(caps_key)
+            if cached is not None:
+                content_type, content = cached
+                headers = {'Content-Type': content_type} if content_type else {}
+                return Response(content, headers=headers, request=request)
         try:
-            resp_iter = requests.request(method=request.method.upper(), url=url, data=request.body, headers=h,
-                                         stream=True, verify=service_verify)
+            endpoint, resp_iter = send_upstream()
         except Exception as e:
             return OWSAccessFailed("Request failed: {}".format(e))
 
         # Headers meaningful only for a single transport-level connection
         hop_by_hop = ['connection', 'keep-alive', 'public', 'proxy-authenticate', 'transfer-encoding', 'upgrade']
-        return Response(app_iter=BufferedResponse(resp_iter),
-                        headers={k: v for k, v in list(resp_iter.headers.items()) if k.lower() not in hop_by_hop},
-                        status_code=resp_iter.status_code, request=request)
+        headers = {k: v for k, v in list(resp_iter.headers.items()) if k.lower() not in hop_by_hop}
+        chunk_size = relay_chunk_size(request, service)
+        if hidden and resp_iter.status_code == 200:
+            try:
+                app_iter = FilteredCapabilities(resp_iter, hidden, get_xml_limits(request), chunk_size,
+                                                cache=caps_cache, key=caps_key)
+            except (XMLSyntaxError, XMLLimitExceeded) as e:
+                resp_iter.close()
+                return OWSAccessFailed("Could not decode content: {}".format(e))
+            # content is decoded and its length changed
+            headers = {k: v for k, v in headers.items() if k.lower() not in ('content-length', 'content-encoding')}
+            return Response(app_iter=app_iter, headers=headers, status_code=resp_iter.status_code, request=request)
+        spool = request.registry.get(OWS_PROXY_SPOOL)
+        if spool is not None:
+            try:
+                app_iter = spool.spool(resp_iter, chunk_size=chunk_size)
+            except Exception as e:
+                return OWSAccessFailed("Request failed: {}".format(e))
+            if app_iter.length is not None:
+                headers = {k: v for k, v in headers.items() if k.lower() != 'content-length'}
+                headers['Content-Length'] = str(app_iter.length)
+            file_wrapper = request.environ.get('wsgi.file_wrapper')
+            if app_iter.spilled and file_wrapper is not None:
+                # let the WSGI server send the spooled file itself (e.g. with sendfile)
+                app_iter = file_wrapper(app_iter, chunk_size)
+        else:
+            app_iter = BufferedResponse(resp_iter, chunk_size)
+        return Response(app_iter=app_iter, headers=headers, status_code=resp_iter.status_code, request=request)
     else:
         try:
-            resp = requests.request(method=request.method.upper(), url=url, data=request.body, headers=h,
-                                    verify=service_verify)
+            endpoint, resp = send_upstream()
         except Exception as e:
             return OWSAccessFailed("Request failed: {}".format(e))
 
@@ -130,10 +316,12 @@ def send_request(request: Request, service: ServiceConfig) -> Response:
                 else:
                     public_url = request.route_url('owsproxy', service_name=service['name'])
                 # TODO: where do i need to replace urls?
-                content = replace_caps_url(resp.content, public_url, service['url'])
+                content = replace_caps_url(resp.content, public_url, endpoint, get_xml_limits(request))
             else:
                 # raw content
                 content = resp.content
+        except XMLLimitExceeded as e:
+            return OWSAccessFailed("Could not decode content: {}".format(e))
         except Exception:
             return OWSAccessFailed("Could not decode content.")
 
@@ -154,6 +342,50 @@ def owsproxy_base_url(container: AnySettingsContainer) -> str:
     return twitcher_url + owsproxy_path
 
 
+def owsproxy_offload_path(container: AnySettingsContainer) -> str:
+    settings = get_settings(container)
+    return settings.get('twitcher.ows_proxy_offload_path', '/_twitcher_upstream').rstrip('/').strip()
+
+
+def offload_enabled(request: Request, service: ServiceConfig, adapter: AdapterInterface) -> bool:
+    """
+    Whether the proxied request can be offloaded to the front-end web server.
+
+    The front-end web server cannot resolve the Unix domain socket location of the upstream service, route requests
+    to the backends of processes, nor filter the response for the policy rules of the service (e.g. remove hidden
+    layers from capabilities documents). Only ``GET`` and ``HEAD`` requests are offloaded, since the web server issues
+    the internal redirect as a request without body.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if not service.get('offload', False) or not adapter.offload_allowed(service) or service.get('routes'):
+        return False
+    if any(is_unix_socket_url(url) for url in service_endpoints(service)):
+        return False
+    policy = request.registry.get(OWS_POLICY)
+    return policy is None or not policy.covers(request, service['name'])
+
+
+def offload_request(request: Request, service: ServiceConfig) -> Response:
+    """
+    Delegates the proxied request to the front-end web server using an internal redirect header.
+
+    The returned response has no body. The front-end web server is expected to intercept the header
+    (``X-Accel-Redirect`` by default) and to proxy the original request to the location it refers to.
+    That location has the form ``{offload_path}/{scheme}/{host}/{path}?{query}``, so that an internal
+    location of the web server can rebuild the resolved service URL from it (see ``etc/nginx.conf``).
+    """
+    settings = get_settings(request)
+    header = settings.get('twitcher.ows_proxy_offload_header', 'X-Accel-Redirect')
+    parsed_url = urlparse.urlparse(service_request_url(request, service, select_endpoint(request, service)))
+    location = '{}/{}/{}{}'.format(owsproxy_offload_path(settings), parsed_url.scheme, parsed_url.netloc,
+                                   parsed_url.path or '/')
+    if parsed_url.query:
+        location += '?' + parsed_url.query
+    LOGGER.debug('offload location = {}'.format(location))
+    return Response(status=200, headers={header: location}, request=request)
+
+
 def owsproxy_view(request: Request) -> Response:
     service_name = request.matchdict.get('service_name')
     try:
@@ -167,9 +399,15 @@ def owsproxy_view(request: Request) -> Response:
     try:
         if not request.is_verified:
             raise OWSAccessForbidden("Access to service is forbidden.")
+        health_checker = request.registry.get(OWS_HEALTH_CHECKER)
+        if health_checker is not None and health_checker.is_down(service['name']):
+            LOGGER.debug("Service is known to be down by health checks: %s", service_name)
+            return OWSServiceUnavailable("Service is unavailable: {}".format(service_name))
         # since request can be modified by hooks, keep reference to original adapter
         # in order to ensure both request/response operations are handled by the same logic
         adapter = request.adapter
+        if offload_enabled(request, service, adapter):
+            return offload_request(request, service)
         request = adapter.request_hook(request, service)
         response = adapter.send_request(request, service)
         response = adapter.response_hook(response, service)
@@ -210,6 +448,19 @@ def owsproxy_defaultconfig(config: Configurator) -> None:
         config.include('twitcher.oauth2')
         config.include('twitcher.owsregistry')
         config.include('twitcher.owssecurity')
+        config.include('twitcher.owsverify')
+        config.include('twitcher.healthcheck')
+        config.include('twitcher.capabilities')
+        config.registry[OWS_PROXY_BALANCER] = UpstreamBalancer.from_settings(settings)
+        config.registry[OWS_PROXY_ROUTER] = ProcessRouter.from_settings(settings)
+        if asbool(settings.get('twitcher.dns_cache', False)):
+            dns_cache = config.registry[OWS_PROXY_DNS_CACHE] = DNSCache.from_settings(settings)
+            config.registry[OWS_PROXY_SESSION] = upstream_session(
+                dns_cache=dns_cache, pool_maxsize=int(settings.get('twitcher.ows_proxy_pool_maxsize', 10)))
+        if asbool(settings.get('twitcher.ows_proxy_hedging', False)):
+            config.registry[OWS_PROXY_HEDGER] = RequestHedger.from_settings(settings)
+        if asbool(settings.get('twitcher.ows_proxy_spool', False)):
+            config.registry[OWS_PROXY_SPOOL] = ResponseSpool.from_settings(settings)
         config.add_route('owsproxy', protected_path + '/proxy/{service_name}')
         config.add_route('owsproxy_extra', protected_path + '/proxy/{service_name}/{extra_path:.*}')
         config.add_route('owsverify', protected_path + '/verify/{service_name}')
@@ -38,6 +38,28 @@ class OWSRegistry(OWSRegistryInterface):
         else:
             return True
 
+    def add_service_endpoint(self, name, url):
+        """
+        Adds an upstream replica ``url`` to the OWS service with given ``name``.
+        """
+        try:
+            service = self.store.add_endpoint(name=name, url=url)
+        except Exception:
+            LOGGER.exception('add service endpoint failed')
+            return {}
+        return service.json()
+
+    def remove_service_endpoint(self, name, url):
+        """
+        Removes an upstream replica ``url`` from the OWS service with given ``name``.
+        """
+        try:
+            service = self.store.remove_endpoint(name=name, url=url)
+        except Exception:
+            LOGGER.exception('remove service endpoint failed')
+            return {}
+        return service.json()
+
     def get_service_by_name(self, name):
         """
         Gets service with given ``name`` from service store.
@@ -64,6 +86,19 @@ class OWSRegistry(OWSRegistryInterface):
         else:
             return service.json()
 
+    def get_services_by_names(self, names):
+        """
+        Gets services with given ``names`` from service store, mapped by name.
+        """
+        try:
+            services = {service.name: service.json() for service in self.store.fetch_by_names(names=names)}
+        except Exception as exc:
+            LOGGER.debug('Could not get services with names {}'.format(names), exc_info=exc)
+            LOGGER.error('Could not get services by names.')
+            return {}
+        else:
+            return services
+
     def list_services(self):
         """
         Lists all registered OWS services.
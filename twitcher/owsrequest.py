@@ -4,6 +4,7 @@ The OWSRequest is based on pywps code:
 * https://github.com/geopython/pywps/tree/pywps-3.2/pywps/Parser
 * https://github.com/geopython/pywps/blob/master/pywps/app/WPSRequest.py
 """
+import sys
 
 import lxml.etree
 
@@ -12,7 +13,15 @@ from twitcher.owsexceptions import (
     OWSNoApplicableCode,
     OWSInvalidParameterValue,
     OWSMissingParameterValue)
-from twitcher.utils import lxml_strip_ns
+from twitcher.spatial import parse_bbox
+from twitcher.xmlparser import (
+    XMLLimitExceeded,
+    XMLLimits,
+    XMLReader,
+    acquire_parser,
+    get_xml_limits,
+    release_parser,
+)
 
 allowed_service_types = ('wps', 'wms')
 allowed_request_types = {'wps': ('getcapabilities', 'describeprocess', 'execute', 'getstatus', 'getresult'),
@@ -26,15 +35,48 @@ public_request_types = {'wps': ('getcapabilities', 'describeprocess', 'getstatus
                         'wms': ('getcapabilities', )}
 allowed_versions = {'wps': ('1.0.0', '2.0.0'), 'wms': ('1.1.1', '1.3.0',)}
 
+# elements of the bounding box inputs of WPS requests
+BBOX_ELEMENTS = ('BoundingBox', 'BoundingBoxData')
+
 
 class OWSRequest(object):
     """
     ``OWSRequest`` parses on OWS request and provides methods to access the parameters.
+
+    When ``lazy``, the request is only parsed on first access to its parameters. Parsing is never repeated,
+    the same error is raised again if it failed.
     """
 
-    def __init__(self, request):
-        self.parser = ows_parser_factory(request)
-        self.parser.parse()
+    def __init__(self, request, lazy=False):
+        self._request = request
+        self._parser = None
+        self._error = None
+        if not lazy:
+            self.parse()
+
+    def parse(self):
+        if self._error is not None:
+            raise self._error
+        if self._parser is None:
+            try:
+                parser = ows_parser_factory(self._request)
+                parser.parse()
+            except Exception as exc:
+                self._error = exc
+                raise
+            self._parser = parser
+        return self._parser
+
+    @property
+    def parser(self):
+        return self.parse()
+
+    @property
+    def parsed(self):
+        """
+        Indicates if the request was already parsed, successfully or not.
+        """
+        return self._parser is not None or self._error is not None
 
     @property
     def service(self):
@@ -49,6 +91,49 @@ class OWSRequest(object):
     def version(self):
         return self.parser.params['version']
 
+    @property
+    def kvp(self):
+        """
+        All key-value pair parameters of the request, with lowercase names and original values.
+        """
+        return self.parser.kvp
+
+    @property
+    def identifier(self):
+        """
+        Process identifier of the request, if any. For XML requests, the body is only read until it is found.
+        """
+        parser = self.parser
+        if isinstance(parser, Post):
+            return parser.identifier
+        return parser.kvp.get('identifier')
+
+    @property
+    def layers(self):
+        """
+        Names of the WMS layers requested with the ``layers``, ``query_layers`` or ``layer`` parameters.
+        """
+        kvp = self.parser.kvp
+        names = ','.join(kvp.get(param) or '' for param in ('layers', 'query_layers', 'layer'))
+        return {name.strip() for name in names.split(',') if name.strip()}
+
+    @property
+    def bboxes(self):
+        """
+        Bounding boxes of the request normalized to longitude/latitude, from the WMS ``bbox`` parameter
+        or the bounding box inputs of WPS ``Execute`` XML requests.
+        """
+        try:
+            return self.parser.bboxes()
+        except ValueError as e:
+            raise OWSInvalidParameterValue("{}".format(e), value="bbox")
+
+    def param(self, name, default=None):
+        """
+        Value of the key-value pair parameter, with case-insensitive name (e.g. ``layers``, ``bbox``, ``identifier``).
+        """
+        return self.parser.kvp.get(name.lower(), default)
+
     def service_allowed(self):
         return self.service in allowed_service_types
 
@@ -70,6 +155,14 @@ class OWSParser(object):
     def __init__(self, request):
         self.request = request
         self.params = {}
+        self.kvp = {}
+
+    @staticmethod
+    def _index_params(params):
+        """
+        Case-insensitive index of the parameters, built in a single pass. Last value wins for repeated names.
+        """
+        return {name.lower(): value for name, value in params.items()}
 
     def parse(self):
         self._get_service()
@@ -77,6 +170,9 @@ class OWSParser(object):
         self._get_version()
         return self.params
 
+    def bboxes(self):
+        return []
+
     def _get_service(self):
         raise NotImplementedError
 
@@ -89,18 +185,14 @@ class OWSParser(object):
 
 class Get(OWSParser):
 
-    def _request_params(self):
-        new_params = {}
-        for param in self.request.params:
-            # new_params[param.lower()] = self.request.params.getone(param)
-            new_params[param.lower()] = self.request.params[param]
-        return new_params
+    def __init__(self, request):
+        super(Get, self).__init__(request)
+        self.kvp = self._index_params(request.params)
 
     def _get_param(self, param, allowed_values=None, optional=False):
         """Get parameter in GET request."""
-        request_params = self._request_params()
-        if param in request_params:
-            value = request_params[param].lower()
+        if param in self.kvp:
+            value = self.kvp[param].lower()
             if allowed_values is not None:
                 if value in allowed_values:
                     self.params[param] = value
@@ -112,6 +204,20 @@ class Get(OWSParser):
             raise OWSMissingParameterValue('Parameter "%s" is missing' % param, value=param)
         return self.params[param]
 
+    def bboxes(self):
+        if self.params.get('service') == 'wps':
+            if self.params.get('request') == 'execute' and self.kvp.get('datainputs'):
+                # bounding box inputs cannot be told from literal ones without the description of the process
+                raise OWSInvalidParameterValue("Bounding boxes of key-value pair Execute requests cannot be resolved, "
+                                               "use an XML request instead", value="DataInputs")
+            return []
+        if self.params.get('service') != 'wms' or not self.kvp.get('bbox'):
+            return []
+        crs = self.kvp.get('crs') or self.kvp.get('srs')
+        # WMS 1.3.0 follows the axis order of the coordinate reference system
+        latlon = True if self.params.get('version') == '1.3.0' else None
+        return [parse_bbox(self.kvp['bbox'], crs, latlon)]
+
     def _get_service(self):
         """Check mandatory service name parameter in GET request."""
         return self._get_param(param="service", allowed_values=allowed_service_types)
@@ -124,28 +230,136 @@ class Get(OWSParser):
         """Find requested version in GET request."""
         version = self._get_param(param="version", allowed_values=allowed_versions[self.params['service']],
                                   optional=True)
-        if version is None and self._get_request_type() != "getcapabilities":
+        if version is None and self.params['request'] != "getcapabilities":
             raise OWSMissingParameterValue('Parameter "version" is missing', value="version")
         else:
             return version
 
 
+def discard(element):
+    """
+    Frees the memory of an element read from a document, and of its preceding siblings.
+    """
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
 class Post(OWSParser):
+    """
+    Parser of OWS requests provided as XML body.
+
+    The body is parsed incrementally, only until the start tag of the root element providing the request type and
+    its ``service`` and ``version`` attributes, without building the whole document. The process ``Identifier``,
+    if required, is read further on demand.
+
+    The pull parser of the thread is used, and given back once the request is finished, unless parsing failed.
+    """
+    chunk_size = 4096
 
     def __init__(self, request):
         super(Post, self).__init__(request)
+        self.kvp = self._index_params(request.GET)
+        self._reader = XMLReader(self.request.body, get_xml_limits(request), acquire_parser(),
+                                 chunk_size=self.chunk_size)
+        self._failed = False
+        add_finished_callback = getattr(request, 'add_finished_callback', None)
+        if add_finished_callback is not None:
+            add_finished_callback(self._release_parser)
+        self._identifier = None
+        self._identifier_found = False
+        self._inside = []  # bounding box elements being read
+        self._bbox_values = []  # corners and CRS of the bounding boxes read
+        self._bboxes = None
+        self.root = self._pull(lambda event, element: event == 'start')
+        if self.root is None:
+            raise OWSNoApplicableCode("Document is empty")
+
+    @property
+    def consumed(self):
+        """Number of bytes of the body fed to the XML parser."""
+        return self._reader.consumed
 
+    def _release_parser(self, request):
+        if not self._failed:
+            release_parser(self._reader.parser, reset=True)
+
+    def _pull(self, found):
         try:
-            xml = self.request.body
-            self.document = lxml.etree.fromstring(xml)
-            lxml_strip_ns(self.document)
-        except Exception as e:
+            return self._reader.pull(found)
+        except lxml.etree.XMLSyntaxError as e:
+            self._failed = True
             raise OWSNoApplicableCode("{}".format(e))
+        except XMLLimitExceeded as e:
+            self._failed = True
+            raise OWSInvalidParameterValue("{}".format(e), value="request")
+
+    @property
+    def root_tag(self):
+        """Root tag name without namespace."""
+        return lxml.etree.QName(self.root).localname
+
+    def _collect(self, event, element):
+        """
+        Collects the process identifier and the bounding box inputs from the events of the body,
+        and returns whether the event is the end of the process identifier.
+        """
+        name = lxml.etree.QName(element).localname
+        if name in BBOX_ELEMENTS:
+            if event == 'start':
+                self._inside.append(element)
+                return False
+            self._inside.pop()
+            corners = {lxml.etree.QName(child).localname: child.text or '' for child in element}
+            if 'LowerCorner' in corners and 'UpperCorner' in corners:
+                self._bbox_values.append((corners['LowerCorner'].split() + corners['UpperCorner'].split(),
+                                          element.get('crs')))
+            return False
+        if event == 'end' and name == 'Identifier' and self._reader.depth == 1 and not self._identifier_found:
+            self._identifier = element.text.strip() if element.text else None
+            self._identifier_found = True
+            return True
+        return False
+
+    @property
+    def identifier(self):
+        """
+        Identifier of the first process of the request, read from the body until found.
+        """
+        if not self._identifier_found:
+            self._pull(self._collect)
+            self._identifier_found = True
+        return self._identifier
+
+    def bboxes(self):
+        """
+        Bounding box inputs of the process, wherever they are in the body.
+
+        The rest of the body is only scanned for bounding boxes, and its elements are discarded once read. The size
+        and element limits therefore do not apply to it, so that large requests proxied without being parsed are
+        not denied because the spatial extent of the service is restricted. Only the depth limit is enforced.
+        """
+        if self._bboxes is None:
+            limits = self._reader.limits
+            self._reader.limits = XMLLimits(max_size=sys.maxsize, max_depth=limits.max_depth, max_elements=sys.maxsize)
+
+            def found(event, element):
+                self._collect(event, element)
+                if event == 'end' and not self._inside:
+                    discard(element)
+                return False
+
+            self._pull(found)
+            self._identifier_found = True
+            self._bboxes = [parse_bbox(values, crs) for values, crs in self._bbox_values]
+        return self._bboxes
 
     def _get_service(self):
         """Check mandatory service name parameter in POST request."""
-        if "service" in self.document.attrib:
-            value = self.document.attrib["service"].lower()
+        if "service" in self.root.attrib:
+            value = self.root.attrib["service"].lower()
             if value in allowed_service_types:
                 self.params["service"] = value
             else:
@@ -156,7 +370,7 @@ class Post(OWSParser):
 
     def _get_request_type(self):
         """Find requested request type in POST request."""
-        value = self.document.tag.lower()
+        value = self.root_tag.lower()
         if value in allowed_request_types[self.params['service']]:
             self.params["request"] = value
         else:
@@ -165,14 +379,26 @@ class Post(OWSParser):
 
     def _get_version(self):
         """Find requested version in POST request."""
-        if "version" in self.document.attrib:
-            value = self.document.attrib["version"].lower()
+        if "version" in self.root.attrib:
+            value = self.root.attrib["version"].lower()
             if value in allowed_versions[self.params['service']]:
                 self.params["version"] = value
             else:
                 raise OWSInvalidParameterValue("Version %s is not supported" % value, value="version")
-        elif self._get_request_type() == "getcapabilities":
+        elif self.params['request'] == "getcapabilities":
             self.params["version"] = None
         else:
             raise OWSMissingParameterValue('Parameter "version" is missing', value="version")
         return self.params["version"]
+
+
+def get_ows_request(request):
+    """
+    OWS request shared by all components handling the HTTP request, parsed lazily at most once.
+    """
+    return OWSRequest(request, lazy=True)
+
+
+def includeme(config):
+    config.include('twitcher.xmlparser')
+    config.add_request_method(get_ows_request, 'ows_request', reify=True)
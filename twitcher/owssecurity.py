@@ -1,7 +1,12 @@
+from typing import Callable, Optional
+
+from pyramid.request import Request
 from pyramid.settings import asbool
 
 from twitcher.interface import OWSSecurityInterface
-from twitcher.owsrequest import OWSRequest
+from twitcher.models.service import ServiceConfig
+from twitcher.owsrequest import OWSRequest, allowed_service_types, allowed_request_types, public_request_types
+from twitcher.policy import OWS_POLICY, request_extent_allowed, request_hidden_layers
 from twitcher.utils import get_settings
 
 
@@ -12,31 +17,77 @@ class OWSSecurity(OWSSecurityInterface):
         This method verifies that the provided credentials are valid.
         Depending on the authentication configuration this could be
         a client X509 certificate or an OAuth2 token.
+
+        Access to public services is allowed without parsing the OWS request, unless policy rules apply to them.
+        WMS requests for layers hidden by the policy, and requests with bounding boxes outside the regions
+        allowed by the policy, are denied.
         """
-        ows_request = OWSRequest(request)
-        if ows_request.service_allowed() is False:
-            return False
         try:
             service_name = request.matchdict.get('service_name')
             service = request.owsregistry.get_service_by_name(service_name)
         except Exception:
             return False
+        if not service:
+            return False
+        policy = request.registry.get(OWS_POLICY)
+        covered = policy is not None and policy.covers(request, service['name'])
+        if service.get('public', False) is True and not covered:
+            return True
+        # requests not configured with 'twitcher.owsrequest' (e.g. custom callers) have no shared OWS request
+        ows_request = getattr(request, 'ows_request', None) or OWSRequest(request)
+        if ows_request.service_allowed() is False:
+            return False
+        if covered and ows_request.service == 'wms' and ows_request.request != 'getcapabilities':
+            hidden = request_hidden_layers(request, service['name'])
+            if hidden and not hidden.isdisjoint(ows_request.layers):
+                return False
+        if covered and not request_extent_allowed(request, service['name'], ows_request):
+            return False
+        identifier = ows_request.identifier if covered else None
+        return self.verify_access(request, service, ows_request.service, ows_request.request, identifier=identifier)
+
+    def verify_access(self,
+                      request: Request,
+                      service: ServiceConfig,
+                      service_type: str,
+                      request_type: str,
+                      identifier: Optional[str] = None,
+                      verify_token: Optional[Callable[[], bool]] = None,
+                      ) -> bool:
+        """Verify that the OWS request type is allowed for the resolved service.
+
+        Rules of the policy engine, if configured, take precedence over the built-in checks.
+
+        The credentials are verified with ``verify_token`` if provided, allowing the caller to validate
+        the token only once when verifying many requests. Otherwise, the token of the ``request`` is verified.
+        """
+        if service_type not in allowed_service_types or request_type not in allowed_request_types[service_type]:
+            return False
+        policy = request.registry.get(OWS_POLICY)
+        if policy is not None:
+            decision = policy.decide(request, service['name'], request_type, request.policy_subjects, identifier)
+            if decision is not None:
+                return decision
         if service.get('public', False) is True:
             return True
-        if ows_request.public_access() is True:
+        if request_type in public_request_types[service_type]:
             return True
         if service.get('auth', '') == 'cert':
             # Check the verification result of the client certificate.
             # Verification is done by nginx.
             return request.headers.get('X-Ssl-Client-Verify', '') == 'SUCCESS'
-        else:
-            # verify the oauth token for compute scope.
-            return request.verify_request(scopes=["compute"])
+        if verify_token is not None:
+            return verify_token()
+        # verify the oauth token for compute scope.
+        return request.verify_request(scopes=["compute"])
 
 
 def includeme(config):
     from twitcher.adapter import get_adapter_factory
     settings = get_settings(config)
+    config.include('twitcher.owsrequest')
+    if asbool(settings.get('twitcher.policy', False)):
+        config.include('twitcher.policy')
     security_enabled = asbool(settings.get('twitcher.ows_security', True))
 
     def is_verified(request):
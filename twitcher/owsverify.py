@@ -0,0 +1,301 @@
+"""
+Access verification of OWS services without performing the proxied requests.
+
+The ``/ows/verify`` endpoint verifies access to many services and OWS request types at once,
+with a single validation of the provided token and a single lookup of the services.
+
+The ``/ows/auth/{service_name}`` endpoint is intended for `nginx` ``auth_request`` subrequests.
+It performs the same verification as ``/ows/verify/{service_name}``, but only returns an empty response
+with status ``200`` (allowed), ``401`` (no credentials) or ``403`` (denied).
+
+Decisions of ``GET`` and ``HEAD`` requests without body are kept in a cache keyed by the requested path, the OWS
+service and request type, and a digest of the provided credentials. Cached decisions are answered by a tween placed
+in front of the transaction manager, so that repeated subrequests never reach the database, the OWS request parser
+or the token validation.
+Entries expire after ``twitcher.ows_verify_cache_ttl`` seconds, or earlier when the token itself expires.
+Allowed decisions are not answered anymore once their token is revoked (see :mod:`twitcher.revocation`),
+and decisions are keyed by the generation of the rules of the access policy, so that none outlives a reload.
+
+See also: https://docs.nginx.com/nginx/admin-guide/security-controls/configuring-subrequest-authentication/
+"""
+import calendar
+import hashlib
+from typing import Callable, List, Optional, Tuple
+
+import jwt
+from pyramid.config import Configurator
+from pyramid.registry import Registry
+from pyramid.request import Request
+from pyramid.response import Response
+from pyramid.settings import asbool
+from pyramid.tweens import INGRESS
+
+from twitcher import models
+from twitcher.cache import ExpiringCache
+from twitcher.oauth2 import jwt_token_id
+from twitcher.policy import OWS_POLICY
+from twitcher.typedefs import AnySettingsContainer, JSON
+from twitcher.utils import get_settings, now_secs
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_VERIFY_CACHE = 'owsverify_cache'
+
+DecisionKey = Tuple[str, Optional[str], Optional[str], Optional[str], Tuple[Tuple[str, str], ...], Optional[str],
+                    Optional[str], Optional[int]]
+# status of the decision, digest and identifier of its token
+Decision = Tuple[int, Optional[str], Optional[str]]
+
+
+def owsverify_base_path(container: AnySettingsContainer) -> str:
+    from twitcher.owsproxy import owsproxy_base_path
+    return owsproxy_base_path(container) + '/verify'
+
+
+def owsauth_base_path(container: AnySettingsContainer) -> str:
+    from twitcher.owsproxy import owsproxy_base_path
+    return owsproxy_base_path(container) + '/auth'
+
+
+def get_request_token(request: Request) -> Optional[str]:
+    """
+    Retrieves the bearer access token provided with the request, from either the header or query parameters.
+    """
+    auth = request.headers.get('Authorization', '')
+    if auth[:7].lower() == 'bearer ':
+        return auth[7:].strip() or None
+    return request.GET.get('access_token') or None
+
+
+def token_digest(token: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest() if token else None
+
+
+def credentials_digest(request: Request) -> Optional[str]:
+    """
+    Digest of the credentials provided by the request, so that no token is ever kept in memory.
+    """
+    token = get_request_token(request)
+    cookie = request.headers.get('Cookie')
+    if not token and not cookie:
+        return None
+    return hashlib.sha256('{}\n{}'.format(token or '', cookie or '').encode('utf-8')).hexdigest()
+
+
+def decision_key(request: Request) -> Optional[DecisionKey]:
+    """
+    Key of the cached verification decision for the request, or ``None`` if it cannot be cached.
+
+    Only query parameters are considered. Requests with another method than ``GET`` or ``HEAD``, or with a body,
+    can be resolved differently from the body (e.g. a WPS ``Execute`` request posted with a ``GetCapabilities``
+    query), and are therefore never cached. Neither are requests while the access policy is due to be reloaded.
+    """
+    if request.method not in ('GET', 'HEAD') or request.content_length or request.headers.get('Transfer-Encoding'):
+        return None
+    generation = None
+    policy = request.registry.get(OWS_POLICY)
+    if policy is not None:
+        generation = policy.generation()
+        if generation is None:
+            return None
+    ows_service = ows_request = identifier = None
+    resources = []
+    for param, value in request.GET.items():
+        param = param.lower()
+        if param == 'service':
+            ows_service = value.lower()
+        elif param == 'request':
+            ows_request = value.lower()
+        elif param == 'identifier':
+            # decisions of the policy engine can depend on the process
+            identifier = value
+        elif param in ('layers', 'query_layers', 'layer', 'bbox', 'crs', 'srs'):
+            # and on the requested WMS layers and extent
+            resources.append((param, value))
+    if ows_request is None:
+        return None
+    cert_verify = request.headers.get('X-Ssl-Client-Verify')
+    return (request.path_info, ows_service, ows_request, identifier, tuple(sorted(resources)),
+            credentials_digest(request), cert_verify, generation)
+
+
+def token_claims(request: Request, token: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Expiration time of the access token in seconds since the Epoch and its identifier, if they can be resolved.
+
+    Only JWT tokens have an identifier, random tokens are revoked by deleting them.
+    """
+    if not token:
+        return None, None
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+        exp = claims.get('exp')
+        return int(exp) if exp is not None else None, jwt_token_id(claims)
+    except jwt.InvalidTokenError:
+        pass
+    try:
+        query = request.dbsession.query(models.Token.expires)
+        expires = query.filter(models.Token.access_token == token).scalar()
+    except Exception as exc:
+        LOGGER.debug("Could not resolve token expiry.", exc_info=exc)
+        return None, None
+    if expires is None:
+        return None, None
+    return calendar.timegm(expires.utctimetuple()), None
+
+
+def forget_token(registry: Registry, token: str) -> int:
+    """
+    Removes the cached decisions of requests provided with the token, and returns how many were removed.
+    """
+    cache = registry.get(OWS_VERIFY_CACHE)
+    if cache is None:
+        return 0
+    digest = token_digest(token)
+    return cache.evict(lambda key, decision: decision[1] == digest)
+
+
+def owsauth_view(request: Request) -> Response:
+    """
+    Verifies if request access is allowed and caches the decision for following identical requests.
+    """
+    status = 403
+    try:
+        service_name = request.matchdict.get('service_name')
+        service = request.owsregistry.get_service_by_name(service_name)
+        if service and request.is_verified:
+            status = 200
+        elif not get_request_token(request):
+            status = 401
+    except Exception as exc:
+        # denied, but not cached since the error (e.g. database unavailable) can be transient
+        LOGGER.debug("Security check failed due to unhandled error.", exc_info=exc)
+        return Response(status=status, request=request)
+    key = decision_key(request)
+    cache = request.registry.get(OWS_VERIFY_CACHE)
+    if cache is not None and key is not None:
+        from twitcher.revocation import OAUTH2_REVOCATION
+
+        ttl = None
+        token = get_request_token(request)
+        expiry, token_id = token_claims(request, token)
+        if expiry is not None:
+            ttl = expiry - now_secs()
+        revocation = request.registry.get(OAUTH2_REVOCATION)
+        if token and token_id is None and revocation is not None:
+            # revoked by deleting it, possibly by another worker, which is only noticed once validated again
+            ttl = revocation.refresh_interval if ttl is None else min(ttl, revocation.refresh_interval)
+        cache.set(key, (status, token_digest(token), token_id), ttl=ttl)
+    return Response(status=status, request=request)
+
+
+def verify_batch(request: Request, items: List[JSON]) -> List[JSON]:
+    """
+    Verifies access to each item defined by ``service``, ``request`` (OWS request type) and optional ``identifier``.
+
+    The token of the request is validated at most once, and only if an item requires it.
+    Items are returned with their ``access`` decision, in the same order.
+    """
+    from twitcher.adapter import get_adapter_factory
+
+    decisions = []
+    for item in items:
+        decisions.append({
+            'service': str(item.get('service') or ''),
+            'request': str(item.get('request') or '').lower(),
+            'identifier': item.get('identifier'),
+            'access': False,
+        })
+    if not asbool(get_settings(request).get('twitcher.ows_security', True)):
+        for decision in decisions:
+            decision['access'] = True
+        return decisions
+
+    services = request.owsregistry.get_services_by_names({decision['service'] for decision in decisions})
+    security = get_adapter_factory(request).owssecurity_factory()
+    token_verified = []
+
+    def verify_token() -> bool:
+        if not token_verified:
+            token_verified.append(bool(request.verify_request(scopes=["compute"])))
+        return token_verified[0]
+
+    for decision in decisions:
+        service = services.get(decision['service'])
+        if not service:
+            continue
+        service_type = str(service.get('type') or 'wps').lower()
+        try:
+            decision['access'] = bool(security.verify_access(
+                request, service, service_type, decision['request'],
+                identifier=decision['identifier'], verify_token=verify_token))
+        except NotImplementedError:
+            LOGGER.warning("Security implementation [%s] does not support batch verification.", type(security))
+            break
+        except Exception as exc:
+            LOGGER.debug("Security check failed due to unhandled error.", exc_info=exc)
+    return decisions
+
+
+def owsverify_batch_view(request: Request) -> Response:
+    """
+    Verifies access to a list of services and OWS request types, without performing any proxied request.
+
+    The body must be a JSON object with a ``requests`` list of ``{"service", "request", "identifier"}`` items.
+    The token can be provided as usual with the ``Authorization`` header, or with the ``token`` body field.
+    """
+    try:
+        body = request.json_body
+        items = body['requests']
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError("Invalid list of requests.")
+    except Exception as exc:
+        return Response(json={"description": "Invalid body: {!s}".format(exc)}, status=400, request=request)
+    token = body.get('token')
+    if token:
+        request.headers['Authorization'] = 'Bearer {}'.format(token)
+    return Response(json={"decisions": verify_batch(request, items)}, status=200, request=request)
+
+
+def owsauth_tween_factory(handler: Callable[[Request], Response], registry: Registry) -> Callable:
+    """
+    Answers cached verification decisions before any other tween is involved, including the transaction manager.
+
+    Allowed decisions are verified first not to be of a token revoked since, possibly by another worker.
+    """
+    from twitcher.revocation import OAUTH2_REVOCATION
+
+    cache = registry.get(OWS_VERIFY_CACHE)
+    prefix = owsauth_base_path(registry) + '/'
+    if cache is None:
+        return handler
+
+    def owsauth_tween(request: Request) -> Response:
+        if request.path_info.startswith(prefix):
+            key = decision_key(request)
+            decision = cache.get(key) if key is not None else None  # type: Optional[Decision]
+            if decision is not None:
+                status, _, token_id = decision
+                revocation = registry.get(OAUTH2_REVOCATION)
+                if status != 200 or revocation is None or not revocation.is_revoked(token_id):
+                    return Response(status=status, request=request)
+                cache.pop(key)
+        return handler(request)
+    return owsauth_tween
+
+
+def includeme(config: Configurator) -> None:
+    settings = get_settings(config)
+    ttl = float(settings.get('twitcher.ows_verify_cache_ttl', 30))
+    if ttl > 0:
+        maxsize = int(settings.get('twitcher.ows_verify_cache_size', 10000))
+        config.registry[OWS_VERIFY_CACHE] = ExpiringCache(maxsize=maxsize, ttl=ttl)
+        config.add_tween('twitcher.owsverify.owsauth_tween_factory', under=INGRESS)
+    config.add_route('owsverify_batch', owsverify_base_path(settings), request_method='POST')
+    config.add_view(owsverify_batch_view, route_name='owsverify_batch')
+    auth_path = owsauth_base_path(settings)
+    config.add_route('owsauth', auth_path + '/{service_name}')
+    config.add_route('owsauth_extra', auth_path + '/{service_name}/{extra_path:.*}')
+    config.add_view(owsauth_view, route_name='owsauth')
+    config.add_view(owsauth_view, route_name='owsauth_extra')
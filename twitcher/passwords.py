@@ -0,0 +1,166 @@
+"""
+Hashing and verification of passwords and secrets.
+
+Stored values are recognized by their format:
+
+``scrypt$<n>$<r>$<p>$<salt>$<hash>``
+    `scrypt` hash computed with :func:`hashlib.scrypt` (default).
+
+``pbkdf2_sha256$<iterations>$<salt>$<hash>``
+    PBKDF2-HMAC-SHA256 hash, compatible with Django.
+
+``$2b$...``
+    `bcrypt` hash, requires the ``bcrypt`` package (``pip install pyramid_twitcher[bcrypt]``).
+
+``$argon2id$...``
+    `argon2` hash, requires the ``argon2-cffi`` package (``pip install pyramid_twitcher[argon2]``).
+
+Any other value is a plain-text password. All comparisons are performed in constant time.
+
+Since verifying a hash is deliberately slow, :class:`PasswordVerifier` caches successful verifications for a short
+time, keyed by a keyed digest of the credentials that is only known to the worker process.
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+from twitcher.cache import ExpiringCache
+from twitcher.typedefs import Number
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+SCRYPT = 'scrypt'
+PBKDF2 = 'pbkdf2_sha256'
+BCRYPT = 'bcrypt'
+ARGON2 = 'argon2'
+PASSWORD_SCHEMES = (SCRYPT, PBKDF2, BCRYPT, ARGON2)
+
+SCRYPT_PARAMS = dict(n=2 ** 14, r=8, p=1)
+PBKDF2_ITERATIONS = 600000
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+def password_scheme(stored: str) -> str:
+    """
+    Scheme of the stored password, or ``plain`` if it is not hashed.
+    """
+    if stored.startswith(SCRYPT + '$'):
+        return SCRYPT
+    if stored.startswith(PBKDF2 + '$'):
+        return PBKDF2
+    if stored[:4] in ('$2a$', '$2b$', '$2y$'):
+        return BCRYPT
+    if stored.startswith('$argon2'):
+        return ARGON2
+    return 'plain'
+
+
+def is_hashed(stored: str) -> bool:
+    return password_scheme(stored) != 'plain'
+
+
+def hash_password(password: str, scheme: str = SCRYPT) -> str:
+    """
+    Hashes the password with a random salt, in the format recognized by :func:`verify_password`.
+
+    :raises ValueError: if the scheme is unknown.
+    """
+    secret = password.encode('utf-8')
+    if scheme == SCRYPT:
+        salt = os.urandom(16)
+        params = SCRYPT_PARAMS
+        digest = hashlib.scrypt(secret, salt=salt, maxmem=64 * 1024 * 1024, **params)
+        return '{}${}${}${}${}${}'.format(SCRYPT, params['n'], params['r'], params['p'],
+                                          _b64encode(salt), _b64encode(digest))
+    if scheme == PBKDF2:
+        salt = _b64encode(os.urandom(12))
+        digest = hashlib.pbkdf2_hmac('sha256', secret, salt.encode('ascii'), PBKDF2_ITERATIONS)
+        return '{}${}${}${}'.format(PBKDF2, PBKDF2_ITERATIONS, salt, base64.b64encode(digest).decode('ascii'))
+    if scheme == BCRYPT:
+        import bcrypt
+        return bcrypt.hashpw(secret, bcrypt.gensalt()).decode('ascii')
+    if scheme == ARGON2:
+        from argon2 import PasswordHasher
+        return PasswordHasher().hash(password)
+    raise ValueError("Unknown password scheme: {}".format(scheme))
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Verifies the password against the stored hash or plain-text password.
+
+    Malformed hashes, and hashes of schemes whose package is not installed, never match.
+    """
+    secret = password.encode('utf-8')
+    scheme = password_scheme(stored)
+    try:
+        if scheme == SCRYPT:
+            _, n, r, p, salt, expected = stored.split('$')
+            expected = _b64decode(expected)
+            digest = hashlib.scrypt(secret, salt=_b64decode(salt), n=int(n), r=int(r), p=int(p),
+                                    maxmem=64 * 1024 * 1024, dklen=len(expected))
+            return hmac.compare_digest(digest, expected)
+        if scheme == PBKDF2:
+            _, iterations, salt, expected = stored.split('$')
+            digest = hashlib.pbkdf2_hmac('sha256', secret, salt.encode('ascii'), int(iterations))
+            return hmac.compare_digest(digest, base64.b64decode(expected))
+        if scheme == BCRYPT:
+            import bcrypt
+            return bcrypt.checkpw(secret, stored.encode('ascii'))
+        if scheme == ARGON2:
+            from argon2 import PasswordHasher
+            from argon2.exceptions import VerificationError, InvalidHashError
+            try:
+                return PasswordHasher().verify(stored, password)
+            except (VerificationError, InvalidHashError):
+                return False
+    except ImportError:
+        LOGGER.error("Cannot verify %s password hash, the required package is not installed.", scheme)
+        return False
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(secret, stored.encode('utf-8'))
+
+
+class PasswordVerifier(object):
+    """
+    Verifies passwords against their stored value, caching successful verifications for ``cache_ttl`` seconds.
+
+    The stored value is kept with each entry, such that changing it invalidates the entries of the previous one.
+    """
+
+    def __init__(self, cache_ttl: Number = 60, cache_size: int = 1024) -> None:
+        self.cache = ExpiringCache(maxsize=cache_size, ttl=cache_ttl)
+        self._key = os.urandom(32)
+        self._dummy = None
+
+    def digest(self, identity: str, password: str) -> bytes:
+        return hmac.new(self._key, '{}\n{}'.format(identity, password).encode('utf-8'), hashlib.sha256).digest()
+
+    def verify(self, identity: str, password: str, stored: str) -> bool:
+        key = self.digest(identity, password)
+        if self.cache.get(key) == stored:
+            return True
+        if not verify_password(password, stored):
+            return False
+        self.cache.set(key, stored)
+        return True
+
+    def reject(self, password: str) -> bool:
+        """
+        Verifies the password against a dummy hash and returns ``False``, for identities that are unknown,
+        so that they cannot be told apart by the verification time.
+        """
+        if self._dummy is None:
+            self._dummy = hash_password(os.urandom(16).hex())
+        verify_password(password, self._dummy)
+        return False
@@ -0,0 +1,401 @@
+"""
+Declarative access policy of OWS services.
+
+Rules grant (``allow``) or refuse (``deny``) access to a ``service`` for an OWS ``request`` type, optionally
+restricted to a process ``identifier``, to a ``subject`` among:
+
+``*``
+    Anyone, including anonymous requests.
+
+``cert``
+    Requests with a client certificate verified by the front-end web server.
+
+``client:<client_id>``
+    Requests with a valid access token issued to the client application.
+
+``scope:<scope>``
+    Requests with a valid access token having the scope.
+
+Every criterion accepts ``*`` to match any value. When several rules match a request, ``deny`` overrides
+``allow``. Requests matched by no rule are verified with the built-in checks of
+:class:`twitcher.owssecurity.OWSSecurity`.
+
+Rules with a WMS ``layer`` restrict that layer of the service instead, whatever the request type. A layer named by
+any rule is only available to subjects it is allowed to, and never to subjects it is denied to. Layers hidden from
+the subjects of a request cannot be requested with ``GetMap`` or ``GetFeatureInfo``, and are removed from the
+capabilities document (see :mod:`twitcher.capabilities`).
+
+Rules with a ``bbox`` (``minx,miny,maxx,maxy`` in longitude/latitude) restrict the spatial extent of requests to
+the service instead, whatever the request type. Requests with a bounding box intersecting a region denied to any of
+their subjects are denied. Once a region is allowed to any subject of a service, bounding boxes of requests to the
+service must be contained in a region allowed to one of their subjects. Regions are indexed in a grid of
+``twitcher.policy_grid_size`` degrees (see :mod:`twitcher.spatial`).
+
+Rules are loaded from a JSON file (``twitcher.policy_file``) or from the database, and compiled into a table
+indexed by service, request type and subject. A decision therefore only probes a few keys of that table,
+whatever the number of rules. The source is checked for changes at most every ``twitcher.policy_reload_interval``
+seconds, and rules are compiled again when they changed.
+"""
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from pyramid.request import Request
+from sqlalchemy import func
+
+from twitcher import models
+from twitcher.spatial import BBox, RegionIndex, extent_allowed, parse_bbox
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_POLICY = 'ows_policy'
+
+ANY = '*'
+ALLOW = 'allow'
+DENY = 'deny'
+POLICY_EFFECTS = (ALLOW, DENY)
+
+PolicyKey = Tuple[str, str, str]
+SubjectKey = Tuple[str, str]
+
+
+def normalize_rule(rule: Dict) -> Dict[str, str]:
+    """
+    Rule with all its criteria, lower-cased except the identifier, layer and subject which are case-sensitive.
+
+    :raises ValueError: if the effect of the rule is unknown.
+    """
+    effect = str(rule.get('effect') or ALLOW).lower()
+    if effect not in POLICY_EFFECTS:
+        raise ValueError("Unknown policy effect: {}".format(effect))
+    bbox = rule.get('bbox') or ANY
+    if isinstance(bbox, (list, tuple)):
+        bbox = ','.join(str(coordinate) for coordinate in bbox)
+    return {
+        'service': str(rule.get('service') or ANY),
+        'request': str(rule.get('request') or ANY).lower(),
+        'identifier': str(rule.get('identifier') or ANY),
+        'layer': str(rule.get('layer') or ANY),
+        'bbox': str(bbox),
+        'subject': str(rule.get('subject') or ANY),
+        'effect': effect,
+    }
+
+
+class PolicyTable(object):
+    """
+    Rules compiled into a table indexed by service, request type and subject,
+    holding the effect for each process identifier, and a table of layer rules indexed by service and subject,
+    holding the effect for each layer, as well as the regions of each service and subject.
+
+    :raises ValueError: if a rule is invalid.
+    """
+
+    def __init__(self, rules: Iterable[Dict], cell_size: float = 5.0) -> None:
+        self.table = {}  # type: Dict[PolicyKey, Dict[str, str]]
+        self.layers = {}  # type: Dict[SubjectKey, Dict[str, str]]
+        self.regions = {}  # type: Dict[SubjectKey, RegionIndex]
+        self.spatial = set()  # services with regions
+        self.bounded = set()  # services with allowed regions
+        self.services = set()
+        self.size = 0
+        self._hidden = {}  # type: Dict[Tuple[str, Tuple[str, ...]], FrozenSet[str]]
+        restricted = {}
+        for rule in rules:
+            rule = normalize_rule(rule)
+            self.services.add(rule['service'])
+            self.size += 1
+            if rule['bbox'] != ANY:
+                index = self.regions.get((rule['service'], rule['subject']))
+                if index is None:
+                    index = self.regions[(rule['service'], rule['subject'])] = RegionIndex(cell_size)
+                index.add(parse_bbox(rule['bbox']), allow=rule['effect'] == ALLOW)
+                self.spatial.add(rule['service'])
+                if rule['effect'] == ALLOW:
+                    self.bounded.add(rule['service'])
+                continue
+            if rule['layer'] != ANY:
+                effects = self.layers.setdefault((rule['service'], rule['subject']), {})
+                restricted.setdefault(rule['service'], set()).add(rule['layer'])
+                key = rule['layer']
+            else:
+                effects = self.table.setdefault((rule['service'], rule['request'], rule['subject']), {})
+                key = rule['identifier']
+            if effects.get(key) != DENY:
+                effects[key] = rule['effect']
+        # layers named by rules of each service
+        self.restricted = {service: frozenset(layers) for service, layers in restricted.items()
+                           }  # type: Dict[str, FrozenSet[str]]
+
+    def covers(self, service: str) -> bool:
+        """
+        Whether any rule applies to the service.
+        """
+        return service in self.services or ANY in self.services
+
+    def decide(self, service: str, request: str, subjects: Iterable[str], identifier: Optional[str] = None
+               ) -> Optional[bool]:
+        """
+        Access decision for the request, or ``None`` if no rule matches it.
+        """
+        decision = None
+        identifiers = (identifier, ANY) if identifier and identifier != ANY else (ANY, )
+        for service_key in (service, ANY):
+            for request_key in (request, ANY):
+                for subject in subjects:
+                    effects = self.table.get((service_key, request_key, subject))
+                    if not effects:
+                        continue
+                    for identifier_key in identifiers:
+                        effect = effects.get(identifier_key)
+                        if effect == DENY:
+                            return False
+                        if effect == ALLOW:
+                            decision = True
+        return decision
+
+    def restricts_layers(self, service: str) -> bool:
+        return bool(self.restricted.get(service) or self.restricted.get(ANY))
+
+    def hidden_layers(self, service: str, subjects: Iterable[str]) -> FrozenSet[str]:
+        """
+        Layers of the service that are not available to the subjects.
+
+        The set is computed once for each combination of subjects, which is shared by all clients with the same
+        credentials, such as every anonymous request, or every token of a client application with the same scopes.
+        """
+        key = (service, tuple(subjects))
+        hidden = self._hidden.get(key)
+        if hidden is None:
+            restricted = self.restricted.get(service, frozenset()) | self.restricted.get(ANY, frozenset())
+            allowed, denied = set(), set()
+            if restricted:
+                for service_key in (service, ANY):
+                    for subject in key[1]:
+                        for layer, effect in self.layers.get((service_key, subject), {}).items():
+                            (denied if effect == DENY else allowed).add(layer)
+            hidden = self._hidden[key] = frozenset(denied | (restricted - allowed))
+        return hidden
+
+    def restricts_extent(self, service: str) -> bool:
+        return service in self.spatial or ANY in self.spatial
+
+    def extent_allowed(self, service: str, subjects: Iterable[str], bboxes: Iterable[BBox]) -> bool:
+        """
+        Whether the bounding boxes, in longitude/latitude, are allowed to the subjects by the regions of the service.
+        """
+        indexes = [index for index in (self.regions.get((service_key, subject))
+                                       for service_key in (service, ANY) for subject in subjects) if index]
+        restricted = service in self.bounded or ANY in self.bounded
+        return extent_allowed(indexes, bboxes, restricted)
+
+
+class FilePolicySource(object):
+    """
+    Rules defined in a JSON file, as a list of rules or an object with a ``rules`` list.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def version(self, request: Optional[Request] = None) -> Tuple[float, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime, stat.st_size
+
+    def load(self, request: Optional[Request] = None) -> List[Dict]:
+        with open(self.path) as policy_file:
+            rules = json.load(policy_file)
+        if isinstance(rules, dict):
+            rules = rules.get('rules', [])
+        return rules
+
+
+class DatabasePolicySource(object):
+    """
+    Rules stored in the ``policy_rules`` table.
+    """
+
+    def version(self, request: Request) -> Tuple:
+        query = request.dbsession.query(func.count(models.PolicyRule.id), func.max(models.PolicyRule.updated))
+        return tuple(query.one())
+
+    def load(self, request: Request) -> List[Dict]:
+        return [rule.json() for rule in request.dbsession.query(models.PolicyRule).all()]
+
+
+class PolicyEngine(object):
+    """
+    Access decisions according to the compiled rules of the policy, reloaded when they change.
+
+    :param source: source of the rules, with ``version`` and ``load`` methods.
+    :param reload_interval: minimum seconds between checks of the source for changes.
+    :param cell_size: size in degrees of the grid cells indexing regions.
+    """
+
+    def __init__(self,
+                 source,
+                 reload_interval: Number = 5,
+                 timer: Callable[[], float] = time.monotonic,
+                 cell_size: float = 5.0,
+                 ) -> None:
+        self.source = source
+        self.reload_interval = reload_interval
+        self.cell_size = cell_size
+        self.timer = timer
+        self._table = PolicyTable([])
+        self._version = None
+        self._generation = 0
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'PolicyEngine':
+        settings = get_settings(container)
+        path = settings.get('twitcher.policy_file')
+        source = FilePolicySource(path) if path else DatabasePolicySource()
+        return cls(source,
+                   reload_interval=float(settings.get('twitcher.policy_reload_interval', 5)),
+                   cell_size=float(settings.get('twitcher.policy_grid_size', 5)))
+
+    def load(self, rules: Iterable[Dict], version=None) -> None:
+        """
+        Compiles the rules, replacing the current ones.
+        """
+        table = PolicyTable(rules, self.cell_size)
+        self._table = table
+        self._version = version
+        self._generation += 1
+        LOGGER.info("Loaded %s policy rules.", table.size)
+
+    def table(self, request: Optional[Request] = None) -> PolicyTable:
+        """
+        Compiled rules, reloaded first if the source changed since they were loaded.
+
+        Failures to reload are logged and the current rules are kept.
+        """
+        now = self.timer()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return self._table
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+                self._checked_at = now
+                try:
+                    version = self.source.version(request)
+                    if version != self._version:
+                        self.load(self.source.load(request), version)
+                except Exception as exc:
+                    LOGGER.error("Could not reload policy rules: %s", exc)
+        return self._table
+
+    def generation(self) -> Optional[int]:
+        """
+        Number of times the rules were loaded, or ``None`` if the source is due to be checked for changes,
+        so that decisions taken with the current rules are not reused once they could be outdated.
+        """
+        if self._checked_at is None or self.timer() - self._checked_at >= self.reload_interval:
+            return None
+        return self._generation
+
+    def covers(self, request: Request, service: str) -> bool:
+        return self.table(request).covers(service)
+
+    def decide(self,
+               request: Request,
+               service: str,
+               request_type: str,
+               subjects: Iterable[str],
+               identifier: Optional[str] = None,
+               ) -> Optional[bool]:
+        """
+        Access decision for the OWS request, or ``None`` if no rule matches it.
+        """
+        return self.table(request).decide(service, request_type, subjects, identifier)
+
+    def hidden_layers(self, request: Request, service: str, subjects: Iterable[str]) -> FrozenSet[str]:
+        """
+        WMS layers of the service that are not available to the subjects.
+        """
+        return self.table(request).hidden_layers(service, subjects)
+
+    def restricts_layers(self, request: Request, service: str) -> bool:
+        return self.table(request).restricts_layers(service)
+
+    def restricts_extent(self, request: Request, service: str) -> bool:
+        return self.table(request).restricts_extent(service)
+
+    def extent_allowed(self, request: Request, service: str, subjects: Iterable[str], bboxes: Iterable[BBox]) -> bool:
+        return self.table(request).extent_allowed(service, subjects, bboxes)
+
+    def json(self) -> Dict[str, int]:
+        return {'rules': self._table.size}
+
+
+def policy_subjects(request: Request) -> List[str]:
+    """
+    Subjects of the policy matching the credentials of the request.
+
+    The access token, if any, is validated once for any scope. Its client and scopes are provided
+    by the token validator (see :mod:`twitcher.oauth2`).
+    """
+    from twitcher.owsverify import get_request_token
+
+    subjects = [ANY]
+    if request.headers.get('X-Ssl-Client-Verify', '') == 'SUCCESS':
+        subjects.append('cert')
+    if get_request_token(request):
+        try:
+            valid = request.verify_request(scopes=None)
+        except Exception as exc:
+            LOGGER.debug("Token validation failed.", exc_info=exc)
+            valid = False
+        if valid:
+            client_id = getattr(getattr(request, 'client', None), 'client_id', None)
+            if client_id:
+                subjects.append('client:{}'.format(client_id))
+            subjects.extend('scope:{}'.format(scope) for scope in getattr(request, 'scopes', None) or [])
+    return subjects
+
+
+def request_hidden_layers(request: Request, service: str) -> FrozenSet[str]:
+    """
+    WMS layers of the service hidden from the client of the request, if the policy engine is configured.
+
+    Credentials of the request are only verified if rules restrict layers of the service.
+    """
+    policy = request.registry.get(OWS_POLICY)
+    if policy is None or not policy.restricts_layers(request, service):
+        return frozenset()
+    return policy.hidden_layers(request, service, request.policy_subjects)
+
+
+def request_extent_allowed(request: Request, service: str, ows_request) -> bool:
+    """
+    Whether the bounding boxes of the OWS request are allowed to the client of the request,
+    if the policy engine is configured.
+
+    Requests are denied if their bounding boxes cannot be resolved while regions restrict the service.
+    """
+    from twitcher.owsexceptions import OWSException
+
+    policy = request.registry.get(OWS_POLICY)
+    if policy is None or not policy.restricts_extent(request, service):
+        return True
+    try:
+        bboxes = ows_request.bboxes
+    except OWSException as exc:
+        LOGGER.debug("Could not resolve bounding boxes of request: %s", exc)
+        return False
+    if not bboxes:
+        return True
+    return policy.extent_allowed(request, service, request.policy_subjects, bboxes)
+
+
+def includeme(config):
+    settings = get_settings(config)
+    config.registry[OWS_POLICY] = PolicyEngine.from_settings(settings)
+    config.add_request_method(policy_subjects, 'policy_subjects', reify=True)
@@ -0,0 +1,58 @@
+"""
+Relay of upstream response bodies.
+
+The body is read from the raw HTTP stream underneath `urllib3` with ``readinto`` into a single preallocated buffer,
+bypassing the decoding layer of `requests` and the intermediate buffers of `urllib3` that allocate and copy every
+chunk. The relayed bytes are therefore exactly those sent by the upstream service, matching its forwarded
+``Content-Encoding`` and ``Content-Length`` headers.
+"""
+import http.client
+import io
+from typing import Iterator, Optional
+
+from requests.models import Response as RequestsResponse
+
+from twitcher.models.service import ServiceConfig
+from twitcher.typedefs import AnySettingsContainer
+from twitcher.utils import get_settings
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def relay_chunk_size(container: AnySettingsContainer, service: Optional[ServiceConfig] = None) -> int:
+    """
+    Size of the chunks relayed for the service, or the configured default one.
+    """
+    if service and service.get('chunk_size'):
+        return int(service['chunk_size'])
+    return int(get_settings(container).get('twitcher.ows_proxy_chunk_size', DEFAULT_CHUNK_SIZE))
+
+
+def iter_raw(resp: RequestsResponse, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[memoryview]:
+    """
+    Iterates over the raw body of the response, read into a reused buffer.
+
+    Each yielded view is only valid until the next iteration, and must be consumed or copied before.
+    The upstream connection is released back to its pool once the body is fully read.
+    """
+    raw = getattr(resp, 'raw', None)
+    fp = getattr(raw, '_fp', None)
+    if isinstance(fp, http.client.HTTPResponse):
+        readinto = fp.readinto
+    elif isinstance(raw, io.IOBase):
+        readinto = raw.readinto
+    else:
+        # not an HTTP stream (e.g. mocked response), use the content iterator of requests
+        for data in resp.iter_content(chunk_size):
+            yield memoryview(data)
+        return
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        size = readinto(buffer)
+        if not size:
+            break
+        yield view[:size]
+    release = getattr(raw, 'release_conn', None)
+    if release is not None:
+        release()
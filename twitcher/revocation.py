@@ -0,0 +1,347 @@
+"""
+Revocation of access tokens before they expire, with the ``/oauth/revoke`` endpoint (:rfc:`7009`).
+
+Random tokens are simply deleted from the database. JWT tokens (signed, custom and Keycloak tokens) are validated
+without the database, and are therefore revoked by recording their identifier (``jti`` or ``ref`` claim) in the
+``revoked_token`` table until they expire.
+
+Each worker mirrors the revoked identifiers in memory, as a Bloom filter and an exact set. Validating a token which
+was not revoked only costs a probe of the filter, and only its rare false positives are checked against the exact
+set. The mirror is refreshed incrementally, at most every ``twitcher.revocation_refresh_interval`` seconds, with the
+revocations recorded since the previous refresh, and reloaded every ``twitcher.revocation_reload_interval`` seconds
+to forget the tokens which have expired since. Tokens revoked by another worker are thus rejected after at most
+the refresh interval.
+"""
+import datetime
+import hashlib
+import math
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Iterable, Optional
+
+import jwt
+import sqlalchemy as sa
+from oauthlib.oauth2 import RequestValidator
+from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid.response import Response
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from twitcher import models
+from twitcher.introspection import OAUTH2_INTROSPECTION, authenticate_client
+from twitcher.owsverify import forget_token
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OAUTH2_REVOCATION = 'oauth2_revocation'
+REVOCATION_ENDPOINT = '/oauth/revoke'
+
+# insert constructs of the dialects supporting ON CONFLICT DO NOTHING
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# revocations committed late by concurrent transactions are still found by the next refreshes
+REFRESH_GRACE = datetime.timedelta(seconds=60)
+
+# format of the random tokens issued by oauthlib, which are the only ones buffered by workers
+RANDOM_TOKEN_FORMAT = re.compile(r'[A-Za-z0-9]{30}\Z')
+
+# maximum seconds a revocation waits for the buffers of the other workers to be flushed
+MAX_BUFFER_WAIT = 1.0
+
+
+class BloomFilter(object):
+    """
+    Set of strings without false negatives, and false positives with a probability of ``error_rate``
+    up to ``capacity`` items.
+    """
+
+    def __init__(self, capacity: int = 10000, error_rate: float = 0.001) -> None:
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # double hashing of a single digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class RevocationList(object):
+    """
+    In-memory mirror of the revoked token identifiers, refreshed from the database.
+    """
+
+    def __init__(self,
+                 engine: Engine,
+                 refresh_interval: Number = 5,
+                 reload_interval: Number = 3600,
+                 capacity: int = 10000,
+                 error_rate: float = 0.001,
+                 timer: Callable[[], float] = time.monotonic,
+                 ) -> None:
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.timer = timer
+        self._filter = BloomFilter(capacity, error_rate)
+        self._revoked = set()
+        self._cursor = None  # latest revocation time loaded
+        self._refreshed = None
+        self._reloaded = None
+        self._lock = threading.Lock()
+        self._updating = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'RevocationList':
+        settings = get_settings(container)
+        return cls(
+            models.get_engine(settings),
+            refresh_interval=float(settings.get('twitcher.revocation_refresh_interval', 5)),
+            reload_interval=float(settings.get('twitcher.revocation_reload_interval', 3600)),
+            capacity=int(settings.get('twitcher.revocation_capacity', 10000)),
+            error_rate=float(settings.get('twitcher.revocation_error_rate', 0.001)),
+        )
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def _add(self, token_id: str) -> None:
+        if token_id in self._revoked:
+            return
+        self._revoked.add(token_id)
+        if len(self._revoked) > self._filter.capacity:
+            # rebuild a larger filter to keep its false positive rate
+            bloom = BloomFilter(self._filter.capacity * 2, self.error_rate)
+            for revoked in self._revoked:
+                bloom.add(revoked)
+            self._filter = bloom
+        else:
+            self._filter.add(token_id)
+
+    def refresh(self) -> int:
+        """
+        Loads the revocations recorded since the previous refresh, and returns how many were loaded.
+        """
+        table = models.RevokedToken.__table__
+        query = sa.select([table.c.jti, table.c.revoked])
+        if self._cursor is not None:
+            query = query.where(table.c.revoked >= self._cursor - REFRESH_GRACE)
+        with self.engine.connect() as connection:
+            rows = connection.execute(query).fetchall()
+        with self._lock:
+            for jti, revoked in rows:
+                self._add(jti)
+                if self._cursor is None or revoked > self._cursor:
+                    self._cursor = revoked
+            self._refreshed = self.timer()
+        return len(rows)
+
+    def reload(self) -> int:
+        """
+        Loads all the revocations of unexpired tokens, and returns how many were loaded.
+        """
+        table = models.RevokedToken.__table__
+        now = datetime.datetime.utcnow()
+        query = sa.select([table.c.jti, table.c.revoked]).where(
+            sa.or_(table.c.expires.is_(None), table.c.expires >= now))
+        with self.engine.connect() as connection:
+            rows = connection.execute(query).fetchall()
+        bloom = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+        revoked = set()
+        for jti, _ in rows:
+            revoked.add(jti)
+            bloom.add(jti)
+        with self._lock:
+            self._filter, self._revoked = bloom, revoked
+            self._cursor = max((row[1] for row in rows), default=now)
+            self._refreshed = self._reloaded = self.timer()
+        return len(rows)
+
+    def _update(self) -> None:
+        now = self.timer()
+        if self._reloaded is not None and now - self._reloaded < self.reload_interval:
+            if now - self._refreshed < self.refresh_interval:
+                return
+            update = self.refresh
+        else:
+            update = self.reload
+        if not self._updating.acquire(blocking=False):
+            # updated by another thread
+            return
+        try:
+            update()
+        except Exception as exc:
+            # keep the current mirror until the database is reachable again
+            LOGGER.warning("Could not update the revoked tokens.", exc_info=exc)
+            self._refreshed = now
+            self._reloaded = self._reloaded or now
+        finally:
+            self._updating.release()
+
+    def is_revoked(self, token_id: Optional[str]) -> bool:
+        """
+        Whether the token with the identifier was revoked. Tokens without identifier cannot be revoked.
+        """
+        if not token_id:
+            return False
+        self._update()
+        if token_id not in self._filter:
+            return False
+        return token_id in self._revoked
+
+    def revoke(self, dbsession: Session, token_id: str, expires: Optional[datetime.datetime] = None) -> None:
+        """
+        Records the revocation of the token with the identifier, within the transaction of the session.
+
+        The identifier is added to the mirror once the transaction is committed.
+        """
+        table = models.RevokedToken.__table__
+        values = {'jti': token_id, 'expires': expires, 'revoked': datetime.datetime.utcnow()}
+        insert = UPSERT_INSERTS.get(dbsession.get_bind().dialect.name)
+        if insert is not None:
+            # revocations of the same token committed concurrently are ignored instead of failing
+            dbsession.execute(insert(table).values(**values).on_conflict_do_nothing(index_elements=['jti']))
+        elif dbsession.query(models.RevokedToken).filter(models.RevokedToken.jti == token_id).first() is None:
+            dbsession.execute(table.insert().values(**values))
+
+        def add(session: Session) -> None:
+            with self._lock:
+                self._add(token_id)
+        after_commit(dbsession, add)
+
+
+def after_commit(dbsession: Session, callback: Callable[[Session], None]) -> None:
+    """
+    Calls ``callback`` once the current transaction of the session is committed, and never if it is rolled back.
+    """
+    state = {'done': False}
+
+    def committed(session: Session) -> None:
+        if not state['done']:
+            state['done'] = True
+            callback(session)
+
+    def rolled_back(session: Session) -> None:
+        state['done'] = True
+    sa.event.listen(dbsession, 'after_commit', committed, once=True)
+    sa.event.listen(dbsession, 'after_rollback', rolled_back, once=True)
+
+
+def validate_token(request: Request, validator: RequestValidator, token: str) -> Optional[SimpleNamespace]:
+    """
+    Claims of the token if it is valid.
+
+    Errors other than invalid tokens, such as an unavailable database, are raised.
+    """
+    validation = SimpleNamespace(dbsession=request.dbsession, client=None, scopes=[], token_expires=None,
+                                 token_id=None)
+    try:
+        valid = validator.validate_bearer_token(token, None, validation)
+    except jwt.InvalidTokenError as exc:
+        LOGGER.debug("Token validation failed.", exc_info=exc)
+        valid = False
+    return validation if valid else None
+
+
+def revoke_token(request: Request, validator: RequestValidator, token: str, client_id: str) -> bool:
+    """
+    Revokes the token if it is valid and was issued to the client, and returns whether it is now unusable.
+
+    When issued tokens are buffered (see :class:`twitcher.tokenstore.TokenBuffer`), unknown tokens with the format
+    of issued ones are validated again once the buffers of the other workers were flushed, since they could have
+    been issued by one of them. The wait is bounded by ``MAX_BUFFER_WAIT`` seconds.
+    """
+    token_buffer = getattr(validator, 'token_buffer', None)
+    validation = validate_token(request, validator, token)
+    if validation is None and token_buffer is not None and RANDOM_TOKEN_FORMAT.match(token):
+        time.sleep(min(2 * token_buffer.flush_ms / 1000.0, MAX_BUFFER_WAIT))
+        validation = validate_token(request, validator, token)
+        if validation is None:
+            LOGGER.info("Unknown token of client [%s] considered invalid, unless still buffered by a worker "
+                        "which cannot write it to the database.", client_id)
+    if validation is None:
+        # invalid, expired or already revoked
+        return True
+    if getattr(validation.client, 'client_id', None) != client_id:
+        return False
+    if token_buffer is not None and token_buffer.get(token) is not None:
+        # written first, so that it is never written back from the journal once deleted
+        token_buffer.flush()
+    stored = request.dbsession.query(models.Token).filter(models.Token.access_token == token)
+    if stored.delete(synchronize_session=False) == 0:
+        revocation = request.registry[OAUTH2_REVOCATION]
+        expires = None
+        if validation.token_expires is not None:
+            expires = datetime.datetime.utcfromtimestamp(validation.token_expires)
+        if validation.token_id:
+            revocation.revoke(request.dbsession, validation.token_id, expires)
+        else:
+            LOGGER.warning("Token of client [%s] without identifier cannot be revoked.", client_id)
+            return False
+    introspection = request.registry.get(OAUTH2_INTROSPECTION)
+    if introspection is not None:
+        introspection.forget(token)
+    # decisions cached in the meantime would be taken again with the token until it is deleted
+    after_commit(request.dbsession, lambda session: forget_token(request.registry, token))
+    return True
+
+
+def revoke_token_view(request: Request) -> Response:
+    """
+    Revokes the posted ``token`` of an authenticated client application.
+    """
+    from twitcher.oauth2 import OAUTH2_VALIDATOR
+
+    validator = request.registry[OAUTH2_VALIDATOR]
+    client_id = authenticate_client(request, validator)
+    if client_id is None:
+        response = Response(status=401, json={'error': 'invalid_client'}, request=request)
+        response.headers['WWW-Authenticate'] = 'Basic realm="Twitcher"'
+        return response
+    token = request.POST.get('token')
+    if not token:
+        return Response(status=400, json={'error': 'invalid_request'}, request=request)
+    try:
+        revoked = revoke_token(request, validator, token, client_id)
+    except Exception as exc:
+        # the client must consider that the token is still valid
+        LOGGER.warning("Token revocation failed.", exc_info=exc)
+        return Response(status=503, json={'error': 'temporarily_unavailable'}, request=request)
+    if not revoked:
+        return Response(status=403, json={'error': 'unauthorized_client'}, request=request)
+    return Response(status=200, request=request)
+
+
+def includeme(config: Configurator) -> None:
+    from twitcher.oauth2 import OAUTH2_VALIDATOR
+
+    revocation = RevocationList.from_settings(config)
+    config.registry[OAUTH2_REVOCATION] = revocation
+    config.registry[OAUTH2_VALIDATOR].revocation = revocation
+    config.add_route('revoke', REVOCATION_ENDPOINT, request_method='POST')
+    config.add_view(revoke_token_view, route_name='revoke')
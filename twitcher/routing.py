@@ -0,0 +1,146 @@
+"""
+Routing of WPS ``Execute`` requests to dedicated backends according to their process identifier.
+
+A service can define ``routes`` sending the execution of selected processes to other backend URLs than its main
+``url``, such that heavy processes do not share capacity with lightweight ones. Several URLs can be routed for
+the same identifier to form a pool, amongst which the URL with the fewest requests in progress is selected.
+Each routed URL can limit the number of concurrent executions it receives from the worker (``max_concurrent``).
+Once all URLs of a route are saturated, requests wait for a free slot up to ``twitcher.ows_proxy_route_timeout``
+seconds and are otherwise rejected.
+
+Routes of a service are compiled into a table indexed by process identifier, so that finding the route
+of a request is a single lookup whatever the number of routes.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from twitcher.models.service import ServiceConfig
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+OWS_PROXY_ROUTER = 'owsproxy_router'
+
+
+class Route(object):
+    """
+    Backend URLs, and their concurrency limit, dedicated to a process of the service.
+    """
+
+    def __init__(self, service: str, identifier: str) -> None:
+        self.service = service
+        self.identifier = identifier
+        self.limits = {}  # type: Dict[str, Optional[int]]
+
+    @property
+    def urls(self) -> List[str]:
+        return list(self.limits)
+
+
+class RouteTable(object):
+    """
+    Routes of a service compiled into a table indexed by process identifier.
+    """
+
+    def __init__(self, service: ServiceConfig) -> None:
+        self.key = self.routes_key(service)
+        self.routes = {}  # type: Dict[str, Route]
+        for identifier, url, max_concurrent in self.key:
+            route = self.routes.get(identifier)
+            if route is None:
+                route = self.routes[identifier] = Route(service['name'], identifier)
+            route.limits[url] = max_concurrent
+
+    @staticmethod
+    def routes_key(service: ServiceConfig) -> Tuple[Tuple[str, str, Optional[int]], ...]:
+        return tuple((route['identifier'], route['url'], route.get('max_concurrent'))
+                     for route in service.get('routes') or [])
+
+    def get(self, identifier: Optional[str]) -> Optional[Route]:
+        if not identifier:
+            return None
+        return self.routes.get(identifier)
+
+
+class ProcessRouter(object):
+    """
+    Compiles the routes of services and limits the concurrent requests to routed URLs within the worker.
+
+    :param timeout: seconds to wait for a free slot when all URLs of a route are saturated.
+    """
+
+    def __init__(self, timeout: Number = 0) -> None:
+        self.timeout = timeout
+        self._tables = {}  # type: Dict[str, RouteTable]
+        self._active = {}  # type: Dict[Tuple[str, str, str], int]
+        self._rejected = {}  # type: Dict[Tuple[str, str], int]
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'ProcessRouter':
+        settings = get_settings(container)
+        return cls(timeout=float(settings.get('twitcher.ows_proxy_route_timeout', 0)))
+
+    def table(self, service: ServiceConfig) -> RouteTable:
+        """
+        Compiled routes of the service, compiled again only when they changed.
+        """
+        table = self._tables.get(service['name'])
+        if table is None or table.key != RouteTable.routes_key(service):
+            table = self._tables[service['name']] = RouteTable(service)
+        return table
+
+    def route(self, service: ServiceConfig, identifier: Optional[str]) -> Optional[Route]:
+        """
+        Route of the process identifier, if any is defined by the service.
+        """
+        if not service.get('routes'):
+            return None
+        return self.table(service).get(identifier)
+
+    def _available(self, route: Route) -> List[Tuple[int, str]]:
+        available = []
+        for url, limit in route.limits.items():
+            active = self._active.get((route.service, route.identifier, url), 0)
+            if limit is None or active < limit:
+                available.append((active, url))
+        return available
+
+    def acquire(self, route: Route, timeout: Optional[Number] = None) -> Optional[str]:
+        """
+        Selects the URL of the route with the fewest requests in progress amongst those having a free slot,
+        and takes that slot. Returns ``None`` if no slot was freed before the timeout.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            available = self._available(route)
+            if not available and timeout > 0:
+                self._released.wait_for(lambda: self._available(route), timeout)
+                available = self._available(route)
+            if not available:
+                key = (route.service, route.identifier)
+                self._rejected[key] = self._rejected.get(key, 0) + 1
+                return None
+            url = min(available)[1]
+            key = (route.service, route.identifier, url)
+            self._active[key] = self._active.get(key, 0) + 1
+            return url
+
+    def release(self, route: Route, url: str) -> None:
+        with self._lock:
+            key = (route.service, route.identifier, url)
+            self._active[key] = max(self._active.get(key, 0) - 1, 0)
+            self._released.notify_all()
+
+    def json(self) -> Dict[str, Dict[str, Dict]]:
+        with self._lock:
+            body = {}
+            for name, table in self._tables.items():
+                body[name] = {
+                    identifier: {
+                        'active': {url: self._active.get((name, identifier, url), 0) for url in route.limits},
+                        'rejected': self._rejected.get((name, identifier), 0),
+                    }
+                    for identifier, route in table.routes.items()
+                }
+            return body
@@ -0,0 +1,33 @@
+import argparse
+import sys
+
+from pyramid.paster import bootstrap, setup_logging
+
+from twitcher.models import get_engine
+from twitcher.tokenstore import purge_expired_tokens
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Delete expired access tokens from the database.")
+    parser.add_argument(
+        'config_uri',
+        help='Configuration file, e.g., development.ini',
+    )
+    parser.add_argument(
+        '--batch-size', type=int, default=None,
+        help='Number of tokens deleted per transaction (default: twitcher.token_purge_batch_size or 1000).',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    setup_logging(args.config_uri)
+    env = bootstrap(args.config_uri)
+    try:
+        settings = env['registry'].settings
+        batch_size = args.batch_size or int(settings.get('twitcher.token_purge_batch_size', 1000))
+        deleted = purge_expired_tokens(get_engine(settings), batch_size=batch_size)
+        print("Deleted {} expired tokens.".format(deleted))
+    finally:
+        env['closer']()
@@ -47,6 +47,12 @@ register
    Adds OWS service to the registry to be used by the OWS proxy.
 unregister
    Removes OWS service from the registry.
+add-endpoint
+   Adds an upstream endpoint replicating an OWS service.
+remove-endpoint
+   Removes an upstream endpoint of an OWS service.
+hash-password
+   Hashes a password for the configuration of administrators.
 
 Add an OAuth2 client application
 --------------------------------
@@ -98,6 +104,12 @@ Register a local WPS service using an OAuth access token:
 You can use the ``--name`` option to provide a name (used by the OWS proxy).
 Otherwise a nice name will be generated.
 
+Replicas of the service can be added with the ``--endpoint`` option, or later on:
+
+.. code-block:: console
+
+   $ twitcherctl -k --username demo --password demo add-endpoint tiny_buzzard http://localhost:5001/wps
+
 List registered services
 ------------------------
 
@@ -108,6 +120,17 @@ The ``list`` command shows the registered OWS services:
    $ twitcherctl -k --username demo --password demo list
    [{'url': 'http://localhost:5000/wps', 'type': 'wps', 'name': 'tiny_buzzard', 'auth': 'token'}]
 
+Hash an administrator password
+------------------------------
+
+Passwords of administrators (``twitcher.password`` and ``twitcher.users``) can be configured hashed:
+
+.. code-block:: console
+
+   $ twitcherctl hash-password --scheme scrypt
+   Password:
+   scrypt$16384$8$1$...
+
 """
 
 import sys
@@ -117,12 +140,28 @@ import argparse
 
 from twitcher.client import TwitcherService
 from twitcher.namesgenerator import get_random_name
+from twitcher.passwords import PASSWORD_SCHEMES, SCRYPT, hash_password
 
 import logging
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.WARN)
 LOGGER = logging.getLogger("TWITCHER")
 
 
+def parse_route(value):
+    """
+    Parses a route given as ``IDENTIFIER=URL[@MAX_CONCURRENT]``.
+    """
+    identifier, sep, url = value.partition('=')
+    if not identifier or not url:
+        raise argparse.ArgumentTypeError("Route must be given as IDENTIFIER=URL[@MAX_CONCURRENT]: {}".format(value))
+    route = {'identifier': identifier, 'url': url}
+    head, sep, tail = url.rpartition('@')
+    if sep and tail.isdigit():
+        route['url'] = head
+        route['max_concurrent'] = int(tail)
+    return route
+
+
 class TwitcherCtl(object):
     """
     Command line to interact with the OAuth and OpenAPI interface of the ``twitcher`` service.
@@ -199,11 +238,41 @@ class TwitcherCtl(object):
                                help="Authentication method (token, cert, public). Default: token.")
         subparser.add_argument('--verify', default='true',
                                help="Verify SSL service certificate (true, false). Default: true.")
+        subparser.add_argument('--endpoint', action='append', dest='endpoints',
+                               help="Additional upstream endpoint URL replicating the service. Can be repeated.")
+        subparser.add_argument('--offload', default='false',
+                               help="Offload proxied requests to the front-end web server (true, false). "
+                                    "Default: false.")
+        subparser.add_argument('--chunk-size', type=int, dest='chunk_size',
+                               help="Size in bytes of the relayed response chunks. Default: configured one.")
+        subparser.add_argument('--route', type=parse_route, action='append', dest='routes',
+                               metavar='IDENTIFIER=URL[@MAX_CONCURRENT]',
+                               help="Sends executions of the WPS process to a dedicated backend URL, "
+                                    "optionally limiting its concurrent requests. Can be repeated.")
 
         # unregister
         subparser = subparsers.add_parser('unregister', help="Removes OWS service from the registry.")
         subparser.add_argument('name', help="Service name.")
 
+        # add-endpoint
+        subparser = subparsers.add_parser('add-endpoint', help="Adds an upstream endpoint replicating an OWS service.")
+        subparser.add_argument('name', help="Service name.")
+        subparser.add_argument('url', help="Endpoint url.")
+
+        # remove-endpoint
+        subparser = subparsers.add_parser('remove-endpoint', help="Removes an upstream endpoint of an OWS service.")
+        subparser.add_argument('name', help="Service name.")
+        subparser.add_argument('url', help="Endpoint url.")
+
+        # administration
+        # --------------
+
+        # hash-password
+        subparser = subparsers.add_parser('hash-password',
+                                          help="Hashes a password for the configuration of administrators.")
+        subparser.add_argument('--scheme', default=SCRYPT, choices=PASSWORD_SCHEMES,
+                               help="Hashing scheme. Default: scrypt.")
+
         return parser
 
     def run(self, args):
@@ -216,6 +285,10 @@ class TwitcherCtl(object):
             urllib3.disable_warnings()
             LOGGER.warning('disabled certificate verification!')
 
+        if args.cmd == 'hash-password':
+            password = args.password or getpass.getpass(prompt='Password: ')
+            return hash_password(password, args.scheme)
+
         username = password = None
         if args.cmd != 'gentoken':
             username = args.username
@@ -239,7 +312,14 @@ class TwitcherCtl(object):
                 data = {'type': args.type,
                         'purl': args.purl,
                         'auth': args.auth,
-                        'verify': args.verify}
+                        'verify': args.verify,
+                        'offload': args.offload}
+                if args.endpoints:
+                    data['endpoints'] = args.endpoints
+                if args.chunk_size:
+                    data['chunk_size'] = args.chunk_size
+                if args.routes:
+                    data['routes'] = args.routes
                 return service.register_service(
                     name=args.name or get_random_name(),
                     url=args.url,
@@ -247,6 +327,10 @@ class TwitcherCtl(object):
                 )
             elif args.cmd == 'unregister':
                 return service.unregister_service(name=args.name)
+            elif args.cmd == 'add-endpoint':
+                return service.add_service_endpoint(name=args.name, url=args.url)
+            elif args.cmd == 'remove-endpoint':
+                return service.remove_service_endpoint(name=args.name, url=args.url)
             elif args.cmd == 'clear':
                 return service.clear_services()
             elif args.cmd == 'add':
@@ -0,0 +1,177 @@
+"""
+Spatial extents of OWS requests and indexed regions of the access policy.
+
+Bounding boxes of requests (WMS ``bbox`` parameter, WPS bounding box inputs) are normalized to longitude/latitude
+(``CRS:84``) from the supported coordinate reference systems:
+
+* ``CRS:84`` and its URN/URL forms, always in longitude/latitude order.
+* ``EPSG:4326`` and its URN/URL forms, in latitude/longitude order for WMS 1.3.0 and URN/URL forms,
+  and in longitude/latitude order otherwise.
+* ``EPSG:3857`` (and its aliases), projected back to longitude/latitude.
+
+Regions of the policy are indexed in a uniform grid of ``cell_size`` degrees, where each region is registered
+in every cell it overlaps. Finding a region containing a bounding box only inspects the cell of its lower corner,
+and finding a region intersecting it only inspects the cells it overlaps (or every region when fewer),
+so that the cost of a decision does not depend on the number of regions.
+"""
+import math
+from typing import Iterable, Optional, Sequence, Tuple, Union
+
+BBox = Tuple[float, float, float, float]
+
+WORLD = (-180.0, -90.0, 180.0, 90.0)  # type: BBox
+
+LONLAT = 'CRS:84'
+EPSG_4326 = 'EPSG:4326'
+EPSG_3857 = 'EPSG:3857'
+
+CRS_ALIASES = {
+    'CRS:84': LONLAT,
+    'CRS84': LONLAT,
+    'OGC:CRS84': LONLAT,
+    'EPSG:4326': EPSG_4326,
+    'EPSG:3857': EPSG_3857,
+    'EPSG:900913': EPSG_3857,
+    'EPSG:102100': EPSG_3857,
+    'EPSG:102113': EPSG_3857,
+}
+
+EARTH_RADIUS = 6378137.0
+
+
+def normalize_crs(crs: Optional[str]) -> Tuple[str, bool]:
+    """
+    Normalized name of the coordinate reference system, and whether its URN/URL form was used.
+
+    :raises ValueError: if the coordinate reference system is not supported.
+    """
+    value = (crs or LONLAT).strip().upper()
+    uri = value.startswith('URN:') or value.startswith('HTTP')
+    if uri:
+        # urn:ogc:def:crs:EPSG::4326, urn:ogc:def:crs:OGC:1.3:CRS84, http://www.opengis.net/def/crs/EPSG/0/4326
+        parts = [part for part in value.replace('/', ':').split(':') if part]
+        authority = 'OGC' if 'OGC' in parts and parts[-1].startswith('CRS') else 'EPSG'
+        value = '{}:{}'.format(authority, parts[-1]) if authority == 'EPSG' else parts[-1]
+    normalized = CRS_ALIASES.get(value)
+    if normalized is None:
+        raise ValueError("Coordinate reference system is not supported: {}".format(crs))
+    return normalized, uri
+
+
+def mercator_to_lonlat(x: float, y: float) -> Tuple[float, float]:
+    lon = math.degrees(x / EARTH_RADIUS)
+    lat = math.degrees(2 * math.atan(math.exp(y / EARTH_RADIUS)) - math.pi / 2)
+    return lon, lat
+
+
+def parse_bbox(value: Union[str, Sequence], crs: Optional[str] = None, latlon: Optional[bool] = None) -> BBox:
+    """
+    Bounding box ``minx,miny,maxx,maxy`` in the coordinate reference system, normalized to longitude/latitude.
+
+    :param latlon: whether ``EPSG:4326`` coordinates are in latitude/longitude order,
+        by default only for its URN/URL forms.
+    :raises ValueError: if the bounding box is invalid or its coordinate reference system is not supported.
+    """
+    if isinstance(value, str):
+        value = value.replace(' ', ',').split(',')
+    values = [float(coordinate) for coordinate in value if str(coordinate).strip()]
+    if len(values) != 4 or any(math.isnan(coordinate) for coordinate in values):
+        raise ValueError("Invalid bounding box: {}".format(value))
+    crs, uri = normalize_crs(crs)
+    minx, miny, maxx, maxy = values
+    if crs == EPSG_4326 and (uri if latlon is None else latlon):
+        minx, miny, maxx, maxy = miny, minx, maxy, maxx
+    elif crs == EPSG_3857:
+        minx, miny = mercator_to_lonlat(minx, miny)
+        maxx, maxy = mercator_to_lonlat(maxx, maxy)
+    if minx > maxx or miny > maxy:
+        raise ValueError("Invalid bounding box: {}".format(value))
+    return minx, miny, maxx, maxy
+
+
+def contains(outer: BBox, inner: BBox) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def intersects(first: BBox, second: BBox) -> bool:
+    return first[0] <= second[2] and second[0] <= first[2] and first[1] <= second[3] and second[1] <= first[3]
+
+
+class GridIndex(object):
+    """
+    Regions indexed in a uniform grid of ``cell_size`` degrees.
+    """
+
+    def __init__(self, cell_size: float = 5.0) -> None:
+        self.cell_size = cell_size
+        self.cells = {}  # regions overlapping each cell
+        self.regions = []
+
+    def __len__(self) -> int:
+        return len(self.regions)
+
+    def _span(self, bbox: BBox) -> Tuple[range, range]:
+        size = self.cell_size
+        minx, miny, maxx, maxy = (max(bbox[0], WORLD[0]), max(bbox[1], WORLD[1]),
+                                  min(bbox[2], WORLD[2]), min(bbox[3], WORLD[3]))
+        return (range(math.floor(minx / size), math.floor(maxx / size) + 1),
+                range(math.floor(miny / size), math.floor(maxy / size) + 1))
+
+    def insert(self, bbox: BBox) -> None:
+        self.regions.append(bbox)
+        columns, rows = self._span(bbox)
+        for column in columns:
+            for row in rows:
+                self.cells.setdefault((column, row), []).append(bbox)
+
+    def containing(self, bbox: BBox) -> bool:
+        """
+        Whether a region contains the bounding box.
+        """
+        size = self.cell_size
+        x, y = min(max(bbox[0], WORLD[0]), WORLD[2]), min(max(bbox[1], WORLD[1]), WORLD[3])
+        for region in self.cells.get((math.floor(x / size), math.floor(y / size)), ()):
+            if contains(region, bbox):
+                return True
+        return False
+
+    def intersecting(self, bbox: BBox) -> bool:
+        """
+        Whether a region intersects the bounding box.
+        """
+        columns, rows = self._span(bbox)
+        if len(columns) * len(rows) > len(self.regions):
+            return any(intersects(region, bbox) for region in self.regions)
+        for column in columns:
+            for row in rows:
+                for region in self.cells.get((column, row), ()):
+                    if intersects(region, bbox):
+                        return True
+        return False
+
+
+class RegionIndex(object):
+    """
+    Regions allowed and denied to a subject.
+    """
+
+    def __init__(self, cell_size: float = 5.0) -> None:
+        self.allowed = GridIndex(cell_size)
+        self.denied = GridIndex(cell_size)
+
+    def add(self, bbox: BBox, allow: bool = True) -> None:
+        (self.allowed if allow else self.denied).insert(bbox)
+
+
+def extent_allowed(indexes: Iterable[RegionIndex], bboxes: Iterable[BBox], restricted: bool) -> bool:
+    """
+    Whether no bounding box intersects a denied region, and, if ``restricted``,
+    every bounding box is contained in an allowed region.
+    """
+    indexes = list(indexes)
+    for bbox in bboxes:
+        if any(index.denied.intersecting(bbox) for index in indexes if index.denied):
+            return False
+        if restricted and not any(index.allowed.containing(bbox) for index in indexes if index.allowed):
+            return False
+    return True
@@ -0,0 +1,217 @@
+"""
+Spooling of proxied responses, similar to the ``proxy_buffering`` of `nginx`.
+
+The upstream response is drained as fast as possible into a buffer held in memory, which is spilled to a temporary
+file once it grows past a threshold. The upstream connection is released back to its pool as soon as the response
+is drained, and the client is then served from the spool at its own pace.
+
+Ceilings apply to the total memory and disk used by all concurrent spools of the worker. When the memory ceiling
+is reached, new content is spilled to disk. When the disk ceiling is reached, the remaining content is streamed
+directly from the upstream connection, as without spooling.
+
+Fully spooled responses spilled to disk behave as files, so that they can be sent by the ``wsgi.file_wrapper``
+of the WSGI server (e.g. with ``sendfile``).
+"""
+import tempfile
+import threading
+from itertools import chain
+from typing import Dict, Iterator, Optional
+
+from requests.models import Response as RequestsResponse
+
+from twitcher.relay import iter_raw
+from twitcher.typedefs import AnySettingsContainer
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_PROXY_SPOOL = 'owsproxy_spool'
+
+
+class SpoolMetrics(object):
+    """
+    Usage counters of the spools of a worker.
+    """
+
+    def __init__(self, max_memory: int, max_disk: int) -> None:
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.active = 0
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.spooled_total = 0
+        self.spilled_total = 0
+        self.overflow_total = 0
+        self.bytes_total = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, memory: int = 0, disk: int = 0) -> bool:
+        """
+        Reserves the amount of memory or disk bytes if the corresponding ceiling is not exceeded.
+        """
+        with self._lock:
+            if self.memory_bytes + memory > self.max_memory or self.disk_bytes + disk > self.max_disk:
+                return False
+            self.memory_bytes += memory
+            self.disk_bytes += disk
+            return True
+
+    def release(self, memory: int = 0, disk: int = 0) -> None:
+        with self._lock:
+            self.memory_bytes -= memory
+            self.disk_bytes -= disk
+
+    def update(self, **counters: int) -> None:
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def json(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'active': self.active,
+                'memory_bytes': self.memory_bytes,
+                'memory_max_bytes': self.max_memory,
+                'disk_bytes': self.disk_bytes,
+                'disk_max_bytes': self.max_disk,
+                'spooled_total': self.spooled_total,
+                'spilled_total': self.spilled_total,
+                'overflow_total': self.overflow_total,
+                'bytes_total': self.bytes_total,
+            }
+
+
+class SpooledResponse(object):
+    """
+    Iterates over the spooled content of a response, followed by any remaining content streamed from upstream.
+
+    Reserved memory and disk are released once the iteration is closed by the WSGI server.
+    """
+
+    def __init__(self, spool: 'ResponseSpool', fileobj: tempfile.SpooledTemporaryFile,
+                 memory: int, disk: int, upstream: RequestsResponse,
+                 remainder: Optional[Iterator[bytes]] = None, chunk_size: Optional[int] = None) -> None:
+        self.spool = spool
+        self.file = fileobj
+        self.memory = memory
+        self.disk = disk
+        self.upstream = upstream
+        self.remainder = remainder
+        self.chunk_size = chunk_size or spool.chunk_size
+        self.file.seek(0)
+
+    @property
+    def length(self) -> Optional[int]:
+        """Length of the content if it was fully spooled."""
+        if self.remainder is not None:
+            return None
+        return self.memory + self.disk
+
+    @property
+    def spilled(self) -> bool:
+        """Whether the content was fully spooled to a file on disk."""
+        return self.remainder is None and self.disk > 0
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def _iter_file(self) -> Iterator[bytes]:
+        while True:
+            data = self.file.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.remainder is None:
+            return self._iter_file()
+        return chain(self._iter_file(), self.remainder)
+
+    def close(self) -> None:
+        if self.remainder is not None:
+            self.upstream.close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.spool.metrics.release(memory=self.memory, disk=self.disk)
+            self.spool.metrics.update(active=-1)
+
+
+class ResponseSpool(object):
+    """
+    Drains upstream responses into spools bounded by the ceilings shared through its :class:`SpoolMetrics`.
+    """
+
+    def __init__(self,
+                 memory_size: int = 1024 * 1024,
+                 max_memory: int = 64 * 1024 * 1024,
+                 max_disk: int = 1024 * 1024 * 1024,
+                 chunk_size: int = 64 * 1024,
+                 directory: Optional[str] = None,
+                 ) -> None:
+        self.memory_size = memory_size
+        self.chunk_size = chunk_size
+        self.directory = directory
+        self.metrics = SpoolMetrics(max_memory=max_memory, max_disk=max_disk)
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'ResponseSpool':
+        settings = get_settings(container)
+        return cls(
+            memory_size=int(settings.get('twitcher.ows_proxy_spool_memory_size', 1024 * 1024)),
+            max_memory=int(settings.get('twitcher.ows_proxy_spool_max_memory', 64 * 1024 * 1024)),
+            max_disk=int(settings.get('twitcher.ows_proxy_spool_max_disk', 1024 * 1024 * 1024)),
+            directory=settings.get('twitcher.ows_proxy_spool_dir') or None,
+        )
+
+    def spool(self, resp: RequestsResponse, chunk_size: Optional[int] = None) -> SpooledResponse:
+        """
+        Drains the upstream response into a spool and releases its connection if it could be fully drained.
+        """
+        fileobj = tempfile.SpooledTemporaryFile(max_size=self.memory_size, dir=self.directory)
+        memory = disk = 0
+        chunk_size = chunk_size or self.chunk_size
+        content = iter_raw(resp, chunk_size)
+        remainder = None
+        self.metrics.update(active=1, spooled_total=1)
+        try:
+            for data in content:
+                size = len(data)
+                if not disk and memory + size <= self.memory_size and self.metrics.reserve(memory=size):
+                    memory += size
+                    fileobj.write(data)
+                    continue
+                if not self.metrics.reserve(disk=size + (memory if not disk else 0)):
+                    # disk ceiling reached, serve the rest directly from upstream
+                    self.metrics.update(overflow_total=1)
+                    remainder = chain([bytes(data)], (bytes(view) for view in content))
+                    break
+                if not disk:
+                    # spill content held in memory to disk
+                    fileobj.rollover()
+                    self.metrics.release(memory=memory)
+                    self.metrics.update(spilled_total=1)
+                    disk, memory = memory, 0
+                disk += size
+                fileobj.write(data)
+        except Exception:
+            fileobj.close()
+            self.metrics.release(memory=memory, disk=disk)
+            self.metrics.update(active=-1)
+            resp.close()
+            raise
+        self.metrics.update(bytes_total=memory + disk)
+        if remainder is None:
+            resp.close()
+        return SpooledResponse(self, fileobj, memory=memory, disk=disk, upstream=resp, remainder=remainder,
+                               chunk_size=chunk_size)
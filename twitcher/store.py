@@ -28,6 +28,12 @@ class ServiceStore(ServiceStoreInterface):
 
         :param name: A service name string.
         :param url: A URL string.
+        :param endpoints: Optional list of URL strings of additional upstream replicas.
+            Existing endpoints are replaced if provided.
+        :param chunk_size: Optional size in bytes of the relayed response chunks.
+        :param routes: Optional list of routes of process identifiers to dedicated backend URLs,
+            as dictionaries with ``identifier``, ``url`` and optional ``max_concurrent`` keys.
+            Existing routes are replaced if provided.
         """
         try:
             query = self.request.dbsession.query(models.Service)
@@ -39,6 +45,8 @@ class ServiceStore(ServiceStoreInterface):
                 one.purl = kwargs.get('purl', '')
                 one._verify = int(kwargs.get('verify', 1))
                 one.auth = kwargs.get('auth', 'token')
+                one._offload = int(kwargs.get('offload', 0))
+                one.chunk_size = kwargs.get('chunk_size') or None
                 self.request.dbsession.merge(one)
             else:
                 # insert
@@ -48,8 +56,16 @@ class ServiceStore(ServiceStoreInterface):
                     type=kwargs.get('type', 'WPS'),
                     purl=kwargs.get('purl', ''),
                     _verify=int(kwargs.get('verify', 1)),
-                    auth=kwargs.get('auth', 'token'))
+                    auth=kwargs.get('auth', 'token'),
+                    _offload=int(kwargs.get('offload', 0)),
+                    chunk_size=kwargs.get('chunk_size') or None)
                 self.request.dbsession.add(one)
+            if kwargs.get('endpoints') is not None:
+                one.endpoints = [models.ServiceEndpoint(url=baseurl(endpoint)) for endpoint in kwargs['endpoints']]
+            if kwargs.get('routes') is not None:
+                one.routes = [models.ServiceRoute(identifier=route['identifier'], url=baseurl(route['url']),
+                                                  max_concurrent=route.get('max_concurrent') or None)
+                              for route in kwargs['routes']]
         except DBAPIError:
             raise DatabaseError
         if not one:
@@ -113,11 +129,53 @@ class ServiceStore(ServiceStoreInterface):
             raise ServiceNotFound
         return one
 
+    def fetch_by_names(self, names):
+        """
+        Get services for given service ``names`` with a single query.
+
+        :param names: An iterable of service name strings.
+        :return: A list with instances of :class:`twitcher.models.Service`. Unknown names are omitted.
+        """
+        names = list(set(names))
+        if not names:
+            return []
+        try:
+            query = self.request.dbsession.query(models.Service)
+            services = query.filter(models.Service.name.in_(names)).all()
+        except DBAPIError:
+            raise DatabaseError
+        return services
+
+    def add_endpoint(self, name, url):
+        """
+        Adds an upstream replica ``url`` to the service identified by ``name``.
+
+        :return: An instance of :class:`twitcher.models.Service`.
+        """
+        one = self.fetch_by_name(name)
+        url = baseurl(url)
+        if url != one.url and url not in [endpoint.url for endpoint in one.endpoints]:
+            one.endpoints.append(models.ServiceEndpoint(url=url))
+        return one
+
+    def remove_endpoint(self, name, url):
+        """
+        Removes the upstream replica ``url`` from the service identified by ``name``.
+
+        :return: An instance of :class:`twitcher.models.Service`.
+        """
+        one = self.fetch_by_name(name)
+        url = baseurl(url)
+        one.endpoints = [endpoint for endpoint in one.endpoints if endpoint.url != url]
+        return one
+
     def clear_services(self):
         """
         Removes all services.
         """
         try:
+            self.request.dbsession.query(models.ServiceEndpoint).delete()
+            self.request.dbsession.query(models.ServiceRoute).delete()
             self.request.dbsession.query(models.Service).delete()
         except DBAPIError:
             raise DatabaseError
@@ -0,0 +1,446 @@
+"""
+Storage of the access tokens issued by the ``random_token`` validator (see :mod:`twitcher.oauth2`).
+
+Each issued token is stored in the ``token`` table, which is indexed by ``access_token`` for validation
+and by ``expires`` for purging. Expired tokens, and revocations of expired JWT tokens (see :mod:`twitcher.revocation`),
+are deleted in batches of ``twitcher.token_purge_batch_size`` rows,
+each in its own transaction so that the table is never locked for long, either:
+
+* with the ``purge_twitcher_tokens`` command, for example from a cron job,
+* or by each worker in the background, every ``twitcher.token_purge_interval`` seconds.
+
+When ``twitcher.token.reuse`` is enabled, a client requesting a token is given back its latest unexpired token
+for the same set of scopes, as long as it remains valid at least ``twitcher.token.reuse_min_lifetime`` seconds,
+instead of a new one. Scopes are stored sorted, and tokens are indexed by client and expiry, so that the lookup
+does not depend on the number of stored tokens.
+
+When ``twitcher.token_buffer`` is enabled, issued tokens are not inserted by the request issuing them. They are
+valid immediately from an in-memory index of the worker, and are written to the database in batches of multi-row
+inserts by a background thread, every ``twitcher.token_buffer.flush_ms`` milliseconds or as soon as
+``twitcher.token_buffer.flush_size`` tokens are pending, and when the worker exits. Until then, other workers
+do not know the token. Pending tokens survive a crash of the worker depending on ``twitcher.token_buffer.durability``:
+
+``memory``
+    Pending tokens are lost, and their clients have to request new tokens.
+
+``journal``
+    Pending tokens are appended to a journal file of the worker in ``twitcher.token_buffer.journal_dir``,
+    and are written to the database by the next worker starting. They survive a crash of the worker,
+    but not of the host.
+
+``fsync``
+    As ``journal``, but the journal is synchronized to disk before the token is returned.
+"""
+import atexit
+import datetime
+import fcntl
+import glob
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import sqlalchemy as sa
+from pyramid.config import Configurator
+from pyramid.events import NewRequest
+from pyramid.settings import asbool
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from twitcher import models
+from twitcher.typedefs import AnySettingsContainer, Number
+from twitcher.utils import get_settings
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+TOKEN_PURGER = 'token_purger'
+TOKEN_BUFFER = 'token_buffer'
+
+DURABILITY_MEMORY = 'memory'
+DURABILITY_JOURNAL = 'journal'
+DURABILITY_FSYNC = 'fsync'
+DURABILITY_LEVELS = (DURABILITY_MEMORY, DURABILITY_JOURNAL, DURABILITY_FSYNC)
+
+# rows per insert statement, within the limit of bound parameters of SQLite
+INSERT_ROWS = 100
+
+
+def normalize_scope(scopes: Optional[Iterable[str]]) -> Optional[str]:
+    """
+    Stored value of a set of scopes, independent of their order.
+    """
+    return ' '.join(sorted(set(scopes or []))) or None
+
+
+def find_reusable_token(dbsession: Session,
+                        client_id: str,
+                        scopes: Optional[Iterable[str]],
+                        min_expires: datetime.datetime,
+                        ) -> Optional[models.Token]:
+    """
+    Latest token of the client for the same set of scopes, expiring at ``min_expires`` (UTC) or later.
+    """
+    scope = normalize_scope(scopes)
+    query = dbsession.query(models.Token).filter(
+        models.Token.client_id == client_id,
+        models.Token.expires >= min_expires,
+        models.Token.scope == scope if scope else models.Token.scope.is_(None))
+    return query.order_by(models.Token.expires.desc()).first()
+
+
+def delete_expired_tokens(connection: Connection,
+                          now: datetime.datetime,
+                          batch_size: int = 1000,
+                          table: sa.Table = models.Token.__table__,
+                          ) -> int:
+    """
+    Deletes a batch of tokens (or revocations of tokens) expired before ``now`` (UTC),
+    and returns how many were deleted.
+    """
+    query = sa.select([table.c.id]).where(table.c.expires < now).limit(batch_size)
+    ids = [row[0] for row in connection.execute(query)]
+    if ids:
+        connection.execute(table.delete().where(table.c.id.in_(ids)))
+    return len(ids)
+
+
+def purge_expired_tokens(engine: Engine, now: Optional[datetime.datetime] = None, batch_size: int = 1000) -> int:
+    """
+    Deletes all tokens expired before ``now`` (UTC), and the revocations of those which were revoked,
+    one batch per transaction, and returns how many tokens were deleted.
+    """
+    now = now or datetime.datetime.utcnow()
+    total = 0
+    for table in (models.Token.__table__, models.RevokedToken.__table__):
+        while True:
+            with engine.begin() as connection:
+                deleted = delete_expired_tokens(connection, now, batch_size, table)
+            if table is models.Token.__table__:
+                total += deleted
+            if deleted < batch_size:
+                break
+    return total
+
+
+class TokenPurger(object):
+    """
+    Purges expired tokens periodically in a background thread.
+    """
+
+    def __init__(self, engine: Engine, interval: Number = 3600, batch_size: int = 1000) -> None:
+        self.engine = engine
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'TokenPurger':
+        settings = get_settings(container)
+        return cls(
+            models.get_engine(settings),
+            interval=float(settings.get('twitcher.token_purge_interval', 0)),
+            batch_size=int(settings.get('twitcher.token_purge_batch_size', 1000)),
+        )
+
+    def purge(self) -> int:
+        deleted = purge_expired_tokens(self.engine, batch_size=self.batch_size)
+        if deleted:
+            LOGGER.info("Purged %s expired tokens.", deleted)
+        return deleted
+
+    def run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.purge()
+            except Exception as exc:
+                LOGGER.warning("Purge of expired tokens failed.", exc_info=exc)
+
+    def start(self) -> None:
+        """
+        Starts the background thread, once per process in case the application was forked after its creation.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='twitcher-token-purge', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def token_row(token: models.Token) -> Dict:
+    return {column.key: getattr(token, column.key) for column in models.Token.__table__.columns if column.key != 'id'}
+
+
+def insert_tokens(connection: Connection, rows: List[Dict]) -> int:
+    """
+    Inserts the tokens with multi-row inserts, except those already stored, and returns how many were inserted.
+    """
+    table = models.Token.__table__
+    inserted = 0
+    for start in range(0, len(rows), INSERT_ROWS):
+        chunk = rows[start:start + INSERT_ROWS]
+        access_tokens = [row['access_token'] for row in chunk]
+        query = sa.select([table.c.access_token]).where(table.c.access_token.in_(access_tokens))
+        stored = {row[0] for row in connection.execute(query)}
+        chunk = [row for row in chunk if row['access_token'] not in stored]
+        if chunk:
+            connection.execute(table.insert().values(chunk))
+            inserted += len(chunk)
+    return inserted
+
+
+def _dump_row(row: Dict) -> str:
+    expires = row.get('expires')
+    return json.dumps(dict(row, expires=expires.isoformat() if expires is not None else None))
+
+
+def _load_row(line: str) -> Dict:
+    row = json.loads(line)
+    if row.get('expires') is not None:
+        row['expires'] = datetime.datetime.fromisoformat(row['expires'])
+    return row
+
+
+class TokenBuffer(object):
+    """
+    Write-behind buffer of the issued tokens, which are valid from memory until written to the database in batches.
+    """
+
+    def __init__(self,
+                 engine: Engine,
+                 flush_ms: Number = 50,
+                 flush_size: int = 100,
+                 durability: str = DURABILITY_MEMORY,
+                 journal_dir: Optional[str] = None,
+                 ) -> None:
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError("Unknown durability level: {}".format(durability))
+        if durability != DURABILITY_MEMORY and not journal_dir:
+            raise ValueError("A journal directory is required with durability level: {}".format(durability))
+        self.engine = engine
+        self.flush_ms = flush_ms
+        self.flush_size = flush_size
+        self.durability = durability
+        self.journal_dir = journal_dir
+        self._pending = OrderedDict()  # type: Dict[str, models.Token]
+        self._journal = None
+        self._segments = []  # closed journal segments of the pending tokens
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'TokenBuffer':
+        settings = get_settings(container)
+        return cls(
+            models.get_engine(settings),
+            flush_ms=float(settings.get('twitcher.token_buffer.flush_ms', 50)),
+            flush_size=int(settings.get('twitcher.token_buffer.flush_size', 100)),
+            durability=str(settings.get('twitcher.token_buffer.durability', DURABILITY_MEMORY)).lower(),
+            journal_dir=settings.get('twitcher.token_buffer.journal_dir') or None,
+        )
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, token: models.Token) -> None:
+        """
+        Makes the token valid immediately, and schedules its insertion.
+        """
+        self.start()
+        with self._lock:
+            self._pending[token.access_token] = token
+            if self._journal is not None:
+                self._journal.write(_dump_row(token_row(token)) + '\n')
+                self._journal.flush()
+                if self.durability == DURABILITY_FSYNC:
+                    os.fsync(self._journal.fileno())
+            full = len(self._pending) >= self.flush_size
+        if full:
+            self._wakeup.set()
+
+    def get(self, access_token: str) -> Optional[models.Token]:
+        return self._pending.get(access_token)
+
+    def find_reusable_token(self,
+                            client_id: str,
+                            scopes: Optional[Iterable[str]],
+                            min_expires: datetime.datetime,
+                            ) -> Optional[models.Token]:
+        """
+        Latest pending token of the client for the same set of scopes, expiring at ``min_expires`` (UTC) or later.
+        """
+        scope = normalize_scope(scopes)
+        with self._lock:
+            tokens = list(self._pending.values())
+        for token in reversed(tokens):
+            if token.client_id == client_id and token.scope == scope and token.expires >= min_expires:
+                return token
+        return None
+
+    def flush(self) -> int:
+        """
+        Writes the pending tokens to the database, and returns how many were written.
+
+        Tokens remain pending if the database cannot be reached.
+        """
+        with self._flush_lock:
+            with self._lock:
+                tokens = list(self._pending.values())
+                if self._journal is not None and tokens:
+                    # tokens added from now on go to a new segment
+                    self._segments.append(self._journal.name)
+                    self._journal.close()
+                    self._journal = self._open_segment()
+                segments = list(self._segments)
+            if not tokens:
+                return 0
+            with self.engine.begin() as connection:
+                insert_tokens(connection, [token_row(token) for token in tokens])
+            with self._lock:
+                for token in tokens:
+                    if self._pending.get(token.access_token) is token:
+                        del self._pending[token.access_token]
+                self._segments = [segment for segment in self._segments if segment not in segments]
+            for segment in segments:
+                self._remove(segment)
+            return len(tokens)
+
+    def replay(self) -> int:
+        """
+        Writes the tokens of the journals left by workers which did not exit cleanly, and returns how many were
+        written. Journals still in use by their worker are locked, and skipped.
+        """
+        if self.journal_dir is None:
+            return 0
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, 'tokens-*.journal'))):
+            try:
+                journal = open(path, 'r')
+            except FileNotFoundError:
+                continue
+            with journal:
+                try:
+                    fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                rows = []
+                for line in journal:
+                    try:
+                        rows.append(_load_row(line))
+                    except ValueError:
+                        # last line of a worker interrupted while writing it
+                        continue
+                with self.engine.begin() as connection:
+                    replayed += insert_tokens(connection, rows)
+            self._remove(path)
+        if replayed:
+            LOGGER.info("Replayed %s tokens from the journals of the token buffer.", replayed)
+        return replayed
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_ms / 1000.0)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as exc:
+                LOGGER.warning("Write of buffered tokens failed.", exc_info=exc)
+
+    def start(self) -> None:
+        """
+        Starts the background thread, once per process in case the application was forked after its creation.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending.clear()
+            self._segments = []
+            if self.journal_dir is not None:
+                os.makedirs(self.journal_dir, exist_ok=True)
+                try:
+                    self.replay()
+                except Exception as exc:
+                    LOGGER.warning("Replay of the journals of the token buffer failed.", exc_info=exc)
+                self._journal = self._open_segment()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, name='twitcher-token-buffer', daemon=True)
+            self._thread.start()
+
+    def close(self) -> None:
+        """
+        Stops the background thread and writes the pending tokens.
+        """
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            self.flush()
+        except Exception as exc:
+            LOGGER.error("Write of %s buffered tokens failed on exit.", len(self._pending), exc_info=exc)
+            return
+        if self._journal is not None:
+            self._journal.close()
+            self._remove(self._journal.name)
+            self._journal = None
+        self._pid = None
+
+    def _open_segment(self):
+        path = os.path.join(self.journal_dir, 'tokens-{}-{}.journal'.format(os.getpid(), uuid.uuid4().hex))
+        journal = open(path, 'a')
+        fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+        return journal
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def includeme(config: Configurator) -> None:
+    from twitcher.oauth2 import OAUTH2_VALIDATOR, RandomTokenValidator
+
+    settings = get_settings(config)
+    workers = []
+    if float(settings.get('twitcher.token_purge_interval', 0)) > 0:
+        config.registry[TOKEN_PURGER] = TokenPurger.from_settings(settings)
+        workers.append(config.registry[TOKEN_PURGER])
+    validator = config.registry.get(OAUTH2_VALIDATOR)
+    if asbool(settings.get('twitcher.token_buffer', False)) and isinstance(validator, RandomTokenValidator):
+        buffer = TokenBuffer.from_settings(settings)
+        config.registry[TOKEN_BUFFER] = buffer
+        validator.token_buffer = buffer
+        atexit.register(buffer.close)
+        workers.append(buffer)
+    if not workers:
+        return
+
+    def start_token_workers(event: NewRequest) -> None:
+        for worker in workers:
+            worker.start()
+    config.add_subscriber(start_token_workers, NewRequest)
@@ -0,0 +1,211 @@
+"""
+Transport of the requests sent to upstream services.
+
+When any transport option is enabled, proxied requests are sent with a :class:`requests.Session` shared by the
+worker instead of the module-level :func:`requests.request`. Its connection pools create connections with the
+configured options, such as resolving hosts with the :class:`twitcher.dnscache.DNSCache`.
+
+Services co-located with Twitcher can be registered with an URL referring to their Unix domain socket,
+such as ``http+unix:///var/run/emu.sock/wps``. Requests to them are sent over pooled Unix socket connections.
+"""
+import socket
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Callable, Dict, Optional, Type
+from urllib import parse as urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+
+from twitcher.dnscache import DNSCache
+from twitcher.utils import UNIX_SOCKET_SCHEME, is_unix_socket_url, split_unix_socket_url
+
+import logging
+LOGGER = logging.getLogger('TWITCHER')
+
+OWS_PROXY_SESSION = 'owsproxy_session'
+
+
+class ResolvingConnectionMixin(object):
+    """
+    Connection resolving its host with a :class:`DNSCache` instead of calling ``getaddrinfo`` each time.
+    """
+    dns_cache = None  # type: DNSCache
+
+    def _new_conn(self) -> socket.socket:
+        try:
+            sock = self.dns_cache.create_connection(
+                (self._dns_host, self.port),
+                self.timeout,
+                source_address=self.source_address,
+                socket_options=self.socket_options,
+            )
+        except socket.gaierror as exc:
+            raise NameResolutionError(self.host, self, exc) from exc
+        except socket.timeout as exc:
+            raise ConnectTimeoutError(
+                self, "Connection to {} timed out. (connect timeout={})".format(self.host, self.timeout)) from exc
+        except OSError as exc:
+            raise NewConnectionError(self, "Failed to establish a new connection: {}".format(exc)) from exc
+        return sock
+
+
+def resolving_pool_classes(dns_cache: DNSCache) -> Dict[str, Type[HTTPConnectionPool]]:
+    """
+    Connection pool classes creating their connections with the given DNS cache.
+    """
+    attrs = {'dns_cache': dns_cache}
+    http_conn = type('ResolvingHTTPConnection', (ResolvingConnectionMixin, HTTPConnection), attrs)
+    https_conn = type('ResolvingHTTPSConnection', (ResolvingConnectionMixin, HTTPSConnection), attrs)
+    return {
+        'http': type('ResolvingHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_conn}),
+        'https': type('ResolvingHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_conn}),
+    }
+
+
+class UpstreamAdapter(HTTPAdapter):
+    """
+    Transport adapter applying the configured connection options to its connection pools.
+    """
+
+    def __init__(self, dns_cache: Optional[DNSCache] = None, **kwargs) -> None:
+        # set before the parent initializes the pool manager
+        self.dns_cache = dns_cache
+        super(UpstreamAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super(UpstreamAdapter, self).init_poolmanager(*args, **kwargs)
+        if self.dns_cache is not None:
+            self.poolmanager.pool_classes_by_scheme = resolving_pool_classes(self.dns_cache)
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    HTTP connection over a Unix domain socket.
+    """
+
+    def __init__(self, socket_path: str, **kwargs) -> None:
+        self.socket_path = socket_path
+        super(UnixHTTPConnection, self).__init__('localhost', **kwargs)
+
+    def _new_conn(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except socket.timeout as exc:
+            sock.close()
+            raise ConnectTimeoutError(
+                self, "Connection to {} timed out. (connect timeout={})".format(self.socket_path, self.timeout)
+            ) from exc
+        except OSError as exc:
+            sock.close()
+            raise NewConnectionError(self, "Failed to establish a new connection: {}".format(exc)) from exc
+        return sock
+
+
+class UnixHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = UnixHTTPConnection
+
+    def __init__(self, socket_path: str, **kwargs) -> None:
+        self.socket_path = socket_path
+        super(UnixHTTPConnectionPool, self).__init__('localhost', **kwargs)
+
+    def _new_conn(self) -> UnixHTTPConnection:
+        self.num_connections += 1
+        return self.ConnectionCls(self.socket_path, timeout=self.timeout.connect_timeout, **self.conn_kw)
+
+
+class UnixSocketAdapter(HTTPAdapter):
+    """
+    Transport adapter sending ``http+unix`` requests over a connection pool per Unix domain socket.
+
+    The socket path is expected percent-encoded as host of the URL (see :func:`requests_url`).
+    """
+
+    def __init__(self, pool_maxsize: int = 10, **kwargs) -> None:
+        self._unix_pools = {}  # type: Dict[str, UnixHTTPConnectionPool]
+        self._unix_lock = threading.Lock()
+        super(UnixSocketAdapter, self).__init__(pool_maxsize=pool_maxsize, **kwargs)
+
+    def _unix_pool(self, url: str) -> UnixHTTPConnectionPool:
+        socket_path, _ = split_unix_socket_url(url)
+        with self._unix_lock:
+            pool = self._unix_pools.get(socket_path)
+            if pool is None:
+                pool = self._unix_pools[socket_path] = UnixHTTPConnectionPool(
+                    socket_path, maxsize=self._pool_maxsize, block=self._pool_block)
+            return pool
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._unix_pool(request.url)
+
+    def get_connection(self, url, proxies=None):
+        return self._unix_pool(url)
+
+    def request_url(self, request, proxies):
+        return split_unix_socket_url(request.url)[1]
+
+    def close(self) -> None:
+        super(UnixSocketAdapter, self).close()
+        with self._unix_lock:
+            for pool in self._unix_pools.values():
+                pool.close()
+            self._unix_pools.clear()
+
+
+def requests_url(url: str) -> str:
+    """
+    Converts an ``http+unix`` URL to the form accepted by :mod:`requests`, with the socket path encoded as host.
+    """
+    socket_path, path = split_unix_socket_url(url)
+    return '{}://{}{}'.format(UNIX_SOCKET_SCHEME, urlparse.quote(socket_path, safe=''), path)
+
+
+def upstream_session(dns_cache: Optional[DNSCache] = None, pool_maxsize: int = 10) -> requests.Session:
+    """
+    Session for requests to upstream services, shared by all requests of the worker.
+
+    Cookies set by upstream services are never stored, since the session is shared between users.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = UpstreamAdapter(dns_cache=dns_cache, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.mount(UNIX_SOCKET_SCHEME + '://', UnixSocketAdapter(pool_maxsize=pool_maxsize))
+    return session
+
+
+_unix_session = None  # type: Optional[requests.Session]
+_unix_session_lock = threading.Lock()
+
+
+def unix_session() -> requests.Session:
+    """
+    Session for requests to Unix domain sockets when no upstream session is configured.
+    """
+    global _unix_session
+    with _unix_session_lock:
+        if _unix_session is None:
+            _unix_session = upstream_session()
+        return _unix_session
+
+
+def upstream_send(registry=None) -> Callable[..., requests.Response]:
+    """
+    Function to send requests to upstream services, with the same signature as :func:`requests.request`.
+    """
+    session = registry.get(OWS_PROXY_SESSION) if registry is not None else None
+
+    def send(method: str, url: str, **kwargs) -> requests.Response:
+        if is_unix_socket_url(url):
+            return (session or unix_session()).request(method=method, url=requests_url(url), **kwargs)
+        if session is None:
+            return requests.request(method=method, url=url, **kwargs)
+        return session.request(method=method, url=url, **kwargs)
+    return send
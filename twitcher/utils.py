@@ -8,7 +8,7 @@ import json
 import time
 import pytz
 import re
-from typing import AnyStr, Optional
+from typing import AnyStr, Optional, Tuple
 
 from twitcher.exceptions import ServiceNotFound
 from twitcher.typedefs import AnySettingsContainer, SettingsType
@@ -16,6 +16,8 @@ from twitcher.typedefs import AnySettingsContainer, SettingsType
 import logging
 LOGGER = logging.getLogger("TWITCHER")
 
+UNIX_SOCKET_SCHEME = 'http+unix'
+
 
 def get_settings(container: AnySettingsContainer) -> Optional[SettingsType]:
     """
@@ -67,7 +69,7 @@ def parse_service_name(url: str, protected_path: str) -> Optional[str]:
         parts_without_protected_path = parsed_url.path[len(protected_path)::].strip('/').split('/')
         # use ranges to avoid index error in case the path parts list is empty
         # the expected part must be exactly the first one after the protected path, then followed by the service name
-        if any(part in parts_without_protected_path[:1] for part in ['proxy', 'verify']):
+        if any(part in parts_without_protected_path[:1] for part in ['proxy', 'verify', 'auth']):
             parts_without_protected_path = parts_without_protected_path[1:]
         if len(parts_without_protected_path) > 0:
             service_name = parts_without_protected_path[0]
@@ -105,11 +107,44 @@ def localize_datetime(dt, tz_name='UTC'):
     return tz_aware_dt
 
 
+def is_unix_socket_url(url):
+    return isinstance(url, str) and url.lower().startswith(UNIX_SOCKET_SCHEME + '://')
+
+
+def split_unix_socket_url(url: str) -> Tuple[str, str]:
+    """
+    Splits an URL of a service listening on a Unix domain socket into the socket path and the HTTP path with query.
+
+    The socket path is either given directly, ending with the first path element with a ``.sock`` or ``.socket``
+    suffix (``http+unix:///var/run/emu.sock/wps``), or percent-encoded as host
+    (``http+unix://%2Fvar%2Frun%2Femu.sock/wps``).
+    """
+    parsed_url = urlparse.urlparse(url)
+    if parsed_url.scheme != UNIX_SOCKET_SCHEME:
+        raise ValueError('bad url')
+    if parsed_url.netloc:
+        socket_path, path = urlparse.unquote(parsed_url.netloc), parsed_url.path
+    else:
+        elements = parsed_url.path.split('/')
+        index = next((i for i, el in enumerate(elements) if el.endswith(('.sock', '.socket'))), None)
+        if index is None:
+            raise ValueError('bad url')
+        socket_path, path = '/'.join(elements[:index + 1]), '/' + '/'.join(elements[index + 1:])
+    if not socket_path.startswith('/'):
+        raise ValueError('bad url')
+    if parsed_url.query:
+        path += '?' + parsed_url.query
+    return socket_path, path or '/'
+
+
 def baseurl(url):
     """
     return baseurl of given url
     """
     parsed_url = urlparse.urlparse(url)
+    if parsed_url.scheme == UNIX_SOCKET_SCHEME:
+        split_unix_socket_url(url)
+        return "%s://%s%s" % (parsed_url.scheme, parsed_url.netloc, parsed_url.path.strip())
     if not parsed_url.netloc or parsed_url.scheme not in ("http", "https"):
         raise ValueError('bad url')
     service_url = "%s://%s%s" % (parsed_url.scheme, parsed_url.netloc, parsed_url.path.strip())
@@ -132,11 +167,13 @@ def lxml_strip_ns(tree):
             node.tag = node.tag.split('}', 1)[1]
 
 
-def replace_caps_url(xml, url, prev_url=None):
+def replace_caps_url(xml, url, prev_url=None, limits=None):
+    from twitcher.xmlparser import parse_xml
+
     ns = {
         'ows': 'http://www.opengis.net/ows/1.1',
         'xlink': 'http://www.w3.org/1999/xlink'}
-    doc = etree.fromstring(xml)
+    doc = parse_xml(xml, limits)
     # wms 1.1.1 onlineResource
     if 'WMT_MS_Capabilities' in doc.tag:
         LOGGER.debug("replace proxy urls in wms 1.1.1")
@@ -0,0 +1,172 @@
+"""
+Hardened XML parsing of documents received from clients and upstream services.
+
+Parsers never resolve entities, load external DTDs or access the network. Documents are fed to the parser in chunks
+while their size, nesting depth and number of elements are counted, so that parsing of a document exceeding any of
+the configured limits is aborted as soon as it is detected, before it is fully read:
+
+* ``twitcher.xml_max_size``: maximum number of bytes parsed (default 10 MiB).
+* ``twitcher.xml_max_depth``: maximum nesting depth of elements (default 64).
+* ``twitcher.xml_max_elements``: maximum number of elements (default 100000).
+"""
+import threading
+from typing import Callable, Optional
+
+import lxml.etree
+
+from twitcher.typedefs import AnySettingsContainer
+from twitcher.utils import get_settings
+
+XML_LIMITS = 'xml_limits'
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+PARSER_OPTIONS = dict(
+    resolve_entities=False,
+    no_network=True,
+    load_dtd=False,
+    huge_tree=False,
+)
+
+
+class XMLLimitExceeded(ValueError):
+    """
+    Raised when a parsed document exceeds one of the limits.
+    """
+
+
+class XMLLimits(object):
+    def __init__(self, max_size: int = 10 * 1024 * 1024, max_depth: int = 64, max_elements: int = 100000) -> None:
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.max_elements = max_elements
+
+    @classmethod
+    def from_settings(cls, container: AnySettingsContainer) -> 'XMLLimits':
+        settings = get_settings(container)
+        return cls(
+            max_size=int(settings.get('twitcher.xml_max_size', 10 * 1024 * 1024)),
+            max_depth=int(settings.get('twitcher.xml_max_depth', 64)),
+            max_elements=int(settings.get('twitcher.xml_max_elements', 100000)),
+        )
+
+
+def get_xml_limits(request) -> XMLLimits:
+    """
+    Limits configured for the application, or the default ones when not configured.
+    """
+    registry = getattr(request, 'registry', None)
+    limits = registry.get(XML_LIMITS) if registry is not None else None
+    return limits or XMLLimits()
+
+
+def pull_parser() -> lxml.etree.XMLPullParser:
+    return lxml.etree.XMLPullParser(events=('start', 'end'), **PARSER_OPTIONS)
+
+
+class XMLReader(object):
+    """
+    Feeds a document to a pull parser in chunks, enforcing the limits on the parsed part of the document.
+
+    :raises lxml.etree.XMLSyntaxError: if the document is not well-formed.
+    :raises XMLLimitExceeded: if the document exceeds one of the limits.
+    """
+
+    def __init__(self,
+                 data: bytes,
+                 limits: Optional[XMLLimits] = None,
+                 parser: Optional[lxml.etree.XMLPullParser] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 ) -> None:
+        self.data = data
+        self.limits = limits or XMLLimits()
+        self.parser = parser if parser is not None else pull_parser()
+        self.chunk_size = chunk_size
+        self.consumed = 0  # bytes of the document fed to the parser
+        self.depth = 0
+        self.elements = 0
+
+    def pull(self, found: Optional[Callable[[str, lxml.etree._Element], bool]] = None
+             ) -> Optional[lxml.etree._Element]:
+        """
+        Parses the document until an event matching ``found`` occurs and returns its element,
+        or until the end of the document and returns ``None``.
+        """
+        limits = self.limits
+        while True:
+            for event, element in self.parser.read_events():
+                if event == 'start':
+                    self.depth += 1
+                    self.elements += 1
+                    if self.depth > limits.max_depth:
+                        raise XMLLimitExceeded("XML document is nested deeper than {} elements".format(
+                            limits.max_depth))
+                    if self.elements > limits.max_elements:
+                        raise XMLLimitExceeded("XML document has more than {} elements".format(
+                            limits.max_elements))
+                else:
+                    self.depth -= 1
+                if found is not None and found(event, element):
+                    return element
+            if self.consumed >= len(self.data):
+                return None
+            if self.consumed >= limits.max_size:
+                raise XMLLimitExceeded("XML document is larger than {} bytes".format(limits.max_size))
+            size = min(self.chunk_size, limits.max_size - self.consumed)
+            self.parser.feed(self.data[self.consumed:self.consumed + size])
+            self.consumed = min(self.consumed + size, len(self.data))
+
+    def close(self) -> lxml.etree._Element:
+        """
+        Parses the rest of the document and returns its root element.
+        """
+        self.pull()
+        root = self.parser.close()
+        self.pull()  # events flushed when closing
+        return root
+
+
+_local = threading.local()
+
+
+def acquire_parser() -> lxml.etree.XMLPullParser:
+    """
+    Takes the pull parser of the current thread until it is given back with :func:`release_parser`,
+    or creates a new one while it is taken.
+    """
+    parser = getattr(_local, 'parser', None)
+    _local.parser = None
+    return parser if parser is not None else pull_parser()
+
+
+def release_parser(parser: lxml.etree.XMLPullParser, reset: bool = False) -> None:
+    """
+    Gives the parser back to the current thread, to be reused by the next documents parsed in the thread.
+
+    Parsers which stopped in the middle of a document must be ``reset``.
+    """
+    if reset:
+        try:
+            parser.close()
+        except lxml.etree.XMLSyntaxError:
+            pass
+        for _ in parser.read_events():
+            pass
+    _local.parser = parser
+
+
+def parse_xml(data: bytes, limits: Optional[XMLLimits] = None) -> lxml.etree._Element:
+    """
+    Parses the whole document with the pull parser of the current thread.
+
+    The parser is reused by the next documents parsed in the thread, unless parsing fails.
+    """
+    # taken while in use, and only given back once the document is successfully parsed
+    parser = acquire_parser()
+    root = XMLReader(data, limits, parser).close()
+    release_parser(parser)
+    return root
+
+
+def includeme(config):
+    config.registry[XML_LIMITS] = XMLLimits.from_settings(config)